@@ -0,0 +1,224 @@
+import re
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Line of the benchmark PRE prompts listing the labels an agent may answer (hate label first)
+LABELS_PATTERN = re.compile(r"^Labels: (.+)$", re.MULTILINE)
+# Last prompt of the judge (see src/utils/debate_prompt.json)
+JUDGE_MARKER = "output your decision in the following JSON format"
+# Round-2 prompts ask the debaters to agree or rebut
+REBUT_MARKER = "agree or rebut"
+
+WORDS = ["표현", "맥락", "집단", "비하", "의도", "풍자", "댓글", "감정", "사실", "일반화", "조롱", "비판"]
+
+def parse_args():
+    # CLI argument parser for the stand-in OpenAI server
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat and embedding endpoints, for offline benchmarks",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (0 picks a free one)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean seconds per chat completion")
+    parser.add_argument("--embedding_latency", type=float, default=0.05, help="Mean seconds per embedding request")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency varies uniformly by this fraction around the mean")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--rate_limit_share", type=float, default=0.5, help="Share of the errors that are 429 rate limits (the rest are 500)")
+    parser.add_argument("--dimension", type=int, default=256, help="Embedding dimension")
+    parser.add_argument("--hate_ratio", type=float, default=0.5, help="Fraction of texts the PRE agents and the judge call hateful")
+    parser.add_argument("--agreement", type=float, default=0.8, help="Probability that a PRE agent follows the majority answer of its text")
+    parser.add_argument("--concession_rate", type=float, default=0.1, help="Probability that a debater concedes in a rebuttal round")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the canned answers and embeddings")
+    return parser.parse_args()
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.5, embedding_latency: float = 0.05, jitter: float = 0.5,
+                 error_rate: float = 0.0, rate_limit_share: float = 0.5, dimension: int = 256,
+                 hate_ratio: float = 0.5, agreement: float = 0.8, concession_rate: float = 0.1, seed: int = 0) -> None:
+        """Canned answers for the requests PREDICT sends to OpenAI
+
+        Answers are deterministic functions of the request content, so repeated runs
+        see the same labels and the same embeddings:
+          - PRE agents (prompts with a "Labels: hate | not hate" line): {"Label", "Reason"} JSON
+          - the judge: {"Label": "hate" or "Non-hate", "Reason"} JSON
+          - debaters: one-sentence arguments, sometimes opening with "I agree" in rebuttals
+          - embeddings: unit vectors seeded by the input
+
+        Args:
+            latency (float): mean seconds per chat completion
+            embedding_latency (float): mean seconds per embedding request
+            jitter (float): latency varies uniformly by this fraction around the mean
+            error_rate (float): fraction of requests answered with an error
+            rate_limit_share (float): share of the errors that are 429 (the rest are 500)
+            dimension (int): embedding dimension
+            hate_ratio (float): fraction of texts called hateful
+            agreement (float): probability that a PRE agent follows the majority answer of its text
+            concession_rate (float): probability that a debater concedes in a rebuttal round
+            seed (int): seed of the canned answers and embeddings
+        """
+        self.latency = latency
+        self.embedding_latency = embedding_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_share = rate_limit_share
+        self.dimension = dimension
+        self.hate_ratio = hate_ratio
+        self.agreement = agreement
+        self.concession_rate = concession_rate
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"chat": 0, "embeddings": 0, "embedded_inputs": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def draw(self, *parts) -> float:
+        """Uniform [0, 1) value determined by the parts"""
+        digest = hashlib.sha256("\0".join([str(self.seed), *map(str, parts)]).encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def wait(self, mean: float):
+        with self.lock:
+            factor = 1 + self.jitter * (2 * self.random.random() - 1)
+        time.sleep(max(mean * factor, 0))
+
+    def fail(self):
+        """Return (status, body) of an injected error, or None"""
+        with self.lock:
+            if self.random.random() >= self.error_rate:
+                return None
+            rate_limited = self.random.random() < self.rate_limit_share
+        self.count("errors")
+        if rate_limited:
+            return 429, {"error": {"message": "Rate limit reached (injected by the benchmark server)", "type": "requests", "code": "rate_limit_exceeded"}}
+        return 500, {"error": {"message": "The server had an error (injected by the benchmark server)", "type": "server_error", "code": None}}
+
+    def answer(self, messages: "list[dict]") -> str:
+        prompt = "\n".join(str(message.get("content", "")) for message in messages)
+        last = str(messages[-1].get("content", "")) if messages else ""
+        labels = LABELS_PATTERN.search(prompt)
+        if labels:
+            hate, not_hate = [label.strip() for label in labels.group(1).split("|")][:2]
+            text = last
+            hateful = self.draw("text", text) < self.hate_ratio
+            if self.draw("agent", prompt) >= self.agreement:
+                hateful = not hateful
+            label = hate if hateful else not_hate
+            return json.dumps({"Label": label, "Reason": f"The references suggest the text is {label.lower()}."}, ensure_ascii=False)
+        if JUDGE_MARKER in last:
+            label = "hate" if self.draw("text", last) < self.hate_ratio else "Non-hate"
+            return json.dumps({"Label": label, "Reason": "One side gave the more specific argument."})
+        if REBUT_MARKER in last and self.draw("concede", prompt) < self.concession_rate:
+            return "I agree with the other side's argument."
+        words = [WORDS[int(self.draw("word", prompt, i) * len(WORDS))] for i in range(8)]
+        return f"The text is judged by its {' '.join(words)}."
+
+    def chat(self, request: dict):
+        self.count("chat")
+        self.wait(self.latency)
+        error = self.fail()
+        if error:
+            return error
+        content = self.answer(request.get("messages", []))
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in request.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        self.count("prompt_tokens", prompt_tokens)
+        self.count("completion_tokens", completion_tokens)
+        return 200, {
+            "id": f"chatcmpl-bench-{self.stats['chat']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "logprobs": None, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def embed(self, value) -> np.ndarray:
+        # Inputs are strings or token id lists (langchain's OpenAIEmbeddings sends tokens)
+        digest = hashlib.sha256(json.dumps(value, ensure_ascii=False).encode("utf-8")).digest()
+        vector = np.random.default_rng([self.seed, *digest]).standard_normal(self.dimension).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def embeddings(self, request: dict):
+        inputs = request.get("input", [])
+        # A single string or a single token list is one input
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        self.count("embeddings")
+        self.count("embedded_inputs", len(inputs))
+        self.wait(self.embedding_latency)
+        error = self.fail()
+        if error:
+            return error
+        data = []
+        for i, value in enumerate(inputs):
+            vector = self.embed(value)
+            encoded = base64.b64encode(vector.tobytes()).decode("ascii") if request.get("encoding_format") == "base64" else vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": encoded})
+        tokens = sum(len(value) if isinstance(value, list) else len(value) // 4 for value in inputs)
+        return 200, {"object": "list", "data": data, "model": request.get("model", ""),
+                     "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+def make_handler(fake: FakeOpenAI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status: int, body: dict):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                self.reply(200, fake.snapshot())
+            else:
+                self.reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.endswith("/chat/completions"):
+                self.reply(*fake.chat(request))
+            elif self.path.endswith("/embeddings"):
+                self.reply(*fake.embeddings(request))
+            else:
+                self.reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def log_message(self, format, *args):
+            # One line per request would drown the benchmark output
+            pass
+
+    return Handler
+
+def start_server(fake: FakeOpenAI, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve `fake` on a background thread; the base URL is http://<host>:<server.server_port>/v1"""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    args = parse_args()
+    fake = FakeOpenAI(latency=args.latency, embedding_latency=args.embedding_latency, jitter=args.jitter,
+                      error_rate=args.error_rate, rate_limit_share=args.rate_limit_share, dimension=args.dimension,
+                      hate_ratio=args.hate_ratio, agreement=args.agreement, concession_rate=args.concession_rate, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    server.daemon_threads = True
+    print(f"Fake OpenAI server on http://{args.host}:{server.server_port}/v1 (set OPENAI_BASE_URL to it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(fake.snapshot()))
@@ -0,0 +1,76 @@
+import os
+import random
+import argparse
+import pandas as pd
+
+# Vocabulary of the synthetic comments, in the register of the Dataset/*/*_sample.csv texts
+SUBJECTS = ["이 영화", "그 정치인", "요즘 애들", "우리 동네", "이번 경기", "저 유튜버", "댓글 단 사람", "그 회사", "이 기사", "옆집 사람",
+            "국회의원들", "기자", "감독", "선수들", "학생들", "이 식당", "그 가수", "팬들", "관리자", "운영진"]
+OPINIONS = ["진짜 별로다", "생각보다 괜찮네", "좀 너무한 것 같다", "왜 이러는지 모르겠다", "이해가 안 간다", "정말 고맙다",
+            "한심하다", "최악이다", "대단하다", "응원합니다", "다시는 안 본다", "기분 나쁘다", "웃기네", "말이 안 된다", "수고 많았어요"]
+INSULTS = ["머리가 비었나", "수준 떨어진다", "꺼져라", "다 똑같은 놈들", "쓰레기 같다", "역겹다", "상종을 말아야지", "노답이다"]
+ADVERBS = ["", "", "솔직히", "진짜", "그냥", "요즘", "또", "완전", "역시", "갑자기", "아무리 봐도", "오늘도"]
+# Syllables of the nicknames and names that make the comments distinct
+SYLLABLES = "김이박최정강조윤장임민서지현우준영수진하은도예주성경태호연아"
+TAILS = ["", "", ".", "..", "!", "ㅋㅋ", "ㅋㅋㅋ", "ㅎㅎ", "ㅠㅠ", "?", "~", " 진짜", " ㄹㅇ"]
+# Labels of the samples: 혐오 (hateful) / 비혐오 (not hateful)
+LABELS = ("혐오", "비혐오")
+
+def parse_args():
+    # CLI argument parser for the synthetic benchmark datasets
+    parser = argparse.ArgumentParser(description="Write a synthetic Korean dataset shaped like Dataset/*/*_sample.csv",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-o", "--output", required=True, help="CSV to write (text,label)")
+    parser.add_argument("-n", "--rows", type=int, default=10000, help="Number of rows")
+    parser.add_argument("--hate_ratio", type=float, default=0.5, help="Fraction of rows labeled 혐오")
+    parser.add_argument("--duplicate_ratio", type=float, default=0.05, help="Fraction of rows repeating an earlier text, as scraped comments do")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--chunksize", type=int, default=100000, help="Rows generated and written at a time")
+    return parser.parse_args()
+
+def make_text(rng: random.Random, hateful: bool) -> str:
+    """One comment of one to four sentences (mostly 10 to 100 characters, like the samples)"""
+    sentences = []
+    for _ in range(rng.choice((1, 2, 2, 3, 3, 4))):
+        opinion = rng.choice(INSULTS) if hateful and rng.random() < 0.7 else rng.choice(OPINIONS)
+        subject = rng.choice(SUBJECTS)
+        if rng.random() < 0.4:
+            subject = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))) + rng.choice(("", "씨", "님", "이"))
+        parts = [subject, rng.choice(ADVERBS), opinion]
+        sentences.append(" ".join(part for part in parts if part) + rng.choice(TAILS))
+    return " ".join(sentences)
+
+def generate_rows(rows: int, hate_ratio: float = 0.5, duplicate_ratio: float = 0.05, seed: int = 0, chunksize: int = 100000):
+    """Yield DataFrames of `chunksize` rows with the columns text and label"""
+    rng = random.Random(seed)
+    # Earlier texts that later rows may repeat
+    recent = []
+    for start in range(0, rows, chunksize):
+        texts, labels = [], []
+        for _ in range(min(chunksize, rows - start)):
+            if recent and rng.random() < duplicate_ratio:
+                text, label = rng.choice(recent)
+            else:
+                hateful = rng.random() < hate_ratio
+                text, label = make_text(rng, hateful), LABELS[0] if hateful else LABELS[1]
+                if len(recent) < 10000:
+                    recent.append((text, label))
+                else:
+                    recent[rng.randrange(len(recent))] = (text, label)
+            texts.append(text)
+            labels.append(label)
+        yield pd.DataFrame({"text": texts, "label": labels})
+
+def write_dataset(output_path: str, rows: int, hate_ratio: float = 0.5, duplicate_ratio: float = 0.05, seed: int = 0, chunksize: int = 100000):
+    """Write the dataset chunk by chunk, so a million rows never sit in memory at once"""
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    for i, chunk in enumerate(generate_rows(rows, hate_ratio, duplicate_ratio, seed, chunksize)):
+        chunk.to_csv(output_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    return output_path
+
+if __name__ == "__main__":
+    args = parse_args()
+    write_dataset(args.output, args.rows, hate_ratio=args.hate_ratio, duplicate_ratio=args.duplicate_ratio,
+                  seed=args.seed, chunksize=args.chunksize)
+    print(f"Wrote {args.rows} rows to {args.output}")
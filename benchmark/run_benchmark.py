@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from langchain_core.prompts import ChatPromptTemplate
+from src.utils.prompt_registry import PromptRegistry
+from src.utils.openai_utils import support_models, TOKENIZERS
+from main_pre_to_dict import load_criteria
+from benchmark.fake_openai_server import FakeOpenAI, start_server
+from benchmark.make_dataset import write_dataset
+
+# Names the benchmark gives its dataset, database and output directory inside the work directory
+DATA_NAME = "bench"
+EVALUATION_DATA = "BENCH"
+PHASES = ("pre", "pre_to_dict", "dict", "pipeline")
+
+# PRE prompt of every benchmark agent; the fake server answers with one of the listed labels
+PRE_PROMPT = """You are {agent}, an annotator of Korean hate speech.
+Reference:
+{{context}}
+Labels: {hate} | {not_hate}
+Answer in JSON: {{{{"Label": "<one of the labels>", "Reason": "<one sentence>"}}}}"""
+
+def parse_args():
+    # CLI argument parser for the offline benchmark
+    parser = argparse.ArgumentParser(description="Measure PREDICT throughput against a local stand-in for the OpenAI API",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-n", "--rows", type=int, default=10000, help="Rows of the synthetic evaluation dataset")
+    parser.add_argument("--database_rows", type=int, default=2000, help="Rows of the synthetic FAISS database")
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=["pre", "pre_to_dict", "dict"], help="Phases to run, in order")
+    parser.add_argument("--workdir", default=os.path.join(REPO_ROOT, "benchmark", "work"), help="Directory for the datasets, indexes, outputs and logs")
+    parser.add_argument("--pre_concurrency", type=int, default=16, help="main_pre.py -c")
+    parser.add_argument("--dict_workers", type=int, default=16, help="main_dict.py -w")
+    parser.add_argument("--pre_args", default="", help="Extra arguments of main_pre.py (e.g. \"--telemetry pre.jsonl\")")
+    parser.add_argument("--dict_args", default="", help="Extra arguments of main_dict.py (e.g. \"--agreement-threshold 4\")")
+    parser.add_argument("--pipeline_args", default="", help="Extra arguments of main_pipeline.py")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean seconds per chat completion")
+    parser.add_argument("--embedding_latency", type=float, default=0.05, help="Mean seconds per embedding request")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency varies uniformly by this fraction around the mean")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with a 429 or 500 error")
+    parser.add_argument("--rpm", type=int, default=None, help="Requests per minute allowed by the rate limiter (default: the limits in support_models)")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens per minute allowed by the rate limiter (default: the limits in support_models)")
+    parser.add_argument("--tokenizer", choices=TOKENIZERS, default="approximate",
+                        help="Token counter of the phases; tiktoken downloads its encoding unless TIKTOKEN_CACHE_DIR already holds it")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the datasets and the canned answers")
+    parser.add_argument("-o", "--output", default=None, help="JSON file for the results (default: <workdir>/results.json)")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Slowdown or extra calls per row (fraction) reported as a regression")
+    return parser.parse_args()
+
+def write_prompts(prompt_dir, criteria):
+    """Store a local prompt per agent, read by main_pre.py --offline_prompts"""
+    registry = PromptRegistry(prompt_dir=prompt_dir, offline=True)
+    specs = []
+    for agent, labels in criteria.items():
+        prompt_name = f"{DATA_NAME}/{agent.lower()}"
+        template = PRE_PROMPT.format(agent=agent, hate=labels["hate"][0], not_hate=labels["not_hate"][0])
+        registry.save_local(prompt_name, ChatPromptTemplate.from_messages([("system", template), ("human", "{text}")]))
+        specs.append(f"{agent}={prompt_name}@{DATA_NAME}")
+    return specs
+
+def phase_command(phase, agent_specs, args):
+    """Command line of a phase, relative to the work directory"""
+    dataset = f"Dataset/{DATA_NAME}/{DATA_NAME}_sample.csv"
+    output = f"output/Dataset_{EVALUATION_DATA}"
+    if phase == "pre":
+        return ["main_pre.py", "-i", dataset, "-o", f"{output}/PRE", "--agents", *agent_specs,
+                "--prompt_dir", "prompts", "--offline_prompts", "-c", str(args.pre_concurrency), *args.pre_args.split()]
+    if phase == "pre_to_dict":
+        return ["main_pre_to_dict.py", "-d", DATA_NAME, "-e", EVALUATION_DATA]
+    if phase == "dict":
+        return ["main_dict.py", "-i", f"{output}/PRE_to_DICT/reference.csv", "-o", f"{output}/DICT",
+                "-w", str(args.dict_workers), *args.dict_args.split()]
+    return ["main_pipeline.py", "-i", dataset, "-o", f"{output}_PIPELINE", "--agents", *agent_specs,
+            "--prompt_dir", "prompts", "--offline_prompts", "--pre_workers", str(args.pre_concurrency),
+            "--dict_workers", str(args.dict_workers), *args.pipeline_args.split()]
+
+def run_phase(name, command, workdir, env):
+    """Run one script of the repository in the work directory
+
+    Returns:
+        tuple[float, float]: wall-clock seconds and peak resident memory in MB (None where wait4 is unavailable)
+    """
+    os.makedirs(os.path.join(workdir, "logs"), exist_ok=True)
+    log_path = os.path.join(workdir, "logs", f"{name}.log")
+    with open(log_path, "w", encoding="utf-8") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, command[0]), *command[1:]],
+                                   cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            # ru_maxrss of this child alone (kilobytes on Linux)
+            _, status, usage = os.wait4(process.pid, 0)
+            returncode, peak_mb = os.waitstatus_to_exitcode(status), usage.ru_maxrss / 1024
+        else:
+            returncode, peak_mb = process.wait(), None
+        seconds = time.perf_counter() - start
+    if returncode != 0:
+        raise SystemExit(f"{name} exited with status {returncode}; see {log_path}")
+    return seconds, peak_mb
+
+def compare(results, baseline, tolerance):
+    """Print the change against a baseline and return the phases that regressed"""
+    regressions = []
+    for phase, result in results["phases"].items():
+        before = baseline.get("phases", {}).get(phase)
+        if before is None:
+            continue
+        speed = result["rows_per_sec"] / before["rows_per_sec"] - 1 if before["rows_per_sec"] else 0.0
+        calls = result["calls_per_row"] - before["calls_per_row"]
+        print(f"{phase}: {speed:+.1%} rows/sec, {calls:+.2f} calls per row against the baseline")
+        if speed < -tolerance or calls > tolerance * max(before["calls_per_row"], 1):
+            regressions.append(phase)
+    return regressions
+
+def main():
+    args = parse_args()
+    workdir = os.path.abspath(args.workdir)
+    shutil.rmtree(os.path.join(workdir, "output"), ignore_errors=True)
+    os.makedirs(workdir, exist_ok=True)
+
+    fake = FakeOpenAI(latency=args.latency, embedding_latency=args.embedding_latency, jitter=args.jitter,
+                      error_rate=args.error_rate, seed=args.seed)
+    server = start_server(fake)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    env = dict(os.environ, OPENAI_API_KEY="sk-benchmark", OPENAI_API_KEYS="", OPENAI_BASE_URL=base_url, OPENAI_API_BASE=base_url,
+               LANGCHAIN_TRACING_V2="false", PYTHONUNBUFFERED="1", PREDICT_TOKENIZER=args.tokenizer)
+    if args.rpm or args.tpm:
+        # Benchmark another usage tier; the token bucket otherwise caps the debates long before the code does
+        env["PREDICT_RATE_LIMITS"] = json.dumps({model: {"rpm": args.rpm or limit["rpm"], "tpm": args.tpm or limit["tpm"]}
+                                                 for model, limit in support_models.items()})
+
+    # Setup (not measured): datasets, prompts and the FAISS database
+    write_dataset(os.path.join(workdir, "Dataset", DATA_NAME, f"{DATA_NAME}_sample.csv"), args.rows, seed=args.seed)
+    database_csv = os.path.join(workdir, "Dataset", DATA_NAME, f"{DATA_NAME}_database.csv")
+    write_dataset(database_csv, args.database_rows, seed=args.seed + 1)
+    agent_specs = write_prompts(os.path.join(workdir, "prompts"), load_criteria())
+    shutil.rmtree(os.path.join(workdir, "faiss"), ignore_errors=True)
+    seconds, _ = run_phase("setup", ["build_faiss_index.py", "-i", database_csv, "-d", DATA_NAME], workdir, env)
+    print(f"Setup: {args.rows} rows, a {args.database_rows}-row database built in {seconds:.1f}s, fake OpenAI server on {base_url}")
+
+    results = {"rows": args.rows, "settings": {name: value for name, value in vars(args).items() if name not in ("output", "baseline")}, "phases": {}}
+    print(f"{'phase':<13}{'seconds':>9}{'rows/sec':>10}{'peak MB':>9}{'calls/row':>11}{'embed req/row':>15}{'errors':>8}")
+    for phase in args.phases:
+        before = fake.snapshot()
+        seconds, peak_mb = run_phase(phase, phase_command(phase, agent_specs, args), workdir, env)
+        after = fake.snapshot()
+        calls = {name: after[name] - before[name] for name in after}
+        result = {
+            "seconds": seconds,
+            "rows_per_sec": args.rows / seconds if seconds else 0.0,
+            "peak_mb": peak_mb,
+            "calls_per_row": calls["chat"] / args.rows if args.rows else 0.0,
+            "embedding_requests_per_row": calls["embeddings"] / args.rows if args.rows else 0.0,
+            "server": calls,
+        }
+        results["phases"][phase] = result
+        peak = f"{peak_mb:.0f}" if peak_mb is not None else "-"
+        print(f"{phase:<13}{seconds:>9.1f}{result['rows_per_sec']:>10.1f}{peak:>9}{result['calls_per_row']:>11.2f}"
+              f"{result['embedding_requests_per_row']:>15.3f}{calls['errors']:>8}")
+    server.shutdown()
+
+    output_path = args.output or os.path.join(workdir, "results.json")
+    with open(output_path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=4)
+    print(f"Results saved to {output_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            raise SystemExit(f"Regression in {', '.join(regressions)}")
+
+if __name__ == "__main__":
+    main()
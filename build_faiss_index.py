@@ -0,0 +1,157 @@
+import os
+import json
+import math
+import uuid
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+import faiss
+from tqdm import tqdm
+from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from src.utils.retriever import index_path
+from src.utils.embeddings import BACKENDS, configure_embeddings, get_embeddings, embedding_model_id
+
+def parse_args():
+    # CLI argument parser for building a FAISS database for the RAG step
+    parser = argparse.ArgumentParser(description="Embed a CSV and build the FAISS database used by main_pre.py",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-i", "--input", required=True, help="Path to the CSV to embed (e.g., a training split)")
+    parser.add_argument("-d", "--database_name", required=True, help="Name passed to main_pre.py -d (e.g., khaters)")
+    parser.add_argument("-o", "--output", default=None, help="Output directory (default: ./faiss/<database_name>_faiss_index_constitution)")
+    parser.add_argument("--embedding_backend", choices=BACKENDS, default="openai", help="Embedding model family; main_pre.py must use the same one")
+    parser.add_argument("--embedding_model", default=None, help="Embedding model name (default: the backend's default model)")
+    parser.add_argument("--index", choices=["flat", "ivfpq", "hnsw"], default="flat", help="FAISS index type")
+    parser.add_argument("--batch_size", type=int, default=256, help="Number of rows embedded per request")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF-PQ: number of clusters (default: 4 * sqrt(rows))")
+    parser.add_argument("--nprobe", type=int, default=16, help="IVF-PQ: clusters searched per query")
+    parser.add_argument("--pq_m", type=int, default=None, help="IVF-PQ: sub-quantizers per vector, must divide the dimension (default: up to 64)")
+    parser.add_argument("--pq_nbits", type=int, default=8, help="IVF-PQ: bits per sub-quantizer code")
+    parser.add_argument("--train_size", type=int, default=None, help="IVF-PQ: vectors sampled for training (default: enough for the clusters and the PQ codebooks)")
+    parser.add_argument("--hnsw_m", type=int, default=32, help="HNSW: neighbors per node")
+    parser.add_argument("--ef_construction", type=int, default=200, help="HNSW: search depth while building")
+    parser.add_argument("--ef_search", type=int, default=64, help="HNSW: search depth per query")
+    parser.add_argument("--keep_checkpoint", action="store_true", help="Keep the embedding checkpoint after the index is saved")
+    return parser.parse_args()
+
+def load_documents(input_path):
+    """
+    Turn every CSV row into a Document, in the "column: value" format of langchain's CSVLoader
+    """
+    df = pd.read_csv(input_path, dtype=str, keep_default_na=False)
+    return [
+        Document(page_content="\n".join(f"{column}: {value}" for column, value in row.items()),
+                 metadata={"source": input_path, "row": i})
+        for i, row in enumerate(df.to_dict(orient="records"))
+    ]
+
+def embed_documents(documents, checkpoint_dir, batch_size=256):
+    """
+    Embed the documents in batches, saving the vectors to a checkpoint after every batch
+
+    The vectors go to `<checkpoint_dir>/embeddings.npy`, a memory-mapped array, and
+    the number of embedded rows to `progress.json`. A restarted build resumes after
+    the last saved batch instead of paying for the whole dataset again.
+
+    Returns:
+        np.memmap: float32 array of shape (len(documents), dimension)
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    vectors_path = os.path.join(checkpoint_dir, "embeddings.npy")
+    progress_path = os.path.join(checkpoint_dir, "progress.json")
+    progress = {"rows": len(documents), "done": 0}
+    if os.path.exists(progress_path):
+        with open(progress_path, "r", encoding="utf-8") as file:
+            saved = json.load(file)
+        if saved["rows"] == len(documents):
+            progress = saved
+            print(f"Resuming after {progress['done']} embedded rows")
+
+    embeddings = get_embeddings()
+    vectors = np.lib.format.open_memmap(vectors_path, mode="r+") if progress["done"] else None
+    for start in tqdm(range(progress["done"], len(documents), batch_size), desc="embedding"):
+        batch = embeddings.embed_documents([doc.page_content for doc in documents[start:start + batch_size]])
+        batch = np.asarray(batch, dtype=np.float32)
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=np.float32, shape=(len(documents), batch.shape[1]))
+        vectors[start:start + len(batch)] = batch
+        vectors.flush()
+        progress["done"] = start + len(batch)
+        with open(progress_path, "w", encoding="utf-8") as file:
+            json.dump(progress, file)
+    return vectors
+
+def default_pq_m(dimension):
+    # Largest number of sub-quantizers up to 64 that divides the dimension
+    return max(m for m in range(1, min(64, dimension) + 1) if dimension % m == 0)
+
+def build_index(vectors, index_type="flat", batch_size=256, nlist=None, nprobe=16, pq_m=None, pq_nbits=8,
+                train_size=None, hnsw_m=32, ef_construction=200, ef_search=64):
+    """
+    Build a FAISS index over the vectors, adding them in batches
+
+    - flat: exact L2 search, the index langchain's FAISS.from_documents builds
+    - ivfpq: inverted lists of product-quantized codes; small and fast on millions of rows
+    - hnsw: graph index with fast, high-recall search and no training step
+
+    The search parameters (nprobe, ef_search) are stored in the index file.
+    """
+    rows, dimension = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "ivfpq":
+        nlist = nlist or max(1, int(4 * math.sqrt(rows)))
+        pq_m = pq_m or default_pq_m(dimension)
+        train_size = min(rows, train_size or max(64 * nlist, 39 * 2 ** pq_nbits))
+        if train_size < max(nlist, 2 ** pq_nbits):
+            raise ValueError(f"IVF-PQ needs at least {max(nlist, 2 ** pq_nbits)} training vectors, got {train_size}. "
+                             "Use a smaller --nlist / --pq_nbits or --index flat.")
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, pq_m, pq_nbits)
+        sample = np.sort(np.random.default_rng(0).choice(rows, size=train_size, replace=False))
+        print(f"Training IVF-PQ (nlist={nlist}, m={pq_m}, nbits={pq_nbits}) on {train_size} vectors")
+        index.train(np.ascontiguousarray(vectors[sample]))
+        index.nprobe = nprobe
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    for start in tqdm(range(0, rows, batch_size), desc="indexing"):
+        index.add(np.ascontiguousarray(vectors[start:start + batch_size]))
+    return index
+
+def save_store(index, documents, output_dir):
+    """
+    Save the index and documents in the format FAISS.load_local (and init_vectorstore) reads
+
+    The embedding model is recorded in embedding.json, so init_vectorstore can
+    refuse to query the index with another model.
+    """
+    ids = [str(uuid.uuid4()) for _ in documents]
+    docstore = InMemoryDocstore(dict(zip(ids, documents)))
+    store = FAISS(get_embeddings(), index, docstore, dict(enumerate(ids)))
+    store.save_local(output_dir)
+    with open(os.path.join(output_dir, "embedding.json"), "w", encoding="utf-8") as file:
+        json.dump({"model": embedding_model_id()}, file)
+
+if __name__ == "__main__":
+    args = parse_args()
+    output_dir = args.output or index_path(args.database_name)
+    checkpoint_dir = f"{output_dir.rstrip('/')}.build"
+    configure_embeddings(backend=args.embedding_backend, model_name=args.embedding_model, batch_size=args.batch_size)
+
+    documents = load_documents(args.input)
+    vectors = embed_documents(documents, checkpoint_dir, batch_size=args.batch_size)
+    index = build_index(vectors, args.index, batch_size=args.batch_size, nlist=args.nlist, nprobe=args.nprobe,
+                        pq_m=args.pq_m, pq_nbits=args.pq_nbits, train_size=args.train_size,
+                        hnsw_m=args.hnsw_m, ef_construction=args.ef_construction, ef_search=args.ef_search)
+    save_store(index, documents, output_dir)
+    print(f"Saved {index.ntotal} vectors ({args.index}) to {output_dir}")
+
+    if not args.keep_checkpoint:
+        del vectors
+        shutil.rmtree(checkpoint_dir)
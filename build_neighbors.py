@@ -0,0 +1,87 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from src.utils.retriever import init_vectorstore, format_docs, configure_vectorstore
+from src.utils.embeddings import BACKENDS, configure_embeddings, get_embeddings, embedding_model_id
+from src.utils.neighbors import texts_fingerprint
+
+# Number of documents the RAG retriever returns (langchain's as_retriever() default)
+DEFAULT_K = 4
+
+def parse_args():
+    # CLI argument parser for precomputing the retrieval step of the PRE phase
+    parser = argparse.ArgumentParser(description="Precompute the RAG neighbors and contexts of a dataset for main_pre.py --neighbors",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-i", "--input", required=True, help="Path to the evaluation dataset (CSV)")
+    parser.add_argument("-d", "--database_name", required=True, help="Database searched by the agents (e.g., khaters)")
+    parser.add_argument("-o", "--output", default=None, help="Sidecar directory (default: <input>.<database_name>.neighbors)")
+    parser.add_argument("-k", type=int, default=DEFAULT_K, help="Number of documents retrieved per text")
+    parser.add_argument("--batch_size", type=int, default=256, help="Number of texts embedded and searched at a time")
+    parser.add_argument("--mmap_index", action="store_true", help="Memory-map the FAISS index instead of reading it into RAM")
+    parser.add_argument("--embedding_backend", choices=BACKENDS, default=None, help="Embedding model family; must match the index")
+    parser.add_argument("--embedding_model", default=None, help="Embedding model name (default: the backend's default model)")
+    parser.add_argument("--embedding_cache", default=None, help="SQLite file caching embeddings across runs")
+    return parser.parse_args()
+
+def default_sidecar_path(input_path, database_name):
+    return f"{os.path.splitext(input_path)[0]}.{database_name}.neighbors"
+
+def build_neighbors(input_path, database_name, output_dir, k=DEFAULT_K, batch_size=256):
+    """
+    Embed every text of a dataset and search the FAISS index in batches
+
+    Produces the same documents as the per-row retriever (the k nearest,
+    formatted by format_docs) and stores them as a NeighborSidecar.
+
+    Args:
+        input_path (str): Path to the evaluation CSV
+        database_name (str): Database whose index is searched
+        output_dir (str): Sidecar directory
+        k (int): Number of documents per text
+        batch_size (int): Number of texts embedded and searched at a time
+    """
+    texts = [str(text) for text in pd.read_csv(input_path)['text']]
+    vectorstore = init_vectorstore(database_name)
+    embeddings = get_embeddings()
+    os.makedirs(output_dir, exist_ok=True)
+
+    neighbors = np.lib.format.open_memmap(os.path.join(output_dir, "neighbors.npy"), mode="w+", dtype=np.int64, shape=(len(texts), k))
+    distances = np.lib.format.open_memmap(os.path.join(output_dir, "distances.npy"), mode="w+", dtype=np.float32, shape=(len(texts), k))
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    with open(os.path.join(output_dir, "contexts.bin"), "wb") as contexts:
+        for start in tqdm(range(0, len(texts), batch_size), desc="neighbors"):
+            batch = texts[start:start + batch_size]
+            vectors = np.asarray(embeddings.embed_documents(batch), dtype=np.float32)
+            batch_distances, batch_ids = vectorstore.index.search(vectors, k)
+            neighbors[start:start + len(batch)] = batch_ids
+            distances[start:start + len(batch)] = batch_distances
+            for row, ids in enumerate(batch_ids, start=start):
+                # -1 marks a missing neighbor (fewer than k documents), as in FAISS.similarity_search
+                docs = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]) for i in ids if i != -1]
+                encoded = format_docs(docs).encode("utf-8")
+                contexts.write(encoded)
+                offsets[row + 1] = offsets[row] + len(encoded)
+    neighbors.flush()
+    distances.flush()
+    np.save(os.path.join(output_dir, "offsets.npy"), offsets)
+
+    # meta.json is written last, so an interrupted build is never mistaken for a complete sidecar
+    meta = {"database": database_name, "input": input_path, "rows": len(texts), "k": k,
+            "embedding_model": embedding_model_id(), "fingerprint": texts_fingerprint(texts)[0]}
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file, indent=4, ensure_ascii=False)
+    return meta
+
+if __name__ == "__main__":
+    args = parse_args()
+    configure_vectorstore(mmap=args.mmap_index or None)
+    configure_embeddings(backend=args.embedding_backend, model_name=args.embedding_model,
+                         cache_path=args.embedding_cache, batch_size=args.batch_size)
+    output_dir = args.output or default_sidecar_path(args.input, args.database_name)
+    if os.path.exists(os.path.join(output_dir, "meta.json")):
+        os.remove(os.path.join(output_dir, "meta.json"))
+    meta = build_neighbors(args.input, args.database_name, output_dir, k=args.k, batch_size=args.batch_size)
+    print(f"Saved the {meta['k']} nearest documents of {meta['rows']} rows to {output_dir}")
@@ -3,19 +3,25 @@ import os
 def set_environment_variables():
     os.environ["LANGCHAIN_PROJECT"] = "PREDICT"
 
-    # Set to 'true' if you want to enable tracing
-    os.environ["LANGCHAIN_TRACING_V2"] = "true"
+    # LangSmith tracing of every chain call stays off unless set to 'true' in the shell.
+    # Prefer --trace / PREDICT_TRACE (src/utils/tracing.py): a sample of the rows, traced to a local file
+    os.environ.setdefault("LANGCHAIN_TRACING_V2", "false")
 
     # Replace with the actual LangChain endpoint URL
-    os.environ["LANGCHAIN_ENDPOINT"] = "https://api.smith.langchain.com"
+    os.environ.setdefault("LANGCHAIN_ENDPOINT", "https://api.smith.langchain.com")
 
     # IMPORTANT: Replace with your actual LangChain API key
     # NEVER commit your real API key to version control or share it publicly
-    os.environ["LANGCHAIN_API_KEY"] = ""
+    os.environ.setdefault("LANGCHAIN_API_KEY", "")
 
     # IMPORTANT: Replace with your actual OpenAI API key
     # CRITICAL: NEVER share your OpenAI API key publicly or commit it to version control
-    os.environ["OPENAI_API_KEY"] = ""
+    # Keys already set in the shell are kept (e.g. the dummy key of benchmark/run_benchmark.py)
+    os.environ.setdefault("OPENAI_API_KEY", "")
+
+    # Optional: several OpenAI API keys separated by commas. Requests are spread across them,
+    # and keys that run out of quota or are terminated are retired automatically
+    os.environ.setdefault("OPENAI_API_KEYS", "")
 
     # IMPORTANT: Replace with your actual Tavily API key
     # NEVER expose your Tavily API key in public repositories
@@ -1,12 +1,22 @@
 import os
+import re
 import json
 import random
+import difflib
 import argparse
 from langcodes import Language
 from src.utils.agent_debate import Agent
+from src.utils.openai_utils import num_tokens_from_string
+from src.utils.llm_cache import configure_response_cache, print_cache_stats
+from src.utils.key_pool import print_key_stats
+from src.utils.telemetry import configure_telemetry, print_telemetry_stats, span, labelled
+from src.utils.result_store import get_result_store
+from src.utils.dedup import MODES as DEDUP_MODES, find_duplicates, dedup_summary
+from src.utils.tracing import configure_tracing, print_trace_stats
 from datetime import datetime
 from tqdm import tqdm
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, as_completed
 
 # A predefined list of player names for the debate participants
 NAME_LIST = [
@@ -14,8 +24,17 @@ NAME_LIST = [
     "Hate side",
 ]
 
+# An answer opening with "I agree" concedes the debate
+CONCESSION_PATTERN = re.compile(r"^\W*(?:yes,?\s*)?i\s+(?:fully\s+|completely\s+|totally\s+)?agree\b", re.IGNORECASE)
+
+# Prompt key and placeholder each side uses to restate its own argument ("My argument is: ...")
+ARG_PROMPTS = {
+    "Non Hate side": ("NonHate_arg_prompt", "##non_arg##"),
+    "Hate side": ("Hate_arg_prompt", "##hate_arg##"),
+}
+
 class DebatePlayer(Agent):
-    def __init__(self, model_name: str, name: str, temperature: float, openai_api_key: str, sleep_time: float) -> None:
+    def __init__(self, model_name: str, name: str, temperature: float, openai_api_key: str, sleep_time: float, verbose: bool = False) -> None:
         """
         Initialize a debate player with specific configuration parameters.
         
@@ -29,8 +48,9 @@ class DebatePlayer(Agent):
                 - Higher values increase creativity and randomness
             openai_api_key (str): API key for accessing OpenAI's services
             sleep_time (float): Delay between API calls to manage rate limits
+            verbose (bool): Print every argument of the player
         """
-        super().__init__(model_name, name, temperature, sleep_time)
+        super().__init__(model_name, name, temperature, sleep_time, verbose)
         self.openai_api_key = openai_api_key
 
 class Debate:
@@ -41,8 +61,13 @@ class Debate:
             save_file_dir: str = None,
             openai_api_key: str = None,
             prompts_path: str = None,
+            prompts: dict = None,
             max_round: int = 2,
-            sleep_time: float = 0
+            sleep_time: float = 0,
+            compact_history: bool = True,
+            early_stop: bool = True,
+            stagnation_ratio: float = 0.9,
+            verbose: bool = False
         ) -> None:
         """
         Initialize a debate simulation with configurable parameters.
@@ -60,8 +85,13 @@ class Debate:
             save_file_dir (str): Directory to save debate results
             openai_api_key (str): OpenAI API key
             prompts_path (str): Path to JSON file containing debate prompts
+            prompts (dict): Debate prompts of this row, used instead of prompts_path
             max_round (int): Maximum number of debate rounds
             sleep_time (float): Delay between API calls
+            compact_history (bool): Give the judge only the distinct arguments instead of the raw player memories
+            early_stop (bool): End the debate before max_round when a side concedes or the arguments stop changing
+            stagnation_ratio (float): Similarity (difflib ratio) above which both sides repeating themselves ends the debate
+            verbose (bool): Print the rounds and every argument, for following a single debate
         """
         # Store configuration parameters
         self.model_name = model_name
@@ -71,17 +101,29 @@ class Debate:
         self.openai_api_key = openai_api_key
         self.max_round = max_round
         self.sleep_time = sleep_time
+        self.compact_history = compact_history
+        self.early_stop = early_stop
+        self.stagnation_ratio = stagnation_ratio
+        self.verbose = verbose
+        self.refresh_judge_cache = False
+        self.stop_reason = None
 
         # Initialize a structured save file to track debate details
         self.save_file = {
             'num_players': num_players,
             'success': False,
+            'triaged': False,
+            'rounds': 0,
+            'max_round': max_round,
+            'stop_reason': None,
+            'calls': {'players': 0, 'judge': 0},
             'text': '',
             'ground_truth': '',
             'players': {},
         }
-        # Load debate prompts from a JSON configuration file
-        prompts = json.load(open(prompts_path, encoding='utf-8'))
+        # Load debate prompts from a JSON configuration file unless they are given
+        if prompts is None:
+            prompts = json.load(open(prompts_path, encoding='utf-8'))
         self.save_file.update(prompts)
         
         # Prepare and customize prompts
@@ -91,6 +133,70 @@ class Debate:
         self.create_agents()
         self.init_agents()
 
+    @classmethod
+    def from_save_file(cls, save_file_path: str, config: dict = None, **kwargs):
+        """
+        Rebuild a finished debate from a {id}.json file of the former one-file-per-row layout.
+        """
+        with open(save_file_path, 'r', encoding='utf-8') as f:
+            save_file = json.load(f)
+        return cls.from_saved(save_file, os.path.dirname(save_file_path), config=config, **kwargs)
+
+    @classmethod
+    def from_saved(cls, save_file: dict, save_file_dir: str, config: dict = None, model_name: str = 'gpt-3.5-turbo-0125',
+                   temperature: float = 0, openai_api_key: str = None, sleep_time: float = 0,
+                   compact_history: bool = True, verbose: bool = False, refresh_judge_cache: bool = True):
+        """
+        Rebuild a finished debate from its saved result, without calling the players again.
+        
+        The players get back their saved transcripts, so final_judgment can be
+        run again on the same debate.
+        
+        Args:
+            save_file (dict): Saved result of the debate (see src.utils.result_store)
+            save_file_dir (str): Directory holding the debate results
+            config (dict, optional): Debate prompt configuration whose judge prompts replace the saved ones
+            model_name (str): AI model to be used for the judge
+            temperature (float): Response randomness control
+            openai_api_key (str): OpenAI API key
+            sleep_time (float): Delay between API calls
+            compact_history (bool): Give the judge only the distinct arguments instead of the raw player memories
+            verbose (bool): Print the judgment
+            refresh_judge_cache (bool): Ask the judge again even if the response cache holds its answer to the same
+                transcript and prompts, which a re-judgment would otherwise get back unchanged
+        """
+        debate = cls.__new__(cls)
+        debate.model_name = model_name
+        debate.temperature = temperature
+        debate.num_players = save_file['num_players']
+        debate.save_file_dir = save_file_dir
+        debate.openai_api_key = openai_api_key
+        # Results saved before max_round was recorded played at most their saved number of rounds
+        debate.max_round = save_file.get('max_round', save_file.get('rounds') or 2)
+        debate.sleep_time = sleep_time
+        debate.compact_history = compact_history
+        debate.early_stop = True
+        debate.stagnation_ratio = 0.9
+        debate.verbose = verbose
+        debate.refresh_judge_cache = refresh_judge_cache
+        debate.stop_reason = save_file.get('stop_reason')
+        debate.save_file = save_file
+        debate.save_file.setdefault('calls', {'players': 0, 'judge': 0})
+
+        if config is not None:
+            debate.save_file['judge_prompt_1'] = config['judge_prompt_1']
+            debate.save_file['judge_prompt_2'] = config['judge_prompt_2'].replace("##text##", save_file['text'])
+
+        # Forget the previous verdict
+        debate.save_file['success'] = False
+        for key in ('Label', 'Reason', 'judge_history_tokens'):
+            debate.save_file.pop(key, None)
+
+        debate.create_agents()
+        for player in debate.players:
+            player.load_memory(save_file['players'][player.name])
+        return debate
+
     def init_prompt(self):
         """
         Prepare and customize debate prompts by replacing placeholders with actual content.
@@ -124,7 +230,8 @@ class Debate:
         """
         # Create players
         self.players = [
-            DebatePlayer(model_name=self.model_name, name=name, temperature=self.temperature, openai_api_key=self.openai_api_key, sleep_time=self.sleep_time) for name in NAME_LIST
+            DebatePlayer(model_name=self.model_name, name=name, temperature=self.temperature, openai_api_key=self.openai_api_key, sleep_time=self.sleep_time,
+                         verbose=self.verbose) for name in NAME_LIST
         ]
         # Convenience references to specific players
         self.nothate = self.players[0]
@@ -144,38 +251,148 @@ class Debate:
         self.hate.set_meta_prompt(self.save_file['Hate_player_meta_prompt'])
 
         # First round debate: state initial opinions
-        print(f"===== Debate Round-1 =====\n")
+        if self.verbose:
+            print(f"===== Debate Round-1 =====\n")
+        self.save_file['rounds'] = 1
         self.nothate.add_event(self.save_file['NonHate_prompt_1'])
-        self.not_ans = self.nothate.ask()
+        self.not_ans = self.ask(self.nothate)
         self.nothate.add_memory(self.not_ans)
 
         self.hate.add_event(self.save_file['Hate_prompt_1'].replace('##non_arg##', self.not_ans))
-        self.hate_ans = self.hate.ask()
+        self.hate_ans = self.ask(self.hate)
         self.hate.add_memory(self.hate_ans)
+        self.check_concession(self.hate, self.hate_ans)
 
-    def debate_round(self):
+    def ask(self, player):
+        """
+        Ask a player for its next argument, counting the call.
+        """
+        
+        self.save_file['calls']['players'] += 1
+        return player.ask()
+
+    def round_prompt(self, side, round_index):
+        """
+        Return the prompt of a side for a round.
+        
+        Rounds without their own prompt in the configuration (e.g. Hate_prompt_3)
+        reuse the prompt of the latest round that has one.
+        
+        Args:
+            side (str): "NonHate" or "Hate"
+            round_index (int): Round number, starting at 2
         """
-        Conduct the second round of the debate.
+        
+        while f"{side}_prompt_{round_index}" not in self.save_file and round_index > 2:
+            round_index -= 1
+        return self.save_file[f"{side}_prompt_{round_index}"]
+
+    def check_concession(self, player, answer):
+        """
+        Stop the debate if a player opens its answer with "I agree".
+        """
+        
+        if self.early_stop and self.stop_reason is None and CONCESSION_PATTERN.match(answer):
+            self.stop_reason = f"concession: {player.name}"
+        return self.stop_reason is not None
+
+    def check_stagnation(self, previous, current):
+        """
+        Stop the debate if both sides repeated their previous arguments.
+        
+        Args:
+            previous (list): Previous argument of each side
+            current (list): New argument of each side
+        """
+        
+        if not self.early_stop or self.stop_reason is not None:
+            return
+        ratios = [difflib.SequenceMatcher(None, before, after).ratio() for before, after in zip(previous, current)]
+        if min(ratios) >= self.stagnation_ratio:
+            self.stop_reason = f"stagnation: similarity {min(ratios):.2f}"
+
+    def debate_round(self, round_index=2):
+        """
+        Conduct one rebuttal round of the debate (round 2 or later).
         
         In this round:
         1. Each side receives and responds to the other side's previous argument
         2. Players add the received arguments to their memory
         3. Players generate responsive arguments
+        
+        Args:
+            round_index (int): Round number, starting at 2
         """
         
-        print(f"===== Debate Round-2 =====\n")
+        if self.verbose:
+            print(f"===== Debate Round-{round_index} =====\n")
+        self.save_file['rounds'] = round_index
+        previous = [self.not_ans, self.hate_ans]
         
         # Non-Hate side responds to Hate side's argument
         self.nothate.add_memory(self.save_file['NonHate_arg_prompt'].replace('##non_arg##', self.not_ans))
-        self.nothate.add_event(self.save_file['NonHate_prompt_2'].replace('##hate_arg##', self.hate_ans))
-        self.not_res = self.nothate.ask()
+        self.nothate.add_event(self.round_prompt('NonHate', round_index).replace('##hate_arg##', self.hate_ans))
+        self.not_res = self.ask(self.nothate)
         self.nothate.add_memory(self.not_res)
+        self.not_ans = self.not_res
+        if self.check_concession(self.nothate, self.not_res):
+            return
 
         # Hate side responds to Non-Hate side's argument
         self.hate.add_memory(self.save_file['Hate_arg_prompt'].replace('##hate_arg##', self.hate_ans))
-        self.hate.add_event(self.save_file['Hate_prompt_2'].replace('##non_res##', self.not_res))
-        self.hate_res = self.hate.ask()
+        self.hate.add_event(self.round_prompt('Hate', round_index).replace('##non_res##', self.not_res))
+        self.hate_res = self.ask(self.hate)
         self.hate.add_memory(self.hate_res)
+        self.hate_ans = self.hate_res
+        # Checked after every round, the last one included: at max_round=2 nothing is left to skip,
+        # but stop_reason still records that the judge gets two repeated rounds
+        if not self.check_concession(self.hate, self.hate_res):
+            self.check_stagnation(previous, [self.not_ans, self.hate_ans])
+
+    def distinct_arguments(self, player):
+        """
+        List the arguments a player made, in order, without repeats.
+        
+        Skips the "My argument is: ..." restatements added to the memory
+        between rounds and any argument the player already made.
+        
+        Args:
+            player (DebatePlayer): A debate player
+        
+        Returns:
+            list: The player's distinct arguments
+        """
+        
+        arg_prompt, placeholder = ARG_PROMPTS.get(player.name, (None, None))
+        template = self.save_file.get(arg_prompt)
+        arguments = []
+        for message in player.memory_lst:
+            if message['role'] != 'assistant':
+                continue
+            content = message['content']
+            if content in arguments or (template and any(content == template.replace(placeholder, argument) for argument in arguments)):
+                continue
+            arguments.append(content)
+        return arguments
+
+    def compact_transcript(self):
+        """
+        Format the debate for the judge as the distinct arguments in round order.
+        
+        Unlike the raw memories, this leaves out the meta prompts, the round
+        instructions, the restated arguments and the JSON escaping.
+        
+        Returns:
+            str: One line per argument, e.g. "[Round 1] Non Hate side: ..."
+        """
+        
+        arguments = {player.name: self.distinct_arguments(player) for player in self.players}
+        lines = []
+        for round_index in range(max(len(player_arguments) for player_arguments in arguments.values())):
+            for player in self.players:
+                if round_index < len(arguments[player.name]):
+                    lines.append(f"[Round {round_index + 1}] {player.name}: {arguments[player.name][round_index]}")
+        return "\n".join(lines)
 
     def final_judgment(self):
         """
@@ -189,17 +406,38 @@ class Debate:
         5. Update save file with judgment results
         """
         
-        print(f"===== Final Judgment =====\n")
+        if self.verbose:
+            print(f"===== Final Judgment =====\n")
         
         # Create a judge agent with the same model configuration
-        judge_player = DebatePlayer(model_name=self.model_name, name='Judge', temperature=self.temperature, openai_api_key=self.openai_api_key, sleep_time=self.sleep_time)
+        judge_player = DebatePlayer(model_name=self.model_name, name='Judge', temperature=self.temperature, openai_api_key=self.openai_api_key, sleep_time=self.sleep_time,
+                                    verbose=self.verbose)
+        judge_player.refresh_cache = self.refresh_judge_cache
 
-        # Compile debate history as JSON
-        debate_history = json.dumps({player.name: player.memory_lst for player in self.players}, ensure_ascii=False)
+        # Compile debate history as JSON; its tokens are counted on the serialized text, JSON escaping included
+        raw_history = json.dumps({player.name: player.memory_lst for player in self.players}, ensure_ascii=False)
+        raw_history_tokens = num_tokens_from_string(raw_history, self.model_name)
+        if self.compact_history:
+            # Only the distinct arguments, in round order
+            debate_history = self.compact_transcript()
+            history_tokens = num_tokens_from_string(debate_history, self.model_name)
+            self.save_file['judge_history_tokens'] = {
+                'raw': raw_history_tokens,
+                'compact': history_tokens,
+                'saved': raw_history_tokens - history_tokens,
+            }
+            if self.verbose:
+                print(f"Judge history: {history_tokens} tokens instead of {raw_history_tokens} ({raw_history_tokens - history_tokens} saved)\n")
+        else:
+            debate_history = raw_history
+            history_tokens = raw_history_tokens
+        judge_prompt_tokens = num_tokens_from_string(self.save_file['judge_prompt_1'].replace('##history##', ''), self.model_name) + history_tokens
         # Generate judgment
-        judge_player.add_event(self.save_file['judge_prompt_1'].replace('##history##', debate_history))
+        judge_player.add_event(self.save_file['judge_prompt_1'].replace('##history##', debate_history), num_tokens=judge_prompt_tokens)
         judge_player.add_event(self.save_file['judge_prompt_2'])
-        judgment = judge_player.ask()
+        # An unparseable judgment is not cached, so the next run or re-judgment asks again
+        judgment = judge_player.ask(validate=json.loads)
+        self.save_file['calls']['judge'] += 1
         judge_player.add_memory(judgment)
 
         # Parse judgment and update save file
@@ -210,40 +448,330 @@ class Debate:
         except json.JSONDecodeError:
             print("Error parsing judge's response.")
 
-    def save_file_to_json(self, id):
+    def save_file_to_json(self, id, config=None):
         """
-        Save the debate results to a JSON file.
+        Save the debate results to the result store of save_file_dir.
         
         Args:
             id (int/str): Unique identifier for the debate session
+            config (dict, optional): Debate prompt configuration, stored once instead of with every result
         """
         
-        save_file_path = os.path.join(self.save_file_dir, f"{id}.json")
-        json_str = json.dumps(self.save_file, ensure_ascii=False, indent=4)
-        with open(save_file_path, 'w', encoding='utf-8') as f:
-            f.write(json_str)
+        get_result_store(self.save_file_dir).write(id, self.save_file, config)
 
     def run(self):
         """
         Execute the entire debate process.
         
         Workflow:
-        1. Conduct the debate round
+        1. Conduct the rebuttal rounds, up to max_round or until the debate stops early
         2. Generate final judgment
         3. Save player memories to the save file
         """
         
-        self.debate_round()
+        for round_index in range(2, self.max_round + 1):
+            if self.stop_reason is not None:
+                break
+            self.debate_round(round_index)
+        self.save_file['stop_reason'] = self.stop_reason or 'max_round'
         self.final_judgment()
         for player in self.players:
             self.save_file['players'][player.name] = player.memory_lst
 
+def prepare_config(config, row):
+    """
+    Build the debate-specific configuration for one input row.
+    
+    Args:
+        config (dict): Debate prompt configuration loaded from debate_prompt.json
+        row (pd.Series): Input row with text, label and agent reasons
+    
+    Returns:
+        dict: A copy of the configuration filled with the row data
+    """
+    
+    # Copy so that placeholders stay intact for the next row
+    config = dict(config)
+
+    # Update configuration with specific row data
+    config['text'] = str(row['text'])
+    config['ground_truth'] = str(row['label'])
+    config['Not_Hate_Reason'] = str(row['Not_Hate_Reason'])
+    config['Hate_Reason'] = str(row['Hate_Reason'])
+
+    # Prepare player meta prompts
+    config['NonHate_player_meta_prompt'] = config['NonHate_player_meta_prompt'].replace("##text##", config['text'])
+    config['Hate_player_meta_prompt'] = config['Hate_player_meta_prompt'].replace("##text##", config['text'])
+    return config
+
+def triage_decision(row, agreement_threshold):
+    """
+    Decide whether the PRE vote of a row is clear enough to skip the debate.
+    
+    Args:
+        row (pd.Series): Input row with Hate_count, Not_Hate_count and agent reasons
+        agreement_threshold (int): Number of agreeing PRE votes that settles a row (None disables triage)
+    
+    Returns:
+        dict: Label, reason and triage explanation in the judge's output format, or None to debate the row
+    """
+    
+    if agreement_threshold is None:
+        return None
+    hate_count, not_hate_count = int(row['Hate_count']), int(row['Not_Hate_count'])
+    if hate_count >= agreement_threshold and hate_count > not_hate_count:
+        label, reason = 'hate', row['Hate_Reason']
+    elif not_hate_count >= agreement_threshold and not_hate_count > hate_count:
+        label, reason = 'Non-hate', row['Not_Hate_Reason']
+    else:
+        return None
+    return {
+        'Label': label,
+        'Reason': str(reason),
+        'triage_reason': f"PRE vote Hate_count={hate_count}, Not_Hate_count={not_hate_count} "
+                         f"reached the agreement threshold of {agreement_threshold}",
+    }
+
+def save_triaged(id, row, decision, save_file_dir):
+    """
+    Save a row settled by the PRE vote in the same file layout as a debate result.
+    """
+    
+    save_file = {
+        'num_players': 0,
+        'success': True,
+        'triaged': True,
+        'triage_reason': decision['triage_reason'],
+        'text': str(row['text']),
+        'ground_truth': str(row['label']),
+        'Hate_count': int(row['Hate_count']),
+        'Not_Hate_count': int(row['Not_Hate_count']),
+        'players': {},
+        'Label': decision['Label'],
+        'Reason': decision['Reason'],
+    }
+    get_result_store(save_file_dir).write(id, save_file)
+    return save_file
+
+def run_debate(id, row, config, save_file_dir, agreement_threshold=None, **debate_options):
+    """
+    Run the whole debate for one input row and save its result.
+    
+    Args:
+        id (int/str): Unique identifier for the debate session
+        row (pd.Series): Input row with text, label and agent reasons
+        config (dict): Debate prompt configuration loaded from debate_prompt.json
+        save_file_dir (str): Directory to save debate results
+        agreement_threshold (int, optional): Number of agreeing PRE votes that skips the debate
+        **debate_options: Debate settings (max_round, early_stop, stagnation_ratio, compact_history, verbose)
+    
+    Returns:
+        int: Number of LLM calls made for this row
+    """
+    
+    save_file = debate_row(id, row, config, save_file_dir, agreement_threshold, **debate_options)
+    return sum(save_file.get('calls', {}).values())
+
+def debate_row(id, row, config, save_file_dir, agreement_threshold=None, **debate_options):
+    """
+    Debate one input row, save its result and return it.
+    
+    Rows whose PRE vote reaches `agreement_threshold` are labeled from the
+    vote and saved without any LLM call.
+    
+    Returns:
+        dict: The saved result: Label, Reason, success, triaged, rounds, ...
+    """
+    
+    with labelled(row=str(id)), span("debate") as fields:
+        decision = triage_decision(row, agreement_threshold)
+        if decision is not None:
+            fields["triaged"] = True
+            return save_triaged(id, row, decision, save_file_dir)
+
+        # Run the debate for this specific input; the prompt configuration is stored once per run
+        debate = Debate(save_file_dir=save_file_dir, num_players=2, prompts=prepare_config(config, row), temperature=0, sleep_time=0,
+                        **debate_options)
+        debate.run()
+        debate.save_file_to_json(id, config)
+        fields.update(rounds=debate.save_file['rounds'], calls=sum(debate.save_file['calls'].values()))
+        return debate.save_file
+
+def is_finished(save_file_dir, id):
+    """
+    Check whether a debate already has a successful result in the output directory.
+    """
+    
+    return get_result_store(save_file_dir).finished(id)
+
+def dedup_rows(inputs, pending, mode, threshold=0.8):
+    """
+    Split the pending rows into the rows to debate and the duplicates of another row.
+    
+    Args:
+        inputs (pd.DataFrame): Every input row, in order
+        pending (list[tuple]): (id, row) pairs without a successful result
+        mode (str): "exact" or "near" (see src.utils.dedup.find_duplicates)
+        threshold (float): Estimated Jaccard similarity of near-duplicates
+    
+    Returns:
+        tuple[list, list]: the (id, row) pairs to debate, and (id, row, representative id) triples
+        of the rows that copy the result of their representative
+    """
+    
+    representatives = find_duplicates(inputs['text'], mode, threshold)
+    print(dedup_summary(representatives, mode))
+    ids = list(inputs.index)
+    positions = {id: position for position, id in enumerate(ids)}
+    kept, copies = [], []
+    for id, row in pending:
+        representative = ids[representatives[positions[id]]]
+        if representative != id:
+            copies.append((id, row, representative))
+        else:
+            kept.append((id, row))
+    return kept, copies
+
+def copy_result(id, row, representative, save_file_dir):
+    """
+    Save the result of a representative row as the result of its duplicate.
+    
+    Returns:
+        bool: False when the representative has no result to copy
+    """
+    
+    store = get_result_store(save_file_dir)
+    saved = store.get(representative)
+    if saved is None:
+        return False
+    saved.update(text=str(row['text']), ground_truth=str(row['label']), duplicate_of=str(representative))
+    store.write(id, saved)
+    return True
+
+def run_debates(inputs, config, save_file_dir, workers=1, agreement_threshold=None, dedup=None, dedup_threshold=0.8,
+                **debate_options):
+    """
+    Run the debates for every input row with a pool of worker threads.
+    
+    The calls inside one debate stay in order (round 1, round 2, judge);
+    only different debates run at the same time. Rows whose result is
+    already saved with success: true are skipped, so restarts are cheap.
+    
+    Args:
+        inputs (pd.DataFrame): Input rows with text, label and agent reasons
+        config (dict): Debate prompt configuration loaded from debate_prompt.json
+        save_file_dir (str): Directory to save debate results
+        workers (int): Number of debates running at the same time
+        agreement_threshold (int, optional): Number of agreeing PRE votes that skips the debate
+        dedup (str, optional): "exact" or "near" to debate one row per group of duplicate texts
+        dedup_threshold (float, optional): Estimated Jaccard similarity of near-duplicates
+        **debate_options: Debate settings (max_round, early_stop, stagnation_ratio, compact_history, verbose)
+    
+    Returns:
+        list: Ids of the debates that failed with an exception
+    """
+    
+    pending = [(id, row) for id, row in inputs.iterrows() if not is_finished(save_file_dir, id)]
+    skipped = inputs.shape[0] - len(pending)
+    if skipped:
+        print(f"Skipping {skipped}/{inputs.shape[0]} debates that already succeeded")
+    copies = []
+    if dedup:
+        pending, copies = dedup_rows(inputs, pending, dedup, dedup_threshold)
+    triaged = sum(triage_decision(row, agreement_threshold) is not None for _, row in pending)
+    if agreement_threshold is not None:
+        print(f"Triage: {triaged}/{len(pending)} rows settled by the PRE vote, {len(pending) - triaged} debated")
+
+    failed = []
+    calls = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(total=len(pending)) as progress:
+        rows = iter(pending)
+        running = {}
+        while True:
+            # Keep a bounded number of debates submitted at a time
+            while len(running) < workers * 2:
+                try:
+                    id, row = next(rows)
+                except StopIteration:
+                    break
+                running[executor.submit(run_debate, id, row, config, save_file_dir, agreement_threshold, **debate_options)] = id
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                id = running.pop(future)
+                try:
+                    calls += future.result()
+                except Exception as e:
+                    print(f"Debate {id} failed: {e}")
+                    failed.append(id)
+                progress.update(1)
+    finished = len(pending) - len(failed)
+    if finished:
+        print(f"{calls} LLM calls for {finished} rows ({calls / finished:.2f} per row)")
+    if copies:
+        # Once their representatives are debated, duplicates take a copy of the result
+        copied = sum(copy_result(id, row, representative, save_file_dir) for id, row, representative in copies)
+        print(f"Dedup: {copied} rows copied the result of a duplicate instead of a debate "
+              f"(~{calls / max(finished, 1) * copied:.0f} LLM calls saved)")
+        failed += [id for id, _, representative in copies if not is_finished(save_file_dir, representative)]
+    return failed
+
+def rejudge(save_file_dir, config, workers=1, only_failed=False, compact_history=True, verbose=False):
+    """
+    Run the judge again on the saved debates, saving a new version of their results.
+    
+    The players' transcripts are replayed from the saved files, so only the
+    judge is called. Rows settled by triage have no debate and are left alone.
+    
+    Args:
+        save_file_dir (str): Directory holding the debate results
+        config (dict): Debate prompt configuration providing the judge prompts
+        workers (int): Number of judge calls running at the same time
+        only_failed (bool): Re-judge only the debates saved with success: false
+        compact_history (bool): Give the judge only the distinct arguments
+        verbose (bool): Print every judgment
+    
+    Returns:
+        list: Ids whose judgment still failed to parse or raised an exception
+    """
+    
+    # The index knows which results succeeded and which were triaged, without reading them
+    store = get_result_store(save_file_dir)
+    ids = [id for id, success, triaged in sorted(store.entries()) if not triaged and not (only_failed and success)]
+    print(f"Re-judging {len(ids)} debates in {save_file_dir}")
+
+    def judge(id):
+        with labelled(row=str(id)):
+            saved = store.get(id, with_config=True)
+            if not saved.get('players'):
+                return saved.get('success') is True
+            debate = Debate.from_saved(saved, save_file_dir, config=config, temperature=0, sleep_time=0,
+                                       compact_history=compact_history, verbose=verbose)
+            debate.save_file['rejudged'] = debate.save_file.get('rejudged', 0) + 1
+            debate.final_judgment()
+            debate.save_file_to_json(id, config)
+            return debate.save_file['success']
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(judge, id): id for id in ids}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            id = futures[future]
+            try:
+                if not future.result():
+                    failed.append(id)
+            except Exception as e:
+                print(f"Re-judging {id} failed: {e}")
+                failed.append(id)
+    return failed
+
 def parse_args():
     """
     Parse command-line arguments for the script.
     
     Required Arguments:
-    - input-file: Path to the CSV file containing debate input data
+    - input-file: Path to the CSV file containing debate input data (except with --rejudge)
     - output-dir: Directory to save debate result files
     
     Returns:
@@ -251,13 +779,47 @@ def parse_args():
     """
     
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input-file", required=True, help="Input CSV file path")
+    parser.add_argument("-i", "--input-file", help="Input CSV file path (not needed with --rejudge)")
     parser.add_argument("-o", "--output-dir", required=True, help="Output directory to store results")
-    return parser.parse_args()
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of debates running at the same time")
+    parser.add_argument("--agreement-threshold", type=int, default=None,
+                        help="Label rows with at least this many agreeing PRE votes from the vote, without a debate")
+    parser.add_argument("--rejudge", action="store_true",
+                        help="Run only the judge again on the debates saved in the output directory, using the current judge prompts")
+    parser.add_argument("--only-failed", action="store_true", help="With --rejudge, only re-judge debates saved with success: false")
+    parser.add_argument("--max-round", type=int, default=2, help="Maximum number of debate rounds (rounds after 2 reuse the round-2 prompts)")
+    parser.add_argument("--no-early-stop", action="store_true",
+                        help="Always play --max-round rounds, even after a side concedes or the arguments stop changing")
+    parser.add_argument("--stagnation-ratio", type=float, default=0.9,
+                        help="Similarity between consecutive arguments of both sides that ends the debate early")
+    parser.add_argument("--raw-judge-history", action="store_true",
+                        help="Give the judge the raw JSON dump of the players' memories instead of the compact transcript")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print the rounds, arguments and judgment of every debate (best with -w 1, as concurrent debates interleave)")
+    parser.add_argument("--llm-cache", default=None, help="SQLite file used to cache LLM responses across runs")
+    parser.add_argument("--llm-cache-max-mb", type=float, default=None, help="Evict least recently used cached responses above this size")
+    parser.add_argument("--llm-cache-read-only", action="store_true", help="Serve cached responses but never store new ones")
+    parser.add_argument("--telemetry", default=None, metavar="EVENTS.jsonl",
+                        help="Record latency, tokens and cost of every LLM call and file write; a summary is printed at the end")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default=None,
+                        help="Debate one row per group of duplicate texts (exact: equal after normalization, near: also MinHash near-duplicates) and copy its result to the others")
+    parser.add_argument("--dedup-threshold", type=float, default=0.8, help="Estimated Jaccard similarity of near-duplicates with --dedup near")
+    parser.add_argument("--trace", default=None, metavar="SINK",
+                        help="Trace the LLM calls of a sample of the rows to a JSONL file, a SQLite file (.db) or \"langsmith\"")
+    parser.add_argument("--trace-sample", type=float, default=None, help="Fraction of the rows traced with --trace (default: PREDICT_TRACE_SAMPLE or 0.01)")
+    args = parser.parse_args()
+    if not args.rejudge and not args.input_file:
+        parser.error("-i/--input-file is required unless --rejudge is given")
+    return args
 
 if __name__ == "__main__":
     # Parse command-line arguments
     args = parse_args()
+    configure_response_cache(args.llm_cache, max_size_mb=args.llm_cache_max_mb, read_only=args.llm_cache_read_only)
+    if args.telemetry:
+        configure_telemetry(args.telemetry)
+    if args.trace:
+        configure_tracing(args.trace, args.trace_sample)
 
     # Determine script and configuration paths
     current_script_path = os.path.abspath(__file__)
@@ -268,33 +830,32 @@ if __name__ == "__main__":
     with open(config_path, "r", encoding='utf-8') as config_file:
         config = json.load(config_file)
 
-    # Read input data using pandas
-    inputs = pd.read_csv(args.input_file)
-
     # Ensure output directory exists
     save_file_dir = args.output_dir
     os.makedirs(save_file_dir, exist_ok=True)
 
-    # Iterate through input data and run debates
-    for id, row in tqdm(inputs.iterrows(), total=inputs.shape[0]):
-        # Create a unique configuration file for each debate
-        prompts_path = os.path.join(save_file_dir, f"{id}-config.json")
-
-        # Update configuration with specific row data
-        config['text'] = str(row['text'])
-        config['ground_truth'] = str(row['label'])
-        config['Not_Hate_Reason'] = str(row['Not_Hate_Reason'])
-        config['Hate_Reason'] = str(row['Hate_Reason'])
+    if args.rejudge:
+        # Replay the saved transcripts and call only the judge
+        failed = rejudge(save_file_dir, config, workers=args.workers, only_failed=args.only_failed,
+                         compact_history=not args.raw_judge_history, verbose=args.verbose)
+        if failed:
+            print(f"{len(failed)} judgments still failed: {failed}")
+    else:
+        # Read input data using pandas
+        inputs = pd.read_csv(args.input_file)
+        if 'id' in inputs.columns:
+            # reference.csv of main_pipeline.py: rows are identified by their position in the input dataset
+            inputs = inputs.set_index('id')
 
-        # Prepare player meta prompts
-        config['NonHate_player_meta_prompt'] = config['NonHate_player_meta_prompt'].replace("##text##", config['text'])
-        config['Hate_player_meta_prompt'] = config['Hate_player_meta_prompt'].replace("##text##", config['text'])
+        # Run the debates, skipping those that already succeeded
+        failed = run_debates(inputs, config, save_file_dir, workers=args.workers, agreement_threshold=args.agreement_threshold,
+                             dedup=args.dedup, dedup_threshold=args.dedup_threshold,
+                             compact_history=not args.raw_judge_history, max_round=args.max_round,
+                             early_stop=not args.no_early_stop, stagnation_ratio=args.stagnation_ratio, verbose=args.verbose)
+        if failed:
+            print(f"{len(failed)} debates failed and will be retried on the next run: {failed}")
 
-        # Save the debate-specific configuration
-        with open(prompts_path, 'w', encoding='utf-8') as file:
-            json.dump(config, file, ensure_ascii=False, indent=4)
-
-        # Run the debate for this specific input
-        debate = Debate(save_file_dir=save_file_dir, num_players=2, prompts_path=prompts_path, temperature=0, sleep_time=0)
-        debate.run()
-        debate.save_file_to_json(id)
\ No newline at end of file
+    print_cache_stats()
+    print_key_stats()
+    print_telemetry_stats()
+    print_trace_stats()
@@ -0,0 +1,268 @@
+import os
+import json
+import argparse
+import threading
+import pandas as pd
+from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+import main_pre
+from main_pre import parse_agent_spec, process_row, prefetch_embeddings, WAIT_TIME, MAX_RETRIES, ATTEMPT_TIMEOUT, ROW_DEADLINE
+from main_pre_to_dict import CRITERIA_PATH, load_criteria, aggregate_votes, output_columns
+from main_dict import run_debate, is_finished, triage_decision, save_triaged
+from src.utils.executor import DeadlineExecutor
+from src.utils.retriever import init_vectorstore, configure_vectorstore
+from src.utils.prompt_registry import configure_prompt_registry
+from src.utils.llm_cache import configure_response_cache, print_cache_stats
+from src.utils.key_pool import print_key_stats
+from src.utils.embeddings import BACKENDS, configure_embeddings, print_embedding_stats
+from src.utils.telemetry import configure_telemetry, print_telemetry_stats, span
+from src.utils.tracing import configure_tracing, print_trace_stats
+from src.utils.neighbors import NeighborSidecar
+
+def parse_args():
+    # CLI argument parser for the streaming PRE -> aggregation -> DICT pipeline
+    parser = argparse.ArgumentParser(description="Stream a hate speech dataset through the PRE agents, the vote aggregation and the debate",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-i", "--input", required=True, help="Path to input hate speech dataset (CSV)")
+    parser.add_argument("-o", "--output", required=True, help="Output directory (e.g., output/Dataset_A); PRE_to_DICT/ and DICT/ are written inside it")
+    parser.add_argument("--agents", nargs="+", required=True, metavar="NAME=PROMPT[@DATABASE]",
+                        help="PRE agents (e.g., Agent_A=someen/khaters@khaters). NAME must match an agent in the criteria file")
+    parser.add_argument("-d", "--database_name", help="Database for agents that do not name one")
+    parser.add_argument("--criteria", default=CRITERIA_PATH, help="JSON file with the hate / not-hate labels of each agent")
+    parser.add_argument("--chunksize", type=int, default=1000, help="Number of input rows read and processed at a time")
+    parser.add_argument("--pre_workers", type=int, default=8, help="Number of rows going through the PRE agents at the same time")
+    parser.add_argument("--dict_workers", type=int, default=4, help="Number of debates running at the same time")
+    parser.add_argument("--agreement_threshold", type=int, default=None,
+                        help="Label rows with at least this many agreeing PRE votes from the vote, without a debate")
+    parser.add_argument("--max_round", type=int, default=2, help="Maximum number of debate rounds (rounds after 2 reuse the round-2 prompts)")
+    parser.add_argument("--no_early_stop", action="store_true",
+                        help="Always play --max_round rounds, even after a side concedes or the arguments stop changing")
+    parser.add_argument("--stagnation_ratio", type=float, default=0.9,
+                        help="Similarity between consecutive arguments of both sides that ends the debate early")
+    parser.add_argument("--raw_judge_history", action="store_true",
+                        help="Give the judge the raw JSON dump of the players' memories instead of the compact transcript")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print the rounds, arguments and judgment of every debate (best with --dict_workers 1, as concurrent debates interleave)")
+    parser.add_argument("--prompt_dir", default=None, help="Directory holding the local copies of the hub prompts (default: ./prompts)")
+    parser.add_argument("--offline_prompts", action="store_true", help="Read agent prompts only from the local copies, never from the LangChain Hub")
+    parser.add_argument("--llm_cache", default=None, help="SQLite file used to cache LLM responses across runs")
+    parser.add_argument("--mmap_index", action="store_true", help="Memory-map the FAISS indexes instead of reading them into RAM")
+    parser.add_argument("--embedding_backend", choices=BACKENDS, default=None, help="Query embedding model family: openai or a local CPU model (default: openai); must match the index")
+    parser.add_argument("--embedding_model", default=None, help="Embedding model name (default: the backend's default model)")
+    parser.add_argument("--neighbors", nargs="+", default=[], metavar="SIDECAR",
+                        help="Neighbor sidecars built by build_neighbors.py for this dataset; their databases are not searched")
+    parser.add_argument("--embedding_cache", default=None, help="SQLite file caching query embeddings across runs and agents")
+    parser.add_argument("--telemetry", default=None, metavar="EVENTS.jsonl",
+                        help="Record latency, tokens and cost of every LLM call, retrieval and file write; a summary is printed at the end")
+    parser.add_argument("--trace", default=None, metavar="SINK",
+                        help="Trace the LLM calls of a sample of the rows to a JSONL file, a SQLite file (.db) or \"langsmith\"")
+    parser.add_argument("--trace_sample", type=float, default=None, help="Fraction of the rows traced with --trace (default: PREDICT_TRACE_SAMPLE or 0.01)")
+    return parser.parse_args()
+
+class DebateScheduler:
+    def __init__(self, config, save_file_dir, workers=4, agreement_threshold=None, **debate_options):
+        """
+        Run debates in the background while the PRE phase keeps streaming
+
+        At most `workers * 2` debates are queued, so a slow DICT phase pauses the
+        PRE phase instead of piling rows up in memory.
+
+        Args:
+            config (dict): Debate prompt configuration loaded from debate_prompt.json
+            save_file_dir (str): Directory to save debate results
+            workers (int): Number of debates running at the same time
+            agreement_threshold (int): Number of agreeing PRE votes that skips the debate (None debates every row)
+            **debate_options: Debate settings (max_round, early_stop, stagnation_ratio, compact_history, verbose)
+        """
+        self.config = config
+        self.agreement_threshold = agreement_threshold
+        self.debate_options = debate_options
+        self.save_file_dir = save_file_dir
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.Semaphore(workers * 2)
+        self.lock = threading.Lock()
+        self.finished = 0
+        self.triaged = 0
+        self.failed = []
+
+    def submit(self, id, row):
+        if is_finished(self.save_file_dir, id):
+            return
+        decision = triage_decision(row, self.agreement_threshold)
+        if decision is not None:
+            # Settled by the PRE vote: no LLM call, so no need for a worker
+            save_triaged(id, row, decision, self.save_file_dir)
+            self.triaged += 1
+            return
+        self.slots.acquire()
+        future = self.executor.submit(run_debate, id, row, self.config, self.save_file_dir, **self.debate_options)
+        future.add_done_callback(lambda future: self._done(id, future))
+
+    def _done(self, id, future):
+        self.slots.release()
+        with self.lock:
+            if future.exception() is not None:
+                self.failed.append(id)
+            else:
+                self.finished += 1
+        if future.exception() is not None:
+            print(f"Debate {id} failed: {future.exception()}")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+def run_pre_chunk(chunk, agents, executor):
+    """
+    Run the PRE agents on one chunk and return it with the <agent>_Label / <agent>_Reason columns
+
+    Returns:
+        tuple[pd.DataFrame, list]: the rows every agent answered, and the ids of the rows
+        where at least one agent failed after its whole retry budget
+    """
+    if any(agent['database'] not in main_pre.neighbor_sidecars for agent in agents):
+        prefetch_embeddings(list(chunk['text']))
+    results = list(executor.map(lambda row: process_row(row[1], agents, row[0]), chunk['text'].items()))
+    for k, agent in enumerate(agents):
+        responses = [row_results[k] or {} for row_results in results]
+        chunk[f"{agent['name']}_Label"] = [response.get('Label') for response in responses]
+        chunk[f"{agent['name']}_Reason"] = [response.get('Reason') for response in responses]
+    answered = [all(response is not None for response in row_results) for row_results in results]
+    return chunk[answered], list(chunk.index[[not ok for ok in answered]])
+
+def written_ids(reference_path, chunksize=1000):
+    """
+    Yield (id, row) for every row of a reference.csv written by the pipeline
+
+    Files written before the id column was added hold every row in input order.
+    """
+    position = 0
+    for chunk in pd.read_csv(reference_path, chunksize=chunksize):
+        if 'id' in chunk.columns:
+            chunk = chunk.set_index('id')
+        else:
+            chunk.index = range(position, position + len(chunk))
+        position += len(chunk)
+        yield from chunk.iterrows()
+
+def run_pipeline(input_path, output_dir, agents, criteria, config, chunksize=1000, pre_workers=8, dict_workers=4,
+                 agreement_threshold=None, **debate_options):
+    """
+    Stream the dataset chunk by chunk through PRE, the vote aggregation and DICT
+
+    Each chunk is appended to PRE_to_DICT/reference.csv as soon as its PRE
+    votes are aggregated, and its debates start right away in the background
+    while the next chunk goes through the PRE agents. The rows and responses in
+    memory are bounded by the chunk size and the debate queue; a resumed run
+    also keeps the ids of the rows already written. (build_neighbors.py, run
+    beforehand for --neighbors, still loads every text of the dataset.)
+
+    reference.csv has an `id` column with the row position in the input, and
+    holds only the rows every PRE agent answered. A restarted run processes
+    the rows not in reference.csv, so the rows whose PRE calls failed are tried
+    again, and reruns every debate without a successful result.
+
+    Args:
+        input_path (str): Path to input CSV dataset
+        output_dir (str): Output directory (e.g., output/Dataset_A)
+        agents (list[dict]): Agents with 'name', 'prompt' and 'database' keys
+        criteria (dict): Hate / not-hate labels of each agent
+        config (dict): Debate prompt configuration loaded from debate_prompt.json
+        chunksize (int): Number of input rows read and processed at a time
+        pre_workers (int): Number of rows going through the PRE agents at the same time
+        dict_workers (int): Number of debates running at the same time
+        agreement_threshold (int): Number of agreeing PRE votes that skips the debate (None debates every row)
+        **debate_options: Debate settings (max_round, early_stop, stagnation_ratio, compact_history, verbose)
+    """
+    reference_dir = os.path.join(output_dir, 'PRE_to_DICT')
+    save_file_dir = os.path.join(output_dir, 'DICT')
+    os.makedirs(reference_dir, exist_ok=True)
+    os.makedirs(save_file_dir, exist_ok=True)
+    reference_path = os.path.join(reference_dir, 'reference.csv')
+    columns = output_columns(list(criteria))
+
+    for database in {agent['database'] for agent in agents}:
+        if database in main_pre.neighbor_sidecars:
+            texts = (text for chunk in pd.read_csv(input_path, chunksize=chunksize) for text in chunk['text'])
+            main_pre.neighbor_sidecars[database].check(texts)
+        else:
+            init_vectorstore(database)
+
+    debates = DebateScheduler(config, save_file_dir, workers=dict_workers, agreement_threshold=agreement_threshold,
+                              **debate_options)
+    pre_executor = ThreadPoolExecutor(max_workers=pre_workers)
+    pre_failed = []
+    try:
+        # Resume: rows already aggregated only need their unfinished debates
+        done = set()
+        if os.path.exists(reference_path):
+            for id, row in written_ids(reference_path, chunksize):
+                debates.submit(id, row)
+                done.add(id)
+            print(f"Resuming: {len(done)} rows already in {reference_path}")
+
+        start = 0
+        with tqdm(desc="rows") as progress:
+            for chunk in pd.read_csv(input_path, chunksize=chunksize):
+                chunk.index = range(start, start + len(chunk))
+                start += len(chunk)
+                chunk = chunk[~chunk.index.isin(done)]
+                if chunk.empty:
+                    continue
+                answered, failed = run_pre_chunk(chunk.copy(), agents, pre_executor)
+                pre_failed += failed
+                if not answered.empty:
+                    answered = aggregate_votes(answered, criteria)
+                    answered.index.name = 'id'
+                    with span("write", file=reference_path, rows=len(answered)):
+                        answered[columns].to_csv(reference_path, mode='a', header=not os.path.exists(reference_path))
+                    for id, row in answered.iterrows():
+                        debates.submit(id, row)
+                progress.update(len(chunk))
+    finally:
+        pre_executor.shutdown(wait=True)
+        debates.shutdown()
+    if pre_failed:
+        print(f"{len(pre_failed)} rows without an answer from every PRE agent were left out of {reference_path} "
+              f"and will be retried on the next run: {pre_failed}")
+    print(f"{debates.finished} debates finished, {debates.triaged} rows settled by the PRE vote, "
+          f"{len(debates.failed)} failed: {debates.failed}")
+
+if __name__ == "__main__":
+    args = parse_args()
+    configure_prompt_registry(prompt_dir=args.prompt_dir, offline=args.offline_prompts or None)
+    configure_response_cache(args.llm_cache)
+    configure_vectorstore(mmap=args.mmap_index or None)
+    configure_embeddings(backend=args.embedding_backend, model_name=args.embedding_model, cache_path=args.embedding_cache)
+    if args.telemetry:
+        configure_telemetry(args.telemetry)
+    if args.trace:
+        configure_tracing(args.trace, args.trace_sample)
+    for path in args.neighbors:
+        sidecar = NeighborSidecar(path)
+        main_pre.neighbor_sidecars[sidecar.database] = sidecar
+    main_pre.rag_executor = DeadlineExecutor(max_workers=args.pre_workers, max_attempts=MAX_RETRIES,
+                                             attempt_timeout=ATTEMPT_TIMEOUT, row_deadline=ROW_DEADLINE, retry_wait=WAIT_TIME)
+
+    criteria = load_criteria(args.criteria)
+    agents = [parse_agent_spec(spec, args.database_name) for spec in args.agents]
+    unknown = [agent['name'] for agent in agents if agent['name'] not in criteria]
+    if unknown or len(agents) != len(criteria):
+        raise SystemExit(f"--agents must name exactly the agents in {args.criteria}: {list(criteria)} (unknown: {unknown})")
+    # Keep the agents in the order of the criteria file, which is the column order of reference.csv
+    agents.sort(key=lambda agent: list(criteria).index(agent['name']))
+
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src/utils", "debate_prompt.json")
+    with open(config_path, "r", encoding='utf-8') as config_file:
+        config = json.load(config_file)
+
+    run_pipeline(args.input, args.output, agents, criteria, config,
+                 chunksize=args.chunksize, pre_workers=args.pre_workers, dict_workers=args.dict_workers,
+                 agreement_threshold=args.agreement_threshold, max_round=args.max_round, early_stop=not args.no_early_stop,
+                 stagnation_ratio=args.stagnation_ratio, compact_history=not args.raw_judge_history, verbose=args.verbose)
+    main_pre.rag_executor.shutdown()
+    print(main_pre.rag_executor.report())
+    print_cache_stats()
+    print_embedding_stats()
+    print_key_stats()
+    print_telemetry_stats()
+    print_trace_stats()
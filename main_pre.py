@@ -2,16 +2,32 @@ import os
 import json
 import pandas as pd
 import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import subprocess
 from config.environment import set_environment_variables
-from src.utils.retriever import RAG, init_vectorstore
+from src.utils.retriever import RAG, init_vectorstore, retrieve_documents, configure_vectorstore
+from src.utils.prompt_registry import configure_prompt_registry
+from src.utils.llm_cache import configure_response_cache, print_cache_stats
+from src.utils.journal import ResultJournal
+from src.utils.key_pool import print_key_stats
+from src.utils.executor import DeadlineExecutor
+from src.utils.embeddings import BACKENDS, configure_embeddings, get_embeddings, print_embedding_stats
+from src.utils.neighbors import NeighborSidecar
+from src.utils.telemetry import configure_telemetry, print_telemetry_stats, span, labelled
+from src.utils.tracing import configure_tracing, print_trace_stats
+from src.utils.dedup import MODES as DEDUP_MODES, find_duplicates, dedup_summary
 import time
 
 # Maximum retry attempts for RAG API calls during dataset processing
 MAX_RETRIES = 3
 # Waiting time between API call retry attempts
 WAIT_TIME = 5
+# Seconds a single RAG attempt may take
+ATTEMPT_TIMEOUT = 30
+# Seconds all the calls for one row may take together
+ROW_DEADLINE = 120
 
 # def parse_args():
 #     # CLI argument parser for flexible dataset processing configuration
@@ -30,9 +46,35 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Process hate speech datasets using RAG with multi-agent perspectives",
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("-i", "--input", required=True, help="Path to input hate speech dataset (CSV)")
-    parser.add_argument("-o", "--output", required=True, help="Path to save RAG processed results (JSON)")
-    parser.add_argument("-d", "--database_name", required=True, help="Specify the embedding vector source for retrieval (e.g., Unsmile)")
-    parser.add_argument("-a", "--agent_name", required=True, help="Prompt_Specify agent persona for analysis (e.g., someen/unsmile)")
+    parser.add_argument("-o", "--output", required=True, help="Path to save RAG processed results (JSON, or a directory with --agents)")
+    parser.add_argument("-d", "--database_name", help="Specify the embedding vector source for retrieval (e.g., Unsmile)")
+    parser.add_argument("-a", "--agent_name", help="Prompt_Specify agent persona for analysis (e.g., someen/unsmile)")
+    parser.add_argument("--agents", nargs="+", metavar="NAME=PROMPT[@DATABASE]",
+                        help="Run several agents in one pass (e.g., Agent_A=someen/khaters@khaters). Results go to <output>/<NAME>.json")
+    parser.add_argument("--prompt_dir", default=None, help="Directory holding the local copies of the hub prompts (default: ./prompts)")
+    parser.add_argument("--offline_prompts", action="store_true", help="Read agent prompts only from the local copies, never from the LangChain Hub")
+    parser.add_argument("--llm_cache", default=None, help="SQLite file used to cache LLM responses across runs")
+    parser.add_argument("--llm_cache_max_mb", type=float, default=None, help="Evict least recently used cached responses above this size")
+    parser.add_argument("--llm_cache_read_only", action="store_true", help="Serve cached responses but never store new ones")
+    parser.add_argument("-c", "--concurrency", type=int, default=1, help="Number of RAG requests kept in flight (1 runs the serial loop)")
+    parser.add_argument("--max_attempts", type=int, default=MAX_RETRIES, help="Attempts allowed per RAG call, across timeouts and errors")
+    parser.add_argument("--attempt_timeout", type=float, default=ATTEMPT_TIMEOUT, help="Seconds a single RAG attempt may take")
+    parser.add_argument("--row_deadline", type=float, default=ROW_DEADLINE, help="Seconds all the calls for one row may take together")
+    parser.add_argument("--compact_every", type=int, default=10000, help="Number of journaled results between compactions into the output JSON")
+    parser.add_argument("--mmap_index", action="store_true", help="Memory-map the FAISS indexes instead of reading them into RAM")
+    parser.add_argument("--embedding_backend", choices=BACKENDS, default=None, help="Query embedding model family: openai or a local CPU model (default: openai); must match the index")
+    parser.add_argument("--embedding_model", default=None, help="Embedding model name (default: the backend's default model)")
+    parser.add_argument("--neighbors", nargs="+", default=[], metavar="SIDECAR",
+                        help="Neighbor sidecars built by build_neighbors.py for this dataset; their databases are not searched")
+    parser.add_argument("--embedding_cache", default=None, help="SQLite file caching query embeddings across runs and agents")
+    parser.add_argument("--telemetry", default=None, metavar="EVENTS.jsonl",
+                        help="Record latency, tokens and cost of every LLM call, retrieval and file write; a summary is printed at the end")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default=None,
+                        help="Classify one row per group of duplicate texts (exact: equal after normalization, near: also MinHash near-duplicates) and copy its results to the others")
+    parser.add_argument("--dedup_threshold", type=float, default=0.8, help="Estimated Jaccard similarity of near-duplicates with --dedup near")
+    parser.add_argument("--trace", default=None, metavar="SINK",
+                        help="Trace the LLM calls of a sample of the rows to a JSONL file, a SQLite file (.db) or \"langsmith\"")
+    parser.add_argument("--trace_sample", type=float, default=None, help="Fraction of the rows traced with --trace (default: PREDICT_TRACE_SAMPLE or 0.01)")
     return parser.parse_args()
 
 
@@ -44,6 +86,12 @@ def run_script(command):
 # Set up environment variables
 set_environment_variables()
 
+# Bounded worker pool that owns every RAG retry, timeout and deadline
+rag_executor = DeadlineExecutor(max_attempts=MAX_RETRIES, attempt_timeout=ATTEMPT_TIMEOUT, row_deadline=ROW_DEADLINE, retry_wait=WAIT_TIME)
+
+# Precomputed retrieval results by database (see build_neighbors.py); these databases are never searched
+neighbor_sidecars = {}
+
 def update_json_file(file_path, data_chunk):
     """
     Update a JSON file with new data chunks, creating it if it doesn't exist
@@ -58,35 +106,232 @@ def update_json_file(file_path, data_chunk):
     except (FileNotFoundError, json.JSONDecodeError):
         data = {}
     data.update(data_chunk)
-    with open(file_path, 'w', encoding='utf-8') as file:
+    with span("write", file=file_path, rows=len(data)), open(file_path, 'w', encoding='utf-8') as file:
         json.dump(data, file, indent=4, ensure_ascii=False)
 
-def call_api_with_retry(text, agent_name):
+def call_api_with_retry(text, agent_name, docs=None, database_name=None, deadline=None):
     """
     Call RAG API with retry mechanism
     
     Args:
         text (str): Input text for RAG
         agent_name (str): Name of the agent to use
+        docs (list, optional): Documents already retrieved for this text
+        database_name (str, optional): Embedding vector source the documents come from
+        deadline (float, optional): time.monotonic() deadline of the row
     
     Returns:
-        Response from RAG or None if all retries fail
-    """
-    retries = 0
-    while retries < MAX_RETRIES:
-        try:
-            # Attempt to call RAG API
-            response = RAG(text, agent_name)
-            return response
-        except Exception as e:
-            print(f"Error occurred: {e}")
-            retries += 1
-            print(f"Retrying... ({retries}/{MAX_RETRIES})")
-            time.sleep(WAIT_TIME)  # Wait before retrying
-    print("Max retries reached. Failed to call API.")
-    return None
-
-def process_dataset(dataset_path, output_path, database_name, agent_name, batch_size=10):
+        Response from RAG or None if the retry budget or the deadline is exhausted
+    """
+    outcome = rag_executor.call(RAG, text, agent_name, docs=docs, database_name=database_name, deadline=deadline)
+    if outcome.error is not None:
+        print(f"Failed to call API after {outcome.attempts} attempt(s): {outcome.error}")
+    return outcome.result
+
+def retrieve_with_retry(text, database_name, deadline=None):
+    """
+    Retrieve similar documents with retry mechanism
+
+    Args:
+        text (str): Input text for retrieval
+        database_name (str): Embedding vector source for retrieval
+        deadline (float, optional): time.monotonic() deadline of the row
+
+    Returns:
+        list: Retrieved documents or None if the retry budget or the deadline is exhausted
+    """
+    def retrieve(text, database_name, timeout):
+        # The embedding client enforces its own request timeout
+        return retrieve_documents(text, database_name)
+
+    outcome = rag_executor.call(retrieve, text, database_name, deadline=deadline)
+    if outcome.error is not None:
+        print(f"Failed to retrieve documents after {outcome.attempts} attempt(s): {outcome.error}")
+    return outcome.result
+
+def prefetch_embeddings(texts):
+    """
+    Embed the texts in batches before the rows are processed
+
+    Each row then finds its query embedding in the cache instead of sending
+    its own embedding request. On failure the rows embed their text themselves.
+    """
+    try:
+        get_embeddings().prefetch([str(text) for text in texts])
+    except Exception as e:
+        print(f"Embedding prefetch failed, embedding per row instead: {e}")
+
+def prepare_databases(databases, texts, pending_texts):
+    """
+    Get the databases ready for the rows: check the neighbor sidecars against the
+    dataset, load the databases without one and prefetch the query embeddings
+
+    Args:
+        databases (set[str]): Databases used by the agents
+        texts (iterable): Every text of the dataset, in order (iterated once per sidecar)
+        pending_texts (list[str]): Texts of the rows still to process
+    """
+    for database in databases:
+        if database in neighbor_sidecars:
+            neighbor_sidecars[database].check(texts)
+    searched = [database for database in databases if database not in neighbor_sidecars]
+    for database in searched:
+        init_vectorstore(database)
+    if searched:
+        prefetch_embeddings(pending_texts)
+
+def parse_agent_spec(spec, default_database=None):
+    """
+    Parse an agent specification of the form NAME=PROMPT[@DATABASE]
+
+    Args:
+        spec (str): Agent specification (e.g., Agent_E=someen/unsmile@Unsmile)
+        default_database (str, optional): Database used when the spec does not name one
+
+    Returns:
+        dict: Agent with 'name', 'prompt' and 'database' keys
+    """
+    name, _, prompt = spec.partition('=')
+    prompt, _, database = prompt.partition('@')
+    if not name or not prompt:
+        raise ValueError(f"Invalid agent specification: {spec} (expected NAME=PROMPT[@DATABASE])")
+    database = database or default_database
+    if not database:
+        raise ValueError(f"No database given for agent {name}. Use NAME=PROMPT@DATABASE or -d.")
+    return {'name': name, 'prompt': prompt, 'database': database}
+
+def process_row(text, agents, index=None):
+    """
+    Run every agent on a single text, retrieving documents once per database
+
+    Args:
+        text (str): Input text for RAG
+        agents (list[dict]): Agents with 'prompt' and 'database' keys
+        index (int, optional): Row position in the dataset, used to read the neighbor sidecars
+
+    Returns:
+        list: One response (or None) per agent, in the order of `agents`
+    """
+    # Every call for this row shares one deadline
+    deadline = rag_executor.deadline()
+    docs_by_database = {}
+    responses = []
+    with labelled(**({"row": str(index)} if index is not None else {})), span("row", agents=len(agents)):
+        for agent in agents:
+            database = agent['database']
+            if database not in docs_by_database:
+                if index is not None and database in neighbor_sidecars:
+                    docs_by_database[database] = neighbor_sidecars[database].context(index)
+                else:
+                    docs_by_database[database] = retrieve_with_retry(text, database, deadline=deadline)
+            docs = docs_by_database[database]
+            with labelled(agent=agent.get('name', agent['prompt'])):
+                responses.append(call_api_with_retry(text, agent['prompt'], docs=docs, database_name=database, deadline=deadline) if docs is not None else None)
+    return responses
+
+def open_journals(agents, compact_every=10000):
+    """
+    Open one result journal per agent, folding anything a previous run left behind
+
+    Args:
+        agents (list[dict]): Agents with an 'output' key
+        compact_every (int, optional): Number of results between compactions into the output JSON
+
+    Returns:
+        list[ResultJournal]: One journal per agent, in the order of `agents`
+    """
+    return [ResultJournal(agent['output'], compact_every=compact_every) for agent in agents]
+
+def pending_rows(length, journals):
+    """
+    List the rows that still miss a result for at least one agent
+
+    Returns:
+        list[tuple[int, list[int]]]: (row index, positions of the agents still to run) pairs
+    """
+    pending = []
+    for i in range(length):
+        todo = [k for k, journal in enumerate(journals) if str(i) not in journal.done]
+        if todo:
+            pending.append((i, todo))
+    skipped = length - len(pending)
+    if skipped:
+        print(f"Resuming: {skipped}/{length} rows already have a result for every agent")
+    return pending
+
+def dedup_pending(texts, pending, mode, threshold=0.8):
+    """
+    Keep one pending row per group of duplicate texts
+
+    A duplicate is left out when the first text of its group is pending for
+    the same agents; it then gets a copy of that row's responses.
+
+    Args:
+        texts (pd.Series): Every text of the dataset, in order
+        pending (list[tuple[int, list[int]]]): (row index, positions of the agents still to run) pairs
+        mode (str): "exact" or "near" (see src.utils.dedup.find_duplicates)
+        threshold (float): Estimated Jaccard similarity of near-duplicates
+
+    Returns:
+        tuple[list, dict]: the pending rows to process, and the (row index, agents) pairs
+        copying each processed row, by its index
+    """
+    representatives = find_duplicates(texts, mode, threshold)
+    print(dedup_summary(representatives, mode))
+    todo_by_row = {i: set(todo) for i, todo in pending}
+    kept, followers = [], {}
+    for i, todo in pending:
+        representative = representatives[i]
+        if representative != i and set(todo) <= todo_by_row.get(representative, set()):
+            followers.setdefault(representative, []).append((i, todo))
+        else:
+            kept.append((i, todo))
+    copied = [todo for copies in followers.values() for _, todo in copies]
+    print(f"Dedup: {len(copied)}/{len(pending)} pending rows copy a duplicate's responses ({sum(map(len, copied))} agent calls saved)")
+    return kept, followers
+
+def journal_row(journals, i, todo, responses, followers=None):
+    """Append the responses of a row, and of the duplicates copying it, to the agent journals"""
+    by_agent = dict(zip(todo, responses))
+    for index, agents_todo in [(i, todo), *(followers or {}).get(i, [])]:
+        for k in agents_todo:
+            if by_agent.get(k):
+                # Store response with index as key
+                journals[k].append(str(index), by_agent[k])
+
+def process_agents(dataset_path, agents, compact_every=10000, dedup=None, dedup_threshold=0.8):
+    """
+    Process a dataset once, fanning every row out to all agents
+
+    The dataset is read once, each database is loaded once and retrieval
+    runs once per (database, text) pair. Results are appended to a journal
+    per agent, and rows that already have a result are skipped, so a killed
+    run resumes where it stopped.
+
+    Args:
+        dataset_path (str): Path to input CSV dataset
+        agents (list[dict]): Agents with 'prompt', 'database' and 'output' keys
+        compact_every (int, optional): Number of results between compactions into the output JSON
+        dedup (str, optional): "exact" or "near" to process one row per group of duplicate texts
+        dedup_threshold (float, optional): Estimated Jaccard similarity of near-duplicates
+    """
+    dataset = pd.read_csv(dataset_path)
+    texts = dataset['text']
+    journals = open_journals(agents, compact_every)
+    pending = pending_rows(len(dataset), journals)
+    followers = {}
+    if dedup:
+        pending, followers = dedup_pending(texts, pending, dedup, dedup_threshold)
+    prepare_databases({agent['database'] for agent in agents}, texts, [texts[i] for i, _ in pending])
+    try:
+        for i, todo in tqdm(pending):
+            responses = process_row(texts[i], [agents[k] for k in todo], i)
+            journal_row(journals, i, todo, responses, followers)
+    finally:
+        for journal in journals:
+            journal.close()
+
+def process_dataset(dataset_path, output_path, database_name, agent_name, compact_every=10000, dedup=None, dedup_threshold=0.8):
     """
     Process a dataset by applying RAG to each text entry
 
@@ -95,25 +340,134 @@ def process_dataset(dataset_path, output_path, database_name, agent_name, batch_
         output_path (str): Path to save processed results
         database_name (str): Embedding vector source for retrieval
         agent_name (str): Specific agent persona for analysis
-        batch_size (int, optional): Number of entries to process before writing to file
+        compact_every (int, optional): Number of results between compactions into the output JSON
+        dedup (str, optional): "exact" or "near" to process one row per group of duplicate texts
+        dedup_threshold (float, optional): Estimated Jaccard similarity of near-duplicates
+    """
+    agents = [{'prompt': agent_name, 'database': database_name, 'output': output_path}]
+    process_agents(dataset_path, agents, compact_every=compact_every, dedup=dedup, dedup_threshold=dedup_threshold)
+
+async def process_agents_async(dataset_path, agents, compact_every=10000, concurrency=8, dedup=None, dedup_threshold=0.8):
+    """
+    Process a dataset with up to `concurrency` rows in flight
+
+    Rows are fed to the workers through a bounded queue. Finished rows are
+    journaled in index order, so the output JSON is identical to the one
+    produced by process_agents.
+
+    Args:
+        dataset_path (str): Path to input CSV dataset
+        agents (list[dict]): Agents with 'prompt', 'database' and 'output' keys
+        compact_every (int, optional): Number of results between compactions into the output JSON
+        concurrency (int, optional): Number of rows kept in flight
+        dedup (str, optional): "exact" or "near" to process one row per group of duplicate texts
+        dedup_threshold (float, optional): Estimated Jaccard similarity of near-duplicates
     """
     dataset = pd.read_csv(dataset_path)
-    length = len(dataset)
-    init_vectorstore(database_name)
-    data_chunk = {}
-    for i in tqdm(range(length)):
-        # Call RAG with retry mechanism
-        response = call_api_with_retry(dataset['text'][i], agent_name)
-        if response:
-            # Store response with index as key
-            data_chunk[str(i)] = response
-        # Write to file in batches or at the end
-        if (i + 1) % batch_size == 0 or i == length - 1:
-            update_json_file(output_path, data_chunk)
-            data_chunk = {}
+    texts = dataset['text']
+    journals = open_journals(agents, compact_every)
+    pending = pending_rows(len(dataset), journals)
+    followers = {}
+    if dedup:
+        pending, followers = dedup_pending(texts, pending, dedup, dedup_threshold)
+    prepare_databases({agent['database'] for agent in agents}, texts, [texts[i] for i, _ in pending])
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    progress = tqdm(total=len(pending))
+
+    # Finished rows waiting for all earlier pending rows before they can be journaled
+    completed = {}
+    state = {'next': 0}
+
+    def flush_in_order():
+        while state['next'] in completed:
+            i, todo = pending[state['next']]
+            journal_row(journals, i, todo, completed.pop(state['next']), followers)
+            state['next'] += 1
+
+    async def producer():
+        for position in range(len(pending)):
+            await queue.put(position)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker():
+        while True:
+            position = await queue.get()
+            if position is None:
+                break
+            i, todo = pending[position]
+            # process_row blocks, so it runs on the executor threads
+            completed[position] = await loop.run_in_executor(executor, process_row, texts[i], [agents[k] for k in todo], i)
+            progress.update(1)
+            flush_in_order()
+
+    try:
+        await asyncio.gather(producer(), *(worker() for _ in range(concurrency)))
+    finally:
+        executor.shutdown(wait=True)
+        progress.close()
+        for journal in journals:
+            journal.close()
+
+async def process_dataset_async(dataset_path, output_path, database_name, agent_name, compact_every=10000, concurrency=8,
+                                dedup=None, dedup_threshold=0.8):
+    """
+    Process a dataset with up to `concurrency` RAG requests in flight
+
+    Args:
+        dataset_path (str): Path to input CSV dataset
+        output_path (str): Path to save processed results
+        database_name (str): Embedding vector source for retrieval
+        agent_name (str): Specific agent persona for analysis
+        compact_every (int, optional): Number of results between compactions into the output JSON
+        concurrency (int, optional): Number of RAG requests kept in flight
+        dedup (str, optional): "exact" or "near" to process one row per group of duplicate texts
+        dedup_threshold (float, optional): Estimated Jaccard similarity of near-duplicates
+    """
+    agents = [{'prompt': agent_name, 'database': database_name, 'output': output_path}]
+    await process_agents_async(dataset_path, agents, compact_every=compact_every, concurrency=concurrency,
+                               dedup=dedup, dedup_threshold=dedup_threshold)
 
 
 if __name__ == "__main__":
     # Parse command-line arguments for dataset processing
     args = parse_args()
-    process_dataset(args.input, args.output, args.database_name, args.agent_name)
+    configure_prompt_registry(prompt_dir=args.prompt_dir, offline=args.offline_prompts or None)
+    configure_response_cache(args.llm_cache, max_size_mb=args.llm_cache_max_mb, read_only=args.llm_cache_read_only)
+    configure_vectorstore(mmap=args.mmap_index or None)
+    configure_embeddings(backend=args.embedding_backend, model_name=args.embedding_model, cache_path=args.embedding_cache)
+    if args.telemetry:
+        configure_telemetry(args.telemetry)
+    if args.trace:
+        configure_tracing(args.trace, args.trace_sample)
+    for path in args.neighbors:
+        sidecar = NeighborSidecar(path)
+        neighbor_sidecars[sidecar.database] = sidecar
+    rag_executor = DeadlineExecutor(max_workers=max(args.concurrency, 1), max_attempts=args.max_attempts,
+                                    attempt_timeout=args.attempt_timeout, row_deadline=args.row_deadline, retry_wait=WAIT_TIME)
+    if args.agents:
+        # Fan-out mode: --output is a directory holding one <NAME>.json per agent
+        os.makedirs(args.output, exist_ok=True)
+        agents = [parse_agent_spec(spec, args.database_name) for spec in args.agents]
+        for agent in agents:
+            agent['output'] = os.path.join(args.output, f"{agent['name']}.json")
+    elif args.agent_name and args.database_name:
+        agents = [{'prompt': args.agent_name, 'database': args.database_name, 'output': args.output}]
+    else:
+        raise SystemExit("Either -a/--agent_name with -d/--database_name, or --agents is required")
+
+    if args.concurrency > 1:
+        asyncio.run(process_agents_async(args.input, agents, compact_every=args.compact_every, concurrency=args.concurrency,
+                                         dedup=args.dedup, dedup_threshold=args.dedup_threshold))
+    else:
+        process_agents(args.input, agents, compact_every=args.compact_every, dedup=args.dedup, dedup_threshold=args.dedup_threshold)
+    rag_executor.shutdown()
+    print(rag_executor.report())
+    print_cache_stats()
+    print_embedding_stats()
+    print_key_stats()
+    print_telemetry_stats()
+    print_trace_stats()
@@ -1,101 +1,118 @@
 import os
 import json
+import numpy as np
 import pandas as pd
 import argparse
 
-def agent_concat_5(data_name, evaluation_data):
-    # Define agent names (A through E)
-    agent_names = ['A', 'B', 'C', 'D', 'E']
-    
-    # Load ground truth data from CSV file
-    gt_data_path = f'Dataset/{data_name}/{data_name}_sample.csv'
-    gt_df = pd.read_csv(gt_data_path)
-    
-    # Read and combine prediction results from each agent's JSON file
-    for agent in agent_names:
-        predict_file_path = f'output/Dataset_{evaluation_data}/PRE/Agent_{agent}.json'
-        
-        # Load JSON data from each agent's prediction file
-        with open(predict_file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        
-        # Parse JSON data and add predictions to the main dataframe
-        for index, row in gt_df.iterrows():
-            key = str(index)  # Convert index to string for JSON key matching
-            if key in data:   # Check if the key exists in JSON data
-                item = data[key]
-                gt_df.loc[index, f'Agent_{agent}_Label'] = item['Label']
-                gt_df.loc[index, f'Agent_{agent}_Reason'] = item['Reason']
-
-    # Define classification criteria for each agent
-    hate_criteria = {
-        'Agent_A': ['Offensive'],
-        'Agent_B': ['Hate Speech'],
-        'Agent_C': ['Offensive'],
-        'Agent_D': ['Offensive'],
-        'Agent_E': ['Hate Speech']
-    }
-    not_hate_criteria = {
-        'Agent_A': ['Not Offensive'],
-        'Agent_B': ['Not Hate Speech'],
-        'Agent_C': ['Not Offensive'],
-        'Agent_D': ['Not Offensive'],
-        'Agent_E': ['Not Hate Speech']
-    }
+# Default location of the hate / not-hate label criteria for each agent
+CRITERIA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'label_criteria.json')
+
+def load_criteria(criteria_path=CRITERIA_PATH):
+    # Load {agent: {"hate": [labels], "not_hate": [labels]}}; the order of the agents is kept
+    with open(criteria_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def load_agent_predictions(gt_df, agent, predict_file_path):
+    # Load JSON data from the agent's prediction file
+    with open(predict_file_path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+
+    # Align predictions with the dataframe rows (JSON keys are the row indices as strings)
+    keys = gt_df.index.astype(str)
+    predictions = pd.DataFrame.from_dict(data, orient='index', columns=['Label', 'Reason']).reindex(keys)
+    missing = ~keys.isin(list(data.keys()))
+    for field in ['Label', 'Reason']:
+        values = predictions[field].to_numpy(dtype=object)
+        if missing.any() and not missing.all():
+            # Rows missing from the JSON must keep the value the former per-cell writes gave them, so
+            # reference.csv (and every debate prompt built from it) stays byte for byte the same.
+            # `gt_df.loc[index, column] = value` on a new column made pandas 2.1 build it as a numpy
+            # fixed-width string array ('<U<len(value)>') and cast NaN into the other cells, so they
+            # hold str(nan) cut to the length of the first value written: 'nan', or 'na' / 'n' when
+            # that value is shorter than three characters.
+            first = values[np.argmax(~missing)]
+            if isinstance(first, str):
+                values[missing] = 'nan'[:max(1, len(first))]
+        gt_df[f'{agent}_{field}'] = values
+
+def join_reasons(gt_df, agents, masks):
+    # Join the reasons of the agents selected by `masks` with a space, in agent order
+    joined = pd.Series('', index=gt_df.index, dtype=object)
+    started = pd.Series(False, index=gt_df.index)
+    for agent in agents:
+        mask = masks[agent]
+        separator = np.where(started, ' ', '')
+        joined = joined.where(~mask, joined + separator + gt_df[f'{agent}_Reason'])
+        started = started | mask
+    return joined
+
+def aggregate_votes(gt_df, criteria):
+    """
+    Add the vote counts, the majority label and the combined reasons to a dataframe
+    holding the <agent>_Label and <agent>_Reason columns of every agent in `criteria`.
+    """
+    agents = list(criteria)
 
     # Calculate binary indicators for hate and non-hate predictions
-    for agent in agent_names:
-        full_agent_name = f'Agent_{agent}'
-        gt_df[f'{full_agent_name}_Hate'] = gt_df[f'{full_agent_name}_Label'].apply(
-            lambda x: x in hate_criteria[full_agent_name]
-        )
-        gt_df[f'{full_agent_name}_Not_Hate'] = gt_df[f'{full_agent_name}_Label'].apply(
-            lambda x: x in not_hate_criteria[full_agent_name]
-        )
+    hate_masks = {agent: gt_df[f'{agent}_Label'].isin(criteria[agent]['hate']) for agent in agents}
+    not_hate_masks = {agent: gt_df[f'{agent}_Label'].isin(criteria[agent]['not_hate']) for agent in agents}
 
     # Sum up total hate and non-hate votes from all agents
-    gt_df['Hate_count'] = gt_df[[f'Agent_{agent}_Hate' for agent in agent_names]].sum(axis=1)
-    gt_df['Not_Hate_count'] = gt_df[[f'Agent_{agent}_Not_Hate' for agent in agent_names]].sum(axis=1)
+    gt_df['Hate_count'] = pd.DataFrame(hate_masks).sum(axis=1)
+    gt_df['Not_Hate_count'] = pd.DataFrame(not_hate_masks).sum(axis=1)
 
     # Determine final label based on majority vote
-    gt_df['Final_Label'] = gt_df.apply(lambda x: '혐오' if x['Hate_count'] > x['Not_Hate_count'] else '비혐오', axis=1)
+    gt_df['Final_Label'] = np.where(gt_df['Hate_count'] > gt_df['Not_Hate_count'], '혐오', '비혐오')
 
     # Combine reasoning from agents based on their classifications
-    gt_df['Hate_Reason'] = ''
-    gt_df['Not_Hate_Reason'] = ''
-    for index, row in gt_df.iterrows():
-        hate_explain = []
-        not_hate_explain = []
-        for agent in agent_names:
-            full_agent_name = f'Agent_{agent}'
-            label = row[f'{full_agent_name}_Label']
-            if label in hate_criteria[full_agent_name]:
-                hate_explain.append(row[f'{full_agent_name}_Reason'])
-            elif label in not_hate_criteria[full_agent_name]:
-                not_hate_explain.append(row[f'{full_agent_name}_Reason'])
-        gt_df.at[index, 'Hate_Reason'] = ' '.join(hate_explain)
-        gt_df.at[index, 'Not_Hate_Reason'] = ' '.join(not_hate_explain)
+    gt_df['Hate_Reason'] = join_reasons(gt_df, agents, hate_masks)
+    # A label in both lists counts as hate only, as in the original per-row loop
+    gt_df['Not_Hate_Reason'] = join_reasons(gt_df, agents, {agent: not_hate_masks[agent] & ~hate_masks[agent] for agent in agents})
+    return gt_df
 
+def output_columns(agents):
     # Select and organize final columns for output
     base_columns = ['text', 'label']
-    label_explain_columns = [f'Agent_{agent}_Label' for agent in agent_names] + [f'Agent_{agent}_Reason' for agent in agent_names]
+    label_explain_columns = [f'{agent}_Label' for agent in agents] + [f'{agent}_Reason' for agent in agents]
     additional_columns = ['Hate_count', 'Not_Hate_count', 'Final_Label', 'Hate_Reason', 'Not_Hate_Reason']
-    final_columns = base_columns + label_explain_columns + additional_columns
-    
+    return base_columns + label_explain_columns + additional_columns
+
+def agent_concat(data_name, evaluation_data, criteria_path=CRITERIA_PATH):
+    # Agents and their label criteria (e.g., Agent_A: Offensive / Not Offensive)
+    criteria = load_criteria(criteria_path)
+    agents = list(criteria)
+
+    # Load ground truth data from CSV file
+    gt_data_path = f'Dataset/{data_name}/{data_name}_sample.csv'
+    gt_df = pd.read_csv(gt_data_path)
+
+    # Read and combine prediction results from each agent's JSON file
+    for agent in agents:
+        predict_file_path = f'output/Dataset_{evaluation_data}/PRE/{agent}.json'
+        load_agent_predictions(gt_df, agent, predict_file_path)
+
+    gt_df = aggregate_votes(gt_df, criteria)
+    final_columns = output_columns(agents)
+
     # Create output directory and save results to CSV
     output_dir = f'output/Dataset_{evaluation_data}/PRE_to_DICT/'
     os.makedirs(output_dir, exist_ok=True)
     output_path = f'{output_dir}/reference.csv'
     gt_df[final_columns].to_csv(output_path, index=False)
-    
+
     return gt_df[final_columns]
 
+def agent_concat_5(data_name, evaluation_data):
+    # The five agents (A through E) defined in config/label_criteria.json
+    return agent_concat(data_name, evaluation_data)
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Combine and process agent outputs for hate speech detection.")
     parser.add_argument("-d", "--data-name", required=True, help="Name of the dataset directory (e.g., 'khaters')")
     parser.add_argument("-e", "--evaluation-data", required=True, help="Type of evaluation data being processed (e.g., 'A')")
+    parser.add_argument("-c", "--criteria", default=CRITERIA_PATH, help="JSON file with the hate / not-hate labels of each agent")
     return parser.parse_args()
 
 if __name__ == "__main__":
     args = parse_args()
-    result = agent_concat_5(args.data_name, args.evaluation_data)
+    result = agent_concat(args.data_name, args.evaluation_data, args.criteria)
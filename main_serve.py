@@ -0,0 +1,360 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import pandas as pd
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import main_pre
+from main_pre import parse_agent_spec, process_row, WAIT_TIME, MAX_RETRIES, ATTEMPT_TIMEOUT, ROW_DEADLINE
+from main_pre_to_dict import CRITERIA_PATH, load_criteria, aggregate_votes
+from main_dict import debate_row
+from src.utils.result_store import get_result_store
+from src.utils.executor import DeadlineExecutor
+from src.utils.retriever import DEFAULT_MODEL_NAME, init_vectorstore, configure_vectorstore, get_rag_chain, get_llm
+from src.utils.prompt_registry import configure_prompt_registry
+from src.utils.llm_cache import configure_response_cache, print_cache_stats
+from src.utils.key_pool import get_key_pool, print_key_stats
+from src.utils.embeddings import BACKENDS, configure_embeddings, get_embeddings, print_embedding_stats
+from src.utils.openai_utils import num_tokens_from_string
+from src.utils.telemetry import configure_telemetry, print_telemetry_stats, labelled
+from src.utils.tracing import configure_tracing, print_trace_stats
+
+# Characters allowed in a request id (the others are replaced by _)
+UNSAFE_ID_PATTERN = re.compile(r"[^\w.-]")
+
+def parse_args():
+    # CLI argument parser for the classification service
+    parser = argparse.ArgumentParser(description="Keep the PREDICT agents warm and classify texts sent over HTTP or stdin JSONL",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--agents", nargs="+", required=True, metavar="NAME=PROMPT[@DATABASE]",
+                        help="PRE agents (e.g., Agent_A=someen/khaters@khaters). NAME must match an agent in the criteria file")
+    parser.add_argument("-d", "--database_name", help="Database for agents that do not name one")
+    parser.add_argument("--criteria", default=CRITERIA_PATH, help="JSON file with the hate / not-hate labels of each agent")
+    parser.add_argument("-o", "--output", default="output/serve", help="Directory of the result store holding the debate results of the requests")
+    parser.add_argument("--stdin", action="store_true", help="Read {\"id\", \"text\"} lines from stdin and write one result line per text to stdout instead of serving HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Address the HTTP service listens on")
+    parser.add_argument("--port", type=int, default=8080, help="Port the HTTP service listens on")
+    parser.add_argument("--workers", type=int, default=8, help="Number of texts classified at the same time")
+    parser.add_argument("--agreement_threshold", type=int, default=None,
+                        help="Label texts with at least this many agreeing PRE votes from the vote, without a debate")
+    parser.add_argument("--max_round", type=int, default=2, help="Maximum number of debate rounds")
+    parser.add_argument("--prompt_dir", default=None, help="Directory holding the local copies of the hub prompts (default: ./prompts)")
+    parser.add_argument("--offline_prompts", action="store_true", help="Read agent prompts only from the local copies, never from the LangChain Hub")
+    parser.add_argument("--llm_cache", default=None, help="SQLite file used to cache LLM responses across runs")
+    parser.add_argument("--mmap_index", action="store_true", help="Memory-map the FAISS indexes instead of reading them into RAM")
+    parser.add_argument("--embedding_backend", choices=BACKENDS, default=None, help="Query embedding model family: openai or a local CPU model (default: openai); must match the index")
+    parser.add_argument("--embedding_model", default=None, help="Embedding model name (default: the backend's default model)")
+    parser.add_argument("--embedding_cache", default=None, help="SQLite file caching query embeddings across runs and agents")
+    parser.add_argument("--telemetry", default=None, metavar="EVENTS.jsonl",
+                        help="Record latency, tokens and cost of every LLM call, retrieval and file write; a summary is printed on shutdown")
+    parser.add_argument("--trace", default=None, metavar="SINK",
+                        help="Trace the LLM calls of a sample of the rows to a JSONL file, a SQLite file (.db) or \"langsmith\"")
+    parser.add_argument("--trace_sample", type=float, default=None, help="Fraction of the rows traced with --trace (default: PREDICT_TRACE_SAMPLE or 0.01)")
+    return parser.parse_args()
+
+class PredictService:
+    def __init__(self, agents, criteria, config, save_file_dir, workers=8, agreement_threshold=None, **debate_options):
+        """
+        The whole PREDICT pipeline for one text at a time, loaded once
+
+        The FAISS indexes, the agent prompts and RAG chains, the embedding model and
+        the OpenAI clients stay in memory between requests, so a request only pays
+        for its own retrievals and LLM calls.
+
+        Args:
+            agents (list[dict]): Agents with 'name', 'prompt' and 'database' keys, in the order of the criteria file
+            criteria (dict): Hate / not-hate labels of each agent
+            config (dict): Debate prompt configuration loaded from debate_prompt.json
+            save_file_dir (str): Directory to save the debate results of the requests
+            workers (int): Number of texts classified at the same time
+            agreement_threshold (int): Number of agreeing PRE votes that skips the debate (None debates every text)
+            **debate_options: Debate settings (max_round, early_stop, stagnation_ratio, compact_history, verbose)
+        """
+        self.agents = agents
+        self.criteria = criteria
+        self.config = config
+        self.save_file_dir = save_file_dir
+        self.agreement_threshold = agreement_threshold
+        self.debate_options = debate_options
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failed = 0
+        # Client ids of the requests being classified (see claim)
+        self.in_flight = set()
+        self.started = time.time()
+        os.makedirs(save_file_dir, exist_ok=True)
+
+    def warm_up(self):
+        """Load everything a request needs; returns the seconds it took"""
+        start = time.perf_counter()
+        for database in {agent['database'] for agent in self.agents}:
+            init_vectorstore(database)
+        for agent in self.agents:
+            get_rag_chain(agent['prompt'], agent['database'])
+        get_embeddings()
+        key_pool = get_key_pool()
+        for key in list(key_pool.keys):
+            key_pool.client(key)
+            get_llm(DEFAULT_MODEL_NAME, key)
+        # Loads the tokenizer used by the rate limiter
+        num_tokens_from_string("warm up", DEFAULT_MODEL_NAME)
+        return time.perf_counter() - start
+
+    def request_id(self, id=None):
+        if id is None or str(id) == "":
+            return uuid.uuid4().hex[:12]
+        return UNSAFE_ID_PATTERN.sub("_", str(id))
+
+    def claim(self, ids):
+        """
+        Reserve the client-supplied ids of a request so no stored result is overwritten
+
+        Ids are compared after request_id() cleans them. Nothing is reserved if any id
+        repeats within the request, is in flight, or already has a result in the store.
+
+        Returns:
+            list: the colliding ids (empty when every id was reserved)
+        """
+        ids = [self.request_id(id) for id in ids if id is not None and str(id) != ""]
+        store = get_result_store(self.save_file_dir)
+        taken = {id for id, count in Counter(ids).items() if count > 1}
+        with self.lock:
+            taken |= {id for id in ids if id in self.in_flight or id in store}
+            if not taken:
+                self.in_flight.update(ids)
+        return sorted(taken)
+
+    def classify(self, text, id=None):
+        """
+        Run the PRE agents, the vote and, unless the vote settles it, the debate on one text
+
+        Returns:
+            dict: id, text, the label and reason of every agent, Hate_count, Not_Hate_count,
+            Final_Label (the PRE vote), the verdict and the latency of each stage in seconds
+
+        Raises:
+            RuntimeError: an agent gave no label after its whole retry budget; the text is
+            neither triaged nor debated on an incomplete vote
+        """
+        id = self.request_id(id)
+        start = time.perf_counter()
+        # The request id labels the PRE calls as the row id does in a batch run
+        with labelled(row=id):
+            responses = process_row(str(text), self.agents)
+        pre_seconds = time.perf_counter() - start
+        missing = [agent['name'] for agent, response in zip(self.agents, responses) if not (response or {}).get('Label')]
+        if missing:
+            raise RuntimeError(f"No label from PRE agents {missing}")
+
+        row = {'text': str(text), 'label': ''}
+        for agent, response in zip(self.agents, responses):
+            row[f"{agent['name']}_Label"] = response['Label']
+            row[f"{agent['name']}_Reason"] = response.get('Reason')
+        row = aggregate_votes(pd.DataFrame([row]), self.criteria).iloc[0]
+
+        save_file = debate_row(id, row, self.config, self.save_file_dir, self.agreement_threshold, **self.debate_options)
+        total_seconds = time.perf_counter() - start
+        with self.lock:
+            self.requests += 1
+        return {
+            'id': id,
+            'text': str(text),
+            'agents': {agent['name']: {'Label': row[f"{agent['name']}_Label"], 'Reason': row[f"{agent['name']}_Reason"]}
+                       for agent in self.agents},
+            'Hate_count': int(row['Hate_count']),
+            'Not_Hate_count': int(row['Not_Hate_count']),
+            'Final_Label': row['Final_Label'],
+            'verdict': {
+                'Label': save_file.get('Label'),
+                'Reason': save_file.get('Reason'),
+                'success': save_file.get('success'),
+                'triaged': bool(save_file.get('triaged')),
+                'rounds': save_file.get('rounds', 0),
+                'stop_reason': save_file.get('stop_reason'),
+            },
+            'latency': {'total': round(total_seconds, 3), 'pre': round(pre_seconds, 3),
+                        'debate': round(total_seconds - pre_seconds, 3)},
+        }
+
+    def safe_classify(self, text, id=None):
+        """classify, reporting a failure as {"id", "error"} instead of raising"""
+        client_id = id is not None and str(id) != ""
+        # Resolved once, so an error reports the id the journal, telemetry and trace labels used
+        id = self.request_id(id)
+        try:
+            return self.classify(text, id)
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            return {'id': id, 'error': f"{type(e).__name__}: {e}"}
+        finally:
+            if client_id:
+                with self.lock:
+                    self.in_flight.discard(id)
+
+    def health(self):
+        with self.lock:
+            return {'status': 'ok', 'requests': self.requests, 'failed': self.failed,
+                    'uptime': round(time.time() - self.started, 1), 'agents': [agent['name'] for agent in self.agents]}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status, body):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/health":
+                self.reply(200, service.health())
+            else:
+                self.reply(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/classify":
+                self.reply(404, {'error': f"Unknown path {self.path}"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except json.JSONDecodeError as e:
+                self.reply(400, {'error': f"Invalid JSON: {e}"})
+                return
+            if isinstance(request.get('texts'), list):
+                # A batch: its texts are classified at the same time by the worker pool
+                ids = request.get('ids') or [None] * len(request['texts'])
+                if not isinstance(ids, list) or len(ids) != len(request['texts']):
+                    self.reply(400, {'error': f"Expected one id per text ({len(request['texts'])} texts)"})
+                    return
+                taken = service.claim(ids)
+                if taken:
+                    self.reply(409, {'error': 'Ids already used by another result or request', 'ids': taken})
+                    return
+                futures = [service.executor.submit(service.safe_classify, text, id) for text, id in zip(request['texts'], ids)]
+                self.reply(200, {'results': [future.result() for future in futures]})
+            elif isinstance(request.get('text'), str):
+                taken = service.claim([request.get('id')])
+                if taken:
+                    self.reply(409, {'error': 'Id already used by another result or request', 'ids': taken})
+                    return
+                result = service.executor.submit(service.safe_classify, request['text'], request.get('id')).result()
+                self.reply(500 if 'error' in result else 200, result)
+            else:
+                self.reply(400, {'error': 'Expected {"text": ...} or {"texts": [...]}'})
+
+        def log_message(self, format, *args):
+            # Access log on stderr, like the progress output of the other scripts
+            sys.stderr.write(f"{self.address_string()} {format % args}\n")
+
+    return Handler
+
+def serve_http(service, host, port):
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    print(f"PREDICT service on http://{host}:{server.server_port} (POST /classify, GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def serve_stdin(service, workers):
+    """
+    Classify {"id", "text"} lines from stdin and write one JSON result line per text
+
+    Results are written as they finish, so they may come out of order; match
+    them by id. At most `workers * 2` texts are in flight.
+    """
+    output = sys.stdout
+    # The debate prints its rounds; keep stdout for the results only
+    sys.stdout = sys.stderr
+    output_lock = threading.Lock()
+    slots = threading.Semaphore(workers * 2)
+
+    def write(result):
+        with output_lock:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+
+    def done(future):
+        slots.release()
+        write(future.result())
+
+    try:
+        for number, line in enumerate(sys.stdin, 1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                text = request['text'] if isinstance(request, dict) else None
+            except (json.JSONDecodeError, KeyError):
+                text = None
+            if not isinstance(text, str):
+                write({'id': None, 'line': number, 'error': 'Expected a JSON line {"id": ..., "text": ...}'})
+                continue
+            if service.claim([request.get('id')]):
+                write({'id': request.get('id'), 'line': number, 'error': 'Id already used by another result or request'})
+                continue
+            slots.acquire()
+            service.executor.submit(service.safe_classify, text, request.get('id')).add_done_callback(done)
+        service.shutdown()
+    finally:
+        sys.stdout = output
+
+if __name__ == "__main__":
+    args = parse_args()
+    configure_prompt_registry(prompt_dir=args.prompt_dir, offline=args.offline_prompts or None)
+    configure_response_cache(args.llm_cache)
+    configure_vectorstore(mmap=args.mmap_index or None)
+    configure_embeddings(backend=args.embedding_backend, model_name=args.embedding_model, cache_path=args.embedding_cache)
+    if args.telemetry:
+        configure_telemetry(args.telemetry)
+    if args.trace:
+        configure_tracing(args.trace, args.trace_sample)
+    main_pre.rag_executor = DeadlineExecutor(max_workers=args.workers, max_attempts=MAX_RETRIES,
+                                             attempt_timeout=ATTEMPT_TIMEOUT, row_deadline=ROW_DEADLINE, retry_wait=WAIT_TIME)
+
+    criteria = load_criteria(args.criteria)
+    agents = [parse_agent_spec(spec, args.database_name) for spec in args.agents]
+    unknown = [agent['name'] for agent in agents if agent['name'] not in criteria]
+    if unknown or len(agents) != len(criteria):
+        raise SystemExit(f"--agents must name exactly the agents in {args.criteria}: {list(criteria)} (unknown: {unknown})")
+    agents.sort(key=lambda agent: list(criteria).index(agent['name']))
+
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src/utils", "debate_prompt.json")
+    with open(config_path, "r", encoding='utf-8') as config_file:
+        config = json.load(config_file)
+
+    service = PredictService(agents, criteria, config, args.output, workers=args.workers,
+                             agreement_threshold=args.agreement_threshold, max_round=args.max_round)
+    print(f"Warmed up in {service.warm_up():.1f}s", file=sys.stderr)
+    if args.stdin:
+        serve_stdin(service, args.workers)
+    else:
+        serve_http(service, args.host, args.port)
+        service.shutdown()
+
+    # Statistics go to stderr, away from the stdin mode's results
+    sys.stdout = sys.stderr
+    main_pre.rag_executor.shutdown()
+    print(main_pre.rag_executor.report())
+    print_cache_stats()
+    print_embedding_stats()
+    print_key_stats()
+    print_telemetry_stats()
+    print_trace_stats()
@@ -4,8 +4,13 @@ import time
 import os
 import random
 from openai import RateLimitError, APIError, APIStatusError, APIConnectionError
-from .openai_utils import OutOfQuotaException, AccessTerminatedException
-from .openai_utils import num_tokens_from_string, model2max_context
+from .openai_utils import OutOfQuotaException, AccessTerminatedException, classify_key_error
+from .openai_utils import num_tokens_from_string, model2max_context, support_models
+from .rate_limiter import acquire, refund
+from .key_pool import get_key_pool
+from .llm_cache import get_response_cache, valid_response
+from .telemetry import span
+from .tracing import trace_run
 from config.environment import set_environment_variables
 
 # Set up environment variables
@@ -13,10 +18,8 @@ set_environment_variables()
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-support_models = ['gpt-3.5-turbo-0125', 'gpt-3.5-turbo-0301', 'gpt-4', 'gpt-4-0314']
-
 class Agent:
-    def __init__(self, model_name: str, name: str, temperature: float, sleep_time: float=0) -> None:
+    def __init__(self, model_name: str, name: str, temperature: float, sleep_time: float=0, verbose: bool=False) -> None:
         """Create an agent
 
         Args:
@@ -24,50 +27,108 @@ class Agent:
             name (str): name of this agent
             temperature (float): higher values make the output more random, while lower values make it more focused and deterministic
             sleep_time (float): sleep because of rate limits
+            verbose (bool): print every answer of the agent (unreadable when several debates run at once)
         """
         self.model_name = model_name
         self.name = name
         self.temperature = temperature
         self.memory_lst = []
         self.sleep_time = sleep_time
+        self.verbose = verbose
+        # Ask the model even when the response cache has an answer (the new answer replaces it)
+        self.refresh_cache = False
+        # Running token count of memory_lst, updated only when a message is added
+        self.num_context_token = 0
 
     @backoff.on_exception(backoff.expo, (RateLimitError, APIError, APIStatusError, APIConnectionError), max_tries=20)
-    def query(self, messages: "list[dict]", max_tokens: int, api_key: str, temperature: float) -> str:
+    def query(self, messages: "list[dict]", max_tokens: int, api_key: str, temperature: float, num_prompt_tokens: int = None,
+              validate=None) -> str:
         """make a query
 
         Args:
             messages (list[dict]): chat history in turbo format
             max_tokens (int): max token in api call
-            api_key (str): openai api key
+            api_key (str): openai api key, added to the shared key pool
             temperature (float): sampling temperature
+            num_prompt_tokens (int): token count of the messages, counted here if not given
+            validate (callable): parser the caller applies to the answer (e.g. json.loads); answers it rejects are not cached
 
         Raises:
-            OutOfQuotaException: the apikey has out of quota
-            AccessTerminatedException: the apikey has been ban
+            OutOfQuotaException: every apikey in the pool has out of quota or been ban
 
         Returns:
             str: the return msg
         """
-        time.sleep(self.sleep_time)
         assert self.model_name in support_models, f"Not support {self.model_name}. Choices: {support_models}"
-        try:
-            if self.model_name in support_models:
-                response = openai.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                )
+        with span("llm", agent=self.name, model=self.model_name) as fields, \
+                trace_run("llm", self.name, model=self.model_name, messages=messages, temperature=temperature) as trace:
+            # Serve identical requests from the response cache
+            cache = get_response_cache()
+            if cache is not None:
+                cache_key = cache.make_key(self.model_name, messages, {"temperature": temperature, "max_tokens": max_tokens})
+                gen = cache.get(cache_key) if not self.refresh_cache else None
+                if gen is not None and not valid_response(gen, validate):
+                    # Cached before answers were validated
+                    cache.delete(cache_key)
+                    gen = None
+                if gen is not None:
+                    fields["cached"] = True
+                    trace.update(output=gen, cached=True)
+                    return gen
+            time.sleep(self.sleep_time)
+            if num_prompt_tokens is None:
+                num_prompt_tokens = sum(num_tokens_from_string(m["content"], self.model_name) for m in messages)
+            key_pool = get_key_pool()
+            key_pool.add(api_key)
+            while True:
+                waited = time.perf_counter()
+                key = key_pool.acquire()
+                # Wait for quota: OpenAI counts the prompt plus max_tokens against the TPM limit
+                acquire(self.model_name, num_prompt_tokens + max_tokens, key)
+                fields["wait"] = fields.get("wait", 0) + time.perf_counter() - waited
+                try:
+                    response = key_pool.client(key).chat.completions.create(
+                        model=self.model_name,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                    )
+                except (RateLimitError, APIStatusError) as e:
+                    key_error = classify_key_error(e, key)
+                    if key_error is None:
+                        key_pool.release(key, error=e)
+                        raise e
+                    # The key is exhausted or terminated: retire it and retry on a healthy one
+                    key_pool.retire(key, key_error)
+                    refund(self.model_name, num_prompt_tokens + max_tokens, key)
+                    fields["key_retries"] = fields.get("key_retries", 0) + 1
+                    continue
+                except Exception as e:
+                    key_pool.release(key, error=e)
+                    raise e
+                key_pool.release(key, tokens=response.usage.total_tokens if response.usage else 0)
+                if response.usage:
+                    # Credit back the part of max_tokens the answer did not use
+                    refund(self.model_name, num_prompt_tokens + max_tokens - response.usage.total_tokens, key)
+                    fields.update(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
                 gen = response.choices[0].message.content
-            return gen
+                if cache is not None and valid_response(gen, validate):
+                    cache.put(cache_key, self.model_name, gen)
+                trace["output"] = gen
+                return gen
 
-        except RateLimitError as e:
-            if "You exceeded your current quota, please check your plan and billing details" in e.user_message:
-                raise OutOfQuotaException(api_key)
-            elif "Your access was terminated due to violation of our policies" in e.user_message:
-                raise AccessTerminatedException(api_key)
-            else:
-                raise e
+    def _append(self, role: str, content: str, num_tokens: int = None):
+        """Add a message to the memory and update the running token count
+
+        Args:
+            role (str): message role
+            content (str): message content
+            num_tokens (int): token count of the content if the caller already knows it
+        """
+        if num_tokens is None:
+            num_tokens = num_tokens_from_string(content, self.model_name)
+        self.memory_lst.append({"role": role, "content": content})
+        self.num_context_token += num_tokens
 
     def set_meta_prompt(self, meta_prompt: str):
         """Set the meta_prompt
@@ -75,15 +136,16 @@ class Agent:
         Args:
             meta_prompt (str): the meta prompt
         """
-        self.memory_lst.append({"role": "system", "content": f"{meta_prompt}"})
+        self._append("system", f"{meta_prompt}")
 
-    def add_event(self, event: str):
+    def add_event(self, event: str, num_tokens: int = None):
         """Add an new event in the memory
 
         Args:
             event (str): string that describe the event.
+            num_tokens (int): token count of the event if already known
         """
-        self.memory_lst.append({"role": "user", "content": f"{event}"})
+        self._append("user", f"{event}", num_tokens)
 
     def add_memory(self, memory: str):
         """Monologue in the memory
@@ -91,16 +153,30 @@ class Agent:
         Args:
             memory (str): string that generated by the model in the last round.
         """
-        self.memory_lst.append({"role": "assistant", "content": f"{memory}"})
-        print(f"----- {self.name} -----\n{memory}\n")
+        self._append("assistant", f"{memory}")
+        if self.verbose:
+            print(f"----- {self.name} -----\n{memory}\n")
+
+    def load_memory(self, memory_lst: "list[dict]"):
+        """Replace the memory with a saved one, e.g. a transcript from a previous run
+
+        Args:
+            memory_lst (list[dict]): messages in turbo format
+        """
+        self.memory_lst = []
+        self.num_context_token = 0
+        for message in memory_lst:
+            self._append(message["role"], message["content"])
 
-    def ask(self, temperature: float=None):
+    def ask(self, temperature: float=None, validate=None):
         """Query for answer
 
         Args:
+            temperature (float): sampling temperature instead of the agent's own
+            validate (callable): parser the caller applies to the answer; answers it rejects are not cached
         """
         # query
-        num_context_token = sum([num_tokens_from_string(m["content"], self.model_name) for m in self.memory_lst])
-        max_token = model2max_context[self.model_name] - num_context_token
-        return self.query(self.memory_lst, max_token, api_key=self.openai_api_key, temperature=temperature if temperature else self.temperature)
+        max_token = model2max_context[self.model_name] - self.num_context_token
+        return self.query(self.memory_lst, max_token, api_key=getattr(self, "openai_api_key", None), temperature=temperature if temperature else self.temperature,
+                          num_prompt_tokens=self.num_context_token, validate=validate)
     
\ No newline at end of file
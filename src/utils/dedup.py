@@ -0,0 +1,126 @@
+import re
+import sys
+import zlib
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# Dedup modes: "exact" groups texts equal after normalization, "near" also groups texts whose MinHash signatures agree
+MODES = ("exact", "near")
+
+# Punctuation and symbols ("한심하다..", "꺼져라!!!") do not change the text for classification
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]+")
+# A character repeated three times or more ("ㅋㅋㅋㅋ", "ㅠㅠㅠ") counts as two
+REPEAT_PATTERN = re.compile(r"(.)\1{2,}")
+
+# MinHash over 32-bit shingle hashes: (a * h + b) mod PRIME stays within 64 bits
+PRIME = 4294967291
+SHINGLE_SIZE = 3
+
+def normalize_text(text) -> str:
+    """Unicode NFKC, lower case, no punctuation, repeated characters squeezed and single spaces"""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    text = PUNCTUATION_PATTERN.sub(" ", text)
+    text = REPEAT_PATTERN.sub(r"\1\1", text)
+    return " ".join(text.split())
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> "set[str]":
+    """Character n-grams of a normalized text (the text itself when shorter than n)
+
+    Spaces are left out: comments often space the same words differently.
+    """
+    text = text.replace(" ", "")
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 0) -> None:
+        """MinHash signatures of character shingles
+
+        Args:
+            num_perm (int): number of hash functions (signature length)
+            seed (int): seed of the hash functions
+        """
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles(text)), dtype=np.uint64)
+        return ((self.a * hashes + self.b) % PRIME).min(axis=1).astype(np.uint32)
+
+def find_duplicates(texts, mode: str = "exact", threshold: float = 0.8, num_perm: int = 64, bands: int = 16) -> "list[int]":
+    """
+    Group duplicate texts and return the representative of each text
+
+    Texts are normalized (see normalize_text) and equal texts form one group.
+    In "near" mode, groups whose MinHash signatures share an LSH band and agree
+    on at least `threshold` of their positions (estimated Jaccard similarity of
+    their character 3-grams) are merged as well.
+
+    Args:
+        texts (iterable): texts in row order
+        mode (str): "exact" or "near"
+        threshold (float): estimated Jaccard similarity above which two texts are near-duplicates
+        num_perm (int): MinHash signature length
+        bands (int): LSH bands (num_perm / bands rows each); more bands find more candidate pairs
+
+    Returns:
+        list[int]: for every position, the position of its representative: the first text of its group
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown dedup mode: {mode} (choices: {MODES})")
+    normalized = [normalize_text(text) for text in texts]
+    first = {}
+    representatives = [first.setdefault(text, i) for i, text in enumerate(normalized)]
+    if mode == "exact":
+        return representatives
+
+    # Near-duplicates among the exact representatives
+    unique = sorted(first.values())
+    hasher = MinHasher(num_perm)
+    signatures = np.stack([hasher.signature(normalized[i]) for i in unique]) if unique else np.zeros((0, num_perm), np.uint32)
+    parent = list(range(len(unique)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def similar(x, y):
+        return np.mean(signatures[x] == signatures[y]) >= threshold
+
+    rows = num_perm // bands
+    for band in range(bands):
+        buckets = {}
+        for position, signature in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(signature.tobytes(), []).append(position)
+        for members in buckets.values():
+            for position in members[1:]:
+                root, other = find(position), find(members[0])
+                # The representatives must match too, so groups do not drift apart through chains of pairs
+                if root != other and similar(position, members[0]) and similar(root, other):
+                    # The earlier text stays the representative
+                    parent[max(root, other)] = min(root, other)
+
+    merged = {unique[position]: unique[find(position)] for position in range(len(unique))}
+    return [merged[representative] for representative in representatives]
+
+def dedup_summary(representatives: "list[int]", mode: str = "exact") -> str:
+    """One line with the number of rows, unique texts and the dedup ratio"""
+    rows = len(representatives)
+    unique = sum(representative == i for i, representative in enumerate(representatives))
+    ratio = (rows - unique) / rows if rows else 0.0
+    return f"Dedup ({mode}): {rows} rows, {unique} unique texts, {rows - unique} duplicates ({ratio:.1%})"
+
+if __name__ == "__main__":
+    # python -m src.utils.dedup Dataset/kold/kold_sample.csv [near]
+    dataset = pd.read_csv(sys.argv[1])
+    mode = sys.argv[2] if len(sys.argv) > 2 else "exact"
+    representatives = find_duplicates(dataset['text'], mode)
+    print(dedup_summary(representatives, mode))
+    groups = pd.Series(representatives).value_counts()
+    for representative, size in groups[groups > 1].head(10).items():
+        print(f"{size:>6} x {dataset['text'][representative]}")
@@ -0,0 +1,229 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import openai
+import numpy as np
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from .telemetry import span
+from . import openai_utils
+
+# 임베딩 요청 타임아웃 (초)
+TIMEOUT_SECONDS = 30
+
+# OpenAI 임베딩 모델 (OpenAIEmbeddings의 기본값)
+OPENAI_MODEL_NAME = "text-embedding-ada-002"
+
+# 로컬 CPU 임베딩 모델 (한국어 문장 임베딩)
+LOCAL_MODEL_NAME = "jhgan/ko-sroberta-multitask"
+
+BACKENDS = ("openai", "local")
+
+class EmbeddingCache:
+    def __init__(self, path: str) -> None:
+        """On-disk embedding cache keyed on the embedding model and the text
+
+        Args:
+            path (str): SQLite file holding the cached vectors
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (model TEXT, key TEXT, vector BLOB, PRIMARY KEY (model, key))"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, texts: "list[str]") -> dict:
+        """Return {text: vector} for the texts that are in the cache"""
+        found = {}
+        with self.lock:
+            for text in texts:
+                row = self.conn.execute("SELECT vector FROM embeddings WHERE model = ? AND key = ?",
+                                        (model, self.make_key(text))).fetchone()
+                if row is not None:
+                    found[text] = np.frombuffer(row[0], dtype=np.float32).tolist()
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, model: str, vectors: dict):
+        """Store {text: vector} pairs"""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)",
+                [(model, self.make_key(text), np.asarray(vector, dtype=np.float32).tobytes()) for text, vector in vectors.items()],
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, backend: Embeddings, model: str, cache: EmbeddingCache = None,
+                 batch_size: int = 64, memory_size: int = 100000) -> None:
+        """Embedding model behind an in-memory LRU and an optional on-disk cache
+
+        A text is embedded at most once per process, and at most once across runs
+        when an on-disk cache is configured. Texts missing from both caches are
+        sent to the backend `batch_size` at a time.
+
+        Args:
+            backend (Embeddings): model computing the vectors on a miss
+            model (str): "<backend>:<model name>", part of the cache key
+            cache (EmbeddingCache): on-disk cache shared across runs (None keeps vectors in memory only)
+            batch_size (int): number of texts sent to the backend per request
+            memory_size (int): number of vectors kept in memory
+        """
+        self.backend = backend
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.computed = 0
+
+    def _remember(self, vectors: dict):
+        with self.lock:
+            for text, vector in vectors.items():
+                self.memory[text] = vector
+                self.memory.move_to_end(text)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    def embed_documents(self, texts: "list[str]") -> "list[list[float]]":
+        found = {}
+        with self.lock:
+            for text in texts:
+                if text in self.memory:
+                    self.memory.move_to_end(text)
+                    found[text] = self.memory[text]
+        missing = list(dict.fromkeys(text for text in texts if text not in found))
+        if missing and self.cache is not None:
+            cached = self.cache.get_many(self.model, missing)
+            found.update(cached)
+            missing = [text for text in missing if text not in cached]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            with span("embed", embedding_model=self.model, texts=len(batch)):
+                vectors = dict(zip(batch, self.backend.embed_documents(batch)))
+            self.computed += len(batch)
+            if self.cache is not None:
+                self.cache.put_many(self.model, vectors)
+            found.update(vectors)
+        self._remember({text: found[text] for text in dict.fromkeys(texts)})
+        return [found[text] for text in texts]
+
+    def embed_query(self, text: str) -> "list[float]":
+        return self.embed_documents([text])[0]
+
+    def prefetch(self, texts: "list[str]"):
+        """Embed many texts in batches ahead of time so later queries are cache hits"""
+        if self.cache is None:
+            # Without a disk cache, vectors beyond the memory size would be evicted before use
+            texts = texts[:self.memory_size]
+        for start in range(0, len(texts), self.memory_size):
+            self.embed_documents(list(texts[start:start + self.memory_size]))
+
+class UntokenizedOpenAIEmbeddings(Embeddings):
+    def __init__(self, model: str = OPENAI_MODEL_NAME, chunk_size: int = 1000, request_timeout: float = TIMEOUT_SECONDS,
+                 max_retries: int = 0) -> None:
+        """OpenAI embeddings that send the texts as strings, so no tiktoken encoding is downloaded
+
+        Used with the approximate tokenizer. Texts longer than the embedding context are not split.
+
+        Args:
+            model (str): OpenAI embedding model
+            chunk_size (int): Number of texts per request
+            request_timeout (float): Timeout of a request in seconds
+            max_retries (int): Retries of the OpenAI client
+        """
+        self.model = model
+        self.chunk_size = chunk_size
+        self.client = openai.OpenAI(timeout=request_timeout, max_retries=max_retries)
+
+    def embed_documents(self, texts: "list[str]") -> "list[list[float]]":
+        vectors = []
+        for start in range(0, len(texts), self.chunk_size):
+            response = self.client.embeddings.create(model=self.model, input=list(texts[start:start + self.chunk_size]))
+            vectors.extend(item.embedding for item in response.data)
+        return vectors
+
+    def embed_query(self, text: str) -> "list[float]":
+        return self.embed_documents([text])[0]
+
+def load_backend(backend: str, model_name: str = None, batch_size: int = 64) -> Embeddings:
+    """Build the embedding model of a backend
+
+    - openai: OpenAI embeddings API (the default, what the bundled indexes were built with)
+    - local: sentence-transformers model on the CPU, no network round trip
+    """
+    if backend == "openai":
+        kwargs = {"model": model_name} if model_name else {}
+        # Retries are owned by the caller's DeadlineExecutor, not the OpenAI client
+        cls = UntokenizedOpenAIEmbeddings if openai_utils.tokenizer == "approximate" else OpenAIEmbeddings
+        return cls(request_timeout=TIMEOUT_SECONDS, max_retries=0, **kwargs)
+    if backend == "local":
+        try:
+            import sentence_transformers  # noqa: F401
+        except ImportError as e:
+            raise ImportError("The local embedding backend needs sentence-transformers: pip install sentence-transformers==2.3.1") from e
+        return HuggingFaceEmbeddings(model_name=model_name or LOCAL_MODEL_NAME,
+                                     model_kwargs={"device": "cpu"},
+                                     encode_kwargs={"batch_size": batch_size})
+    raise ValueError(f"Unknown embedding backend: {backend} (choose from {', '.join(BACKENDS)})")
+
+# Embedding settings of this process, shared by every agent and database
+embedding_settings = {
+    "backend": os.getenv("PREDICT_EMBEDDING_BACKEND", "openai"),
+    "model_name": os.getenv("PREDICT_EMBEDDING_MODEL") or None,
+    "cache_path": os.getenv("PREDICT_EMBEDDING_CACHE") or None,
+    "batch_size": 64,
+}
+embeddings_instance = None
+embeddings_lock = threading.Lock()
+
+def configure_embeddings(backend: str = None, model_name: str = None, cache_path: str = None, batch_size: int = None):
+    """Choose the embedding backend of this process (None keeps the current setting)"""
+    global embeddings_instance
+    updates = {"backend": backend, "model_name": model_name, "cache_path": cache_path, "batch_size": batch_size}
+    with embeddings_lock:
+        embedding_settings.update({name: value for name, value in updates.items() if value is not None})
+        embeddings_instance = None
+
+def embedding_model_id() -> str:
+    """Identify the configured model, e.g. "local:jhgan/ko-sroberta-multitask" """
+    backend, model_name = embedding_settings["backend"], embedding_settings["model_name"]
+    if backend == "local":
+        model_name = model_name or LOCAL_MODEL_NAME
+    return f"{backend}:{model_name or 'default'}"
+
+def get_embeddings() -> CachedEmbeddings:
+    """Return the shared embedding model, built on first use"""
+    global embeddings_instance
+    with embeddings_lock:
+        if embeddings_instance is None:
+            backend = load_backend(embedding_settings["backend"], embedding_settings["model_name"], embedding_settings["batch_size"])
+            cache = EmbeddingCache(embedding_settings["cache_path"]) if embedding_settings["cache_path"] else None
+            embeddings_instance = CachedEmbeddings(backend, embedding_model_id(), cache=cache, batch_size=embedding_settings["batch_size"])
+        return embeddings_instance
+
+def print_embedding_stats():
+    if embeddings_instance is not None:
+        cache = embeddings_instance.cache
+        disk = f", disk cache {cache.hits} hits / {cache.misses} misses" if cache is not None else ""
+        print(f"Embeddings ({embeddings_instance.model}): {embeddings_instance.computed} texts embedded{disk}")
@@ -0,0 +1,122 @@
+import time
+import threading
+import contextvars
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from .telemetry import span
+
+# Outcome of one call: the result (None on failure), the attempts it consumed and the last error
+CallResult = namedtuple("CallResult", ["result", "attempts", "error"])
+
+class DeadlineExceeded(TimeoutError):
+    "Raised when a row runs out of time before its call succeeded"
+
+def run_attempt(fn, attempt_deadline: float, args, kwargs):
+    """Call fn with the time left until `attempt_deadline`, or not at all if it already passed in the queue"""
+    remaining = attempt_deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Attempt deadline passed before a worker was free")
+    return fn(*args, timeout=remaining, **kwargs)
+
+def time_left(deadline: float) -> float:
+    """Seconds until a time.monotonic() deadline (None when there is none)
+
+    Raises:
+        DeadlineExceeded: the deadline has passed
+    """
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Attempt deadline exceeded")
+    return remaining
+
+class DeadlineExecutor:
+    def __init__(self, max_workers: int = 8, max_attempts: int = 3, attempt_timeout: float = 30,
+                 row_deadline: float = 120, retry_wait: float = 5) -> None:
+        """Bounded worker pool with a per-row deadline and a single retry budget
+
+        Every attempt runs on one of `max_workers` threads and receives a `timeout`
+        keyword argument with the time it has left when it starts (time spent queued
+        for a worker is deducted). Callers turn it into a deadline checked after each
+        wait and pass the remainder to the HTTP request, so an attempt the executor
+        gave up on is aborted instead of sending a duplicate request later.
+
+        Args:
+            max_workers (int): number of calls running at the same time
+            max_attempts (int): attempts allowed per call, across every kind of error
+            attempt_timeout (float): seconds one attempt may take
+            row_deadline (float): seconds all the calls for one row may take together
+            retry_wait (float): seconds to wait between attempts
+        """
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.attempt_timeout = attempt_timeout
+        self.row_deadline = row_deadline
+        self.retry_wait = retry_wait
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.attempt_counts = Counter()
+        self.failures = 0
+
+    def deadline(self) -> float:
+        """Return the deadline of a row that starts now"""
+        return time.monotonic() + self.row_deadline
+
+    def call(self, fn, *args, deadline: float = None, **kwargs) -> CallResult:
+        """Run fn(*args, timeout=..., **kwargs) until it succeeds, the budget is spent or the deadline passes
+
+        Args:
+            fn: callable accepting a `timeout` keyword argument
+            deadline (float): time.monotonic() value after which no attempt is started
+
+        Returns:
+            CallResult: result, number of attempts consumed and the last error
+        """
+        deadline = deadline if deadline is not None else self.deadline()
+        error = None
+        attempts = 0
+        while attempts < self.max_attempts:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                error = error or DeadlineExceeded("Row deadline exceeded")
+                break
+            attempts += 1
+            timeout = min(self.attempt_timeout, remaining)
+            # One telemetry event per attempt, so retries and their latency show up in the summary
+            with span("attempt", call=getattr(fn, "__name__", "call"), attempt=attempts) as fields:
+                # Run in a copy of the caller's context so telemetry labels follow the call
+                future = self.pool.submit(contextvars.copy_context().run, run_attempt, fn, time.monotonic() + timeout, args, kwargs)
+                try:
+                    result = future.result(timeout=timeout)
+                except FutureTimeoutError:
+                    # Drop the attempt if it never started; a running one is aborted by its own request timeout
+                    future.cancel()
+                    error = TimeoutError("Operation timed out")
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+                fields["error"] = error
+            if error is None:
+                return self._record(CallResult(result, attempts, None))
+            print(f"Attempt {attempts}/{self.max_attempts} failed: {error}")
+            if attempts < self.max_attempts:
+                time.sleep(max(0, min(self.retry_wait, deadline - time.monotonic())))
+        return self._record(CallResult(None, attempts, error))
+
+    def _record(self, outcome: CallResult) -> CallResult:
+        with self.lock:
+            self.attempt_counts[outcome.attempts] += 1
+            if outcome.error is not None:
+                self.failures += 1
+        return outcome
+
+    def report(self) -> str:
+        """Summarize how many attempts the calls consumed"""
+        with self.lock:
+            counts = ", ".join(f"{attempts} attempt(s): {count}" for attempts, count in sorted(self.attempt_counts.items()))
+            return f"Calls by attempts consumed - {counts or 'none'}; failed after the whole budget: {self.failures}"
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,90 @@
+import os
+import json
+import threading
+from .telemetry import span
+
+class ResultJournal:
+    def __init__(self, output_path: str, compact_every: int = 10000) -> None:
+        """Append-only JSONL journal in front of a PRE output JSON file
+
+        Every result is appended to `<output_path>.journal.jsonl` as soon as it is
+        available. Every `compact_every` results the journal is folded into the
+        output JSON, which keeps the format main_pre_to_dict expects.
+
+        Args:
+            output_path (str): path of the output JSON file ({"<index>": response, ...})
+            compact_every (int): number of appended results between compactions
+        """
+        self.output_path = output_path
+        self.journal_path = f"{output_path}.journal.jsonl"
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.pending = 0
+
+        # Fold whatever a previous (possibly killed) run left in the journal
+        self.done = set(self.compact())
+        self.journal_file = open(self.journal_path, 'a', encoding='utf-8')
+
+    def read_journal(self) -> dict:
+        """Return the results stored in the journal, in append order"""
+        entries = {}
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A partial last line from a killed run
+                        continue
+                    entries[record['index']] = record['response']
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def compact(self) -> "list[str]":
+        """Fold the journal into the output JSON and truncate it
+
+        Returns:
+            list[str]: every index that has a result in the output JSON
+        """
+        try:
+            with open(self.output_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        entries = self.read_journal()
+        if entries or not os.path.exists(self.output_path):
+            data.update(entries)
+            # Write to a temporary file first so a crash never leaves a truncated output
+            tmp_path = f"{self.output_path}.tmp"
+            with span("write", file=self.output_path, rows=len(data)), open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(data, file, indent=4, ensure_ascii=False)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.output_path)
+        open(self.journal_path, 'w', encoding='utf-8').close()
+        return list(data.keys())
+
+    def append(self, index: str, response):
+        """Record the result for one row"""
+        with self.lock:
+            with span("write", file=self.journal_path):
+                self.journal_file.write(json.dumps({'index': index, 'response': response}, ensure_ascii=False) + '\n')
+                self.journal_file.flush()
+            self.done.add(index)
+            self.pending += 1
+            if self.pending >= self.compact_every:
+                self._compact_locked()
+
+    def _compact_locked(self):
+        self.journal_file.close()
+        self.compact()
+        self.journal_file = open(self.journal_path, 'a', encoding='utf-8')
+        self.pending = 0
+
+    def close(self):
+        """Compact the remaining journal entries and remove the journal file"""
+        with self.lock:
+            self.journal_file.close()
+            self.compact()
+            os.remove(self.journal_path)
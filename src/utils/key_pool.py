@@ -0,0 +1,117 @@
+import os
+import time
+import threading
+import openai
+from .openai_utils import OutOfQuotaException
+
+def mask_key(key: str) -> str:
+    """Show only the end of a key in logs"""
+    return f"...{key[-4:]}" if key else "<empty>"
+
+class ApiKeyPool:
+    def __init__(self, keys: "list[str]") -> None:
+        """Pool of OpenAI API keys shared by the debate agents and the RAG chain
+
+        Requests go to the healthy key with the fewest requests in flight, so the
+        rate limits of all keys add up. Keys that run out of quota or are
+        terminated are retired and the request is retried on another key.
+
+        Args:
+            keys (list[str]): API keys in the pool
+        """
+        self.lock = threading.Lock()
+        self.keys = []
+        self.stats = {}
+        self.clients = {}
+        self.started = time.time()
+        for key in keys:
+            self.add(key)
+
+    def add(self, key: str):
+        """Add a key to the pool if it is not already in it"""
+        if not key:
+            return
+        with self.lock:
+            if key not in self.stats:
+                self.keys.append(key)
+                self.stats[key] = {'requests': 0, 'errors': 0, 'tokens': 0, 'in_flight': 0, 'retired': None}
+
+    def acquire(self) -> str:
+        """Pick the healthy key with the fewest requests in flight
+
+        Raises:
+            ValueError: the pool has no keys at all
+            OutOfQuotaException: every key in the pool has been retired
+        """
+        with self.lock:
+            if not self.keys:
+                raise ValueError("No OpenAI API key configured. Set OPENAI_API_KEY or OPENAI_API_KEYS (comma separated).")
+            healthy = [key for key in self.keys if self.stats[key]['retired'] is None]
+            if not healthy:
+                raise OutOfQuotaException("all keys in the pool")
+            key = min(healthy, key=lambda k: (self.stats[k]['in_flight'], self.stats[k]['requests']))
+            self.stats[key]['in_flight'] += 1
+            self.stats[key]['requests'] += 1
+            return key
+
+    def release(self, key: str, tokens: int = 0, error: Exception = None):
+        """Return a key after a request, recording its tokens or error"""
+        with self.lock:
+            stats = self.stats[key]
+            stats['in_flight'] -= 1
+            stats['tokens'] += tokens or 0
+            if error is not None:
+                stats['errors'] += 1
+
+    def retire(self, key: str, error: Exception):
+        """Stop using a key that ran out of quota or was terminated"""
+        with self.lock:
+            stats = self.stats[key]
+            stats['in_flight'] -= 1
+            stats['errors'] += 1
+            if stats['retired'] is None:
+                stats['retired'] = type(error).__name__
+                print(f"Retiring API key {mask_key(key)} ({type(error).__name__})")
+
+    def client(self, key: str) -> openai.OpenAI:
+        """OpenAI client bound to one key, created once per key"""
+        with self.lock:
+            if key not in self.clients:
+                # Retries belong to the caller (Agent.query's backoff), so every failed request reaches the key stats
+                self.clients[key] = openai.OpenAI(api_key=key, max_retries=0)
+            return self.clients[key]
+
+    def report(self) -> str:
+        """Per-key throughput and error statistics"""
+        minutes = max(time.time() - self.started, 1e-9) / 60
+        with self.lock:
+            lines = [
+                f"{mask_key(key)}: {s['requests']} requests ({s['requests'] / minutes:.1f}/min), "
+                f"{s['tokens']} tokens, {s['errors']} errors" + (f", retired ({s['retired']})" if s['retired'] else "")
+                for key, s in self.stats.items()
+            ]
+        return "API keys - " + ("; ".join(lines) if lines else "none")
+
+def load_keys() -> "list[str]":
+    """Read the keys from OPENAI_API_KEYS (comma separated), falling back to OPENAI_API_KEY"""
+    keys = [key.strip() for key in os.getenv("OPENAI_API_KEYS", "").split(",") if key.strip()]
+    if not keys and os.getenv("OPENAI_API_KEY"):
+        keys = [os.getenv("OPENAI_API_KEY")]
+    return keys
+
+# Pool shared by every agent and RAG call in the process, built on first use
+# so that it sees the keys set by config.environment
+key_pool = None
+key_pool_lock = threading.Lock()
+
+def get_key_pool() -> ApiKeyPool:
+    """Return the shared key pool"""
+    global key_pool
+    with key_pool_lock:
+        if key_pool is None:
+            key_pool = ApiKeyPool(load_keys())
+        return key_pool
+
+def print_key_stats():
+    if key_pool is not None:
+        print(key_pool.report())
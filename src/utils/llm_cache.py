@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+class ResponseCache:
+    def __init__(self, path: str, max_size_mb: float = None, read_only: bool = False) -> None:
+        """On-disk LLM response cache keyed on model, messages and sampling parameters
+
+        Args:
+            path (str): SQLite file holding the cached responses
+            max_size_mb (float): evict the least recently used responses above this size (None keeps everything)
+            read_only (bool): serve hits but never store new responses, for reproducible reruns
+        """
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name: str, messages: "list[dict]", params: dict) -> str:
+        """Content address of a request: sha256 over the model, the full message list and the sampling parameters"""
+        payload = json.dumps({"model": model_name, "messages": messages, "params": params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """Return the cached response for a key, or None on a miss"""
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.read_only:
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+            return row[0]
+
+    def put(self, key: str, model_name: str, response: str):
+        """Store a response, evicting the least recently used ones if the cache grows too large"""
+        if self.read_only or response is None:
+            return
+        size = len(response.encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response, size, now, now),
+            )
+            self.size += size - (old[0] if old else 0)
+            if self.max_size is not None and self.size > self.max_size:
+                self._evict()
+            self.conn.commit()
+
+    def delete(self, key: str):
+        """Drop a cached response, e.g. one its caller could not parse"""
+        if self.read_only:
+            return
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is None:
+                return
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= old[0]
+            self.conn.commit()
+
+    def _evict(self):
+        # Drop the least recently used responses until the cache fits again
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall()
+        for key, size in rows:
+            if self.size <= self.max_size:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size of the cache"""
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_mb": self.size / (1024 * 1024),
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# Cache shared by Agent.query and the RAG chain (None disables caching)
+response_cache = None
+
+def configure_response_cache(path: str, max_size_mb: float = None, read_only: bool = False):
+    """Enable the shared response cache for this process"""
+    global response_cache
+    response_cache = ResponseCache(path, max_size_mb=max_size_mb, read_only=read_only) if path else None
+    return response_cache
+
+def get_response_cache():
+    """Return the shared response cache, or None if caching is disabled"""
+    return response_cache
+
+def valid_response(response: str, validate=None) -> bool:
+    """Whether a response passes the caller's parser (`validate` raises on output it cannot use)
+
+    Only valid responses are cached, so a malformed answer is asked again on
+    the next attempt instead of being served from the cache forever.
+    """
+    if validate is None:
+        return True
+    try:
+        validate(response)
+    except Exception:
+        return False
+    return True
+
+def print_cache_stats():
+    if response_cache is not None:
+        stats = response_cache.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%}), "
+              f"{stats['evictions']} evictions, {stats['entries']} entries, {stats['size_mb']:.1f} MB")
@@ -0,0 +1,60 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+def texts_fingerprint(texts) -> "tuple[str, int]":
+    """sha256 over the texts in order, to tie a sidecar to the dataset it was built from
+
+    `texts` may be any iterable, so a large dataset can be fingerprinted chunk by chunk.
+
+    Returns:
+        tuple[str, int]: hex digest and number of texts
+    """
+    digest = hashlib.sha256()
+    rows = 0
+    for text in texts:
+        digest.update(str(text).encode('utf-8'))
+        digest.update(b"\0")
+        rows += 1
+    return digest.hexdigest(), rows
+
+class NeighborSidecar:
+    def __init__(self, path: str) -> None:
+        """Read-only view of the retrieval results precomputed by build_neighbors.py
+
+        The directory holds, for every row of the evaluation CSV:
+          - neighbors.npy: ids of the k nearest documents in the FAISS index (int64, rows x k)
+          - distances.npy: their L2 distances (float32, rows x k)
+          - contexts.bin / offsets.npy: the formatted RAG context, UTF-8 encoded back to back
+          - meta.json: database, k, embedding model, row count and dataset fingerprint
+
+        Everything is memory-mapped, so opening a sidecar costs nothing and
+        several processes share its pages.
+
+        Args:
+            path (str): sidecar directory
+        """
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+            self.meta = json.load(file)
+        self.database = self.meta["database"]
+        self.neighbors = np.load(os.path.join(path, "neighbors.npy"), mmap_mode="r")
+        self.distances = np.load(os.path.join(path, "distances.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        contexts_path = os.path.join(path, "contexts.bin")
+        # np.memmap refuses empty files
+        self.contexts = np.memmap(contexts_path, dtype=np.uint8, mode="r") if os.path.getsize(contexts_path) else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def context(self, index: int) -> str:
+        """Formatted RAG context of one row, as format_docs returned it"""
+        return self.contexts[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+    def check(self, texts):
+        """Raise ValueError if the sidecar was not built from these texts"""
+        if texts_fingerprint(texts) != (self.meta["fingerprint"], len(self)):
+            raise ValueError(f"Neighbor sidecar {self.path} was built from another dataset "
+                             f"({self.meta['input']}, {len(self)} rows). Rebuild it with build_neighbors.py.")
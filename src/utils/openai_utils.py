@@ -1,4 +1,6 @@
+import os
 import tiktoken
+from functools import lru_cache
 
 
 model2max_context = {
@@ -10,6 +12,17 @@ model2max_context = {
     "text-davinci-002": 4096,
 }
 
+# Supported chat models with their rate limits: requests per minute (rpm) and tokens per minute (tpm).
+# Adjust them to the usage tier of your account; completion_tokens is the expected completion length
+# used when a request does not set max_tokens. prompt_price and completion_price are USD per 1M tokens,
+# used to estimate the cost of a run.
+support_models = {
+    'gpt-3.5-turbo-0125': {'rpm': 3500, 'tpm': 160000, 'completion_tokens': 256, 'prompt_price': 0.5, 'completion_price': 1.5},
+    'gpt-3.5-turbo-0301': {'rpm': 3500, 'tpm': 160000, 'completion_tokens': 256, 'prompt_price': 1.5, 'completion_price': 2.0},
+    'gpt-4': {'rpm': 500, 'tpm': 10000, 'completion_tokens': 256, 'prompt_price': 30.0, 'completion_price': 60.0},
+    'gpt-4-0314': {'rpm': 500, 'tpm': 10000, 'completion_tokens': 256, 'prompt_price': 30.0, 'completion_price': 60.0},
+}
+
 class OutOfQuotaException(Exception):
     "Raised when the key exceeded the current quota"
     def __init__(self, key, cause=None):
@@ -36,9 +49,41 @@ class AccessTerminatedException(Exception):
         else:
             return super().__str__()
 
+def classify_key_error(error: Exception, key: str):
+    """Map an API error caused by the key itself to OutOfQuotaException or AccessTerminatedException
+
+    Returns:
+        the mapped exception, or None if the error is not about the key
+    """
+    message = getattr(error, "message", None) or str(error)
+    if "You exceeded your current quota, please check your plan and billing details" in message:
+        return OutOfQuotaException(key, error)
+    if "Your access was terminated due to violation of our policies" in message or getattr(error, "status_code", None) == 401:
+        return AccessTerminatedException(key, error)
+    return None
+
+# Token counter: "tiktoken" (exact, downloads its encoding on first use) or "approximate"
+# (an estimate that needs no network, used by the benchmark)
+TOKENIZERS = ("tiktoken", "approximate")
+tokenizer = os.getenv("PREDICT_TOKENIZER", "tiktoken")
+if tokenizer not in TOKENIZERS:
+    raise ValueError(f"Unknown PREDICT_TOKENIZER: {tokenizer} (choose from {', '.join(TOKENIZERS)})")
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str):
+    """Returns the tokenizer for a model, loading it once per model."""
+    return tiktoken.encoding_for_model(model_name)
+
+def approximate_num_tokens(string: str) -> int:
+    """Estimates the tokens of a text without tiktoken: about 4 ASCII characters, or 1 other character, per token."""
+    ascii_chars = len(string.encode('ascii', 'ignore'))
+    return -(-ascii_chars // 4) + len(string) - ascii_chars
+
 def num_tokens_from_string(string: str, model_name: str) -> int:
     """Returns the number of tokens in a text string."""
-    encoding = tiktoken.encoding_for_model(model_name)
+    if tokenizer == "approximate":
+        return approximate_num_tokens(string)
+    encoding = get_encoding(model_name)
     num_tokens = len(encoding.encode(string))
     return num_tokens
 
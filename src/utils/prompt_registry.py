@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from langchain import hub
+from langchain_core.load import dumpd, load
+
+# Directory holding the local copies of the LangChain Hub prompts
+PROMPT_DIR = os.getenv("PREDICT_PROMPT_DIR", "./prompts")
+
+class PromptRegistry:
+    def __init__(self, prompt_dir: str = PROMPT_DIR, offline: bool = False) -> None:
+        """Pull each hub prompt once and keep a versioned copy on disk
+
+        Args:
+            prompt_dir (str): directory for the local prompt copies
+            offline (bool): read prompts only from the local copies, never from the hub
+        """
+        self.prompt_dir = prompt_dir
+        self.offline = offline
+        self.prompts = {}
+        self.lock = threading.Lock()
+
+    def local_path(self, agent_name: str) -> str:
+        """Path of the local copy for a hub prompt (e.g., someen/unsmile -> someen/unsmile.json)"""
+        return os.path.join(self.prompt_dir, f"{agent_name.replace(':', '@')}.json")
+
+    def load_local(self, agent_name: str, version: str = None):
+        """Load a prompt from its local copy
+
+        Args:
+            agent_name (str): hub prompt name (e.g., someen/unsmile)
+            version (str): stored version to load, defaults to the latest one
+
+        Returns:
+            the prompt template, or None if there is no local copy
+        """
+        path = self.local_path(agent_name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as file:
+            record = json.load(file)
+        version = version or record['latest']
+        return load(record['versions'][version]['prompt'])
+
+    def save_local(self, agent_name: str, prompt) -> str:
+        """Store a prompt as a new version of its local copy
+
+        Args:
+            agent_name (str): hub prompt name (e.g., someen/unsmile)
+            prompt: the prompt template pulled from the hub
+
+        Returns:
+            str: the version (content hash) of the stored prompt
+        """
+        serialized = dumpd(prompt)
+        version = hashlib.sha256(json.dumps(serialized, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+        path = self.local_path(agent_name)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                record = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            record = {'name': agent_name, 'latest': None, 'versions': {}}
+        if version not in record['versions']:
+            record['versions'][version] = {'pulled_at': datetime.now().isoformat(), 'prompt': serialized}
+        record['latest'] = version
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(record, file, indent=4, ensure_ascii=False)
+        return version
+
+    def get(self, agent_name: str):
+        """Return the prompt for an agent, pulling it from the hub at most once per process
+
+        Raises:
+            FileNotFoundError: offline mode is on and there is no local copy
+        """
+        with self.lock:
+            if agent_name not in self.prompts:
+                if self.offline:
+                    prompt = self.load_local(agent_name)
+                    if prompt is None:
+                        raise FileNotFoundError(f"No local copy of prompt {agent_name} in {self.prompt_dir} (offline mode)")
+                else:
+                    try:
+                        prompt = hub.pull(agent_name)
+                    except Exception as e:
+                        # Fall back to the last stored version when the hub is unreachable
+                        prompt = self.load_local(agent_name)
+                        if prompt is None:
+                            raise e
+                        print(f"Could not pull {agent_name} from the hub ({e}). Using the local copy.")
+                    else:
+                        self.save_local(agent_name, prompt)
+                self.prompts[agent_name] = prompt
+            return self.prompts[agent_name]
+
+# Registry shared by every RAG call in the process
+prompt_registry = PromptRegistry(offline=os.getenv("PREDICT_OFFLINE_PROMPTS", "").lower() in ("1", "true"))
+
+def configure_prompt_registry(prompt_dir: str = None, offline: bool = None):
+    """Change where prompts are stored and whether the hub may be contacted"""
+    with prompt_registry.lock:
+        if prompt_dir is not None:
+            prompt_registry.prompt_dir = prompt_dir
+        if offline is not None:
+            prompt_registry.offline = offline
+        prompt_registry.prompts.clear()
+    return prompt_registry
+
+def get_prompt(agent_name: str):
+    """Return the cached prompt for an agent"""
+    return prompt_registry.get(agent_name)
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import threading
+from .openai_utils import support_models
+from .executor import DeadlineExceeded
+
+class TokenBucket:
+    def __init__(self, per_minute: float) -> None:
+        """Token bucket refilled continuously at `per_minute` units per minute
+
+        Args:
+            per_minute (float): bucket capacity and refill amount per minute
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` units, going into debt if needed
+
+        Must be called with the limiter lock held.
+
+        Returns:
+            float: seconds the caller has to wait before its request is admitted
+        """
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # A single request larger than the bucket is admitted once the bucket is full
+        self.level -= min(amount, self.capacity)
+        return -self.level / self.rate if self.level < 0 else 0.0
+
+    def refund(self, amount: float):
+        """Give back units taken by reserve but not used
+
+        Must be called with the limiter lock held.
+        """
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+class RateLimiter:
+    def __init__(self, limits: dict) -> None:
+        """Requests-per-minute and tokens-per-minute scheduler shared by every agent
+
+        Each API key has its own buckets, so the limits of several keys add up.
+
+        Args:
+            limits (dict): {model_name: {"rpm": int, "tpm": int}}
+        """
+        self.lock = threading.Lock()
+        self.limits = limits
+        self.buckets = {}
+        self.waited = 0.0
+
+    def acquire(self, model_name: str, num_tokens: int, api_key: str = None, deadline: float = None):
+        """Block until a request of `num_tokens` tokens fits in the model's quota
+
+        Args:
+            model_name (str): model the request is sent to
+            num_tokens (int): estimated tokens the request counts against the TPM limit
+            api_key (str): key the request is sent with
+            deadline (float): time.monotonic() value the request must be admitted by
+
+        Raises:
+            DeadlineExceeded: the request would only be admitted after `deadline`; its quota is given back
+        """
+        limit = self.limits.get(model_name, {})
+        if not limit.get("rpm") or not limit.get("tpm"):
+            return
+        with self.lock:
+            if (model_name, api_key) not in self.buckets:
+                self.buckets[(model_name, api_key)] = (TokenBucket(limit["rpm"]), TokenBucket(limit["tpm"]))
+            requests, tokens = self.buckets[(model_name, api_key)]
+            wait = max(requests.reserve(1), tokens.reserve(num_tokens))
+            if deadline is not None and time.monotonic() + wait >= deadline:
+                requests.refund(1)
+                tokens.refund(num_tokens)
+                raise DeadlineExceeded(f"Rate limit quota for {model_name} only available after the deadline")
+            self.waited += wait
+        if wait > 0:
+            time.sleep(wait)
+
+    def refund(self, model_name: str, num_tokens: int, api_key: str = None):
+        """Credit back tokens reserved by acquire but not used by the request
+
+        acquire has to reserve the largest possible completion; once the API
+        reports the real usage, the difference returns to the bucket.
+        """
+        if num_tokens <= 0:
+            return
+        with self.lock:
+            buckets = self.buckets.get((model_name, api_key))
+            if buckets is not None:
+                buckets[1].refund(num_tokens)
+
+# Scheduler shared by the PRE agents, the debaters and the judge
+rate_limiter = RateLimiter(support_models)
+
+def configure_rate_limit(model_name: str, rpm: int, tpm: int):
+    """Override the rate limits of one model for this process"""
+    with rate_limiter.lock:
+        support_models.setdefault(model_name, {}).update({'rpm': rpm, 'tpm': tpm})
+        for key in [key for key in rate_limiter.buckets if key[0] == model_name]:
+            del rate_limiter.buckets[key]
+
+# Limits of another usage tier without editing support_models,
+# e.g. PREDICT_RATE_LIMITS='{"gpt-3.5-turbo-0125": {"rpm": 10000, "tpm": 2000000}}'
+for model_name, limit in json.loads(os.getenv("PREDICT_RATE_LIMITS") or "{}").items():
+    configure_rate_limit(model_name, limit["rpm"], limit["tpm"])
+
+def acquire(model_name: str, num_tokens: int, api_key: str = None, deadline: float = None):
+    """Wait for quota on the shared scheduler"""
+    rate_limiter.acquire(model_name, num_tokens, api_key, deadline)
+
+def refund(model_name: str, num_tokens: int, api_key: str = None):
+    """Give unused reserved tokens back to the shared scheduler"""
+    rate_limiter.refund(model_name, num_tokens, api_key)
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+import pandas as pd
+from .telemetry import span
+
+# Fields of a result that come from its row rather than from the prompt configuration
+ROW_FIELDS = ('text', 'ground_truth', 'Hate_Reason', 'Not_Hate_Reason')
+# Scalar fields loaded by ResultStore.to_dataframe by default
+DATAFRAME_COLUMNS = ['id', 'Label', 'Reason', 'success', 'triaged', 'rounds', 'stop_reason', 'text', 'ground_truth']
+
+def config_id(config: dict) -> str:
+    """Content address of a prompt configuration"""
+    payload = json.dumps(config, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:12]
+
+class ResultStore:
+    def __init__(self, directory: str, shard_rows: int = 10000) -> None:
+        """Sharded JSONL store of the DICT results of one output directory
+
+        Layout:
+          configs/<config id>.json   each debate prompt configuration, stored once
+          results-00000.jsonl ...    one line per result, without the prompts of its configuration
+          index.jsonl                [id, shard, offset, length, success, triaged] per result line
+
+        Results are only appended. Writing an id again (a rerun or a re-judgment)
+        appends a new version, and the index points at the latest one. A run that
+        was killed mid-write is repaired the next time the store is opened.
+        Only one process may write to a directory at a time.
+
+        Args:
+            directory (str): output directory (e.g., output/Dataset_A/DICT)
+            shard_rows (int): result lines per shard before a new shard is started
+        """
+        self.directory = directory
+        self.shard_rows = shard_rows
+        self.index_path = os.path.join(directory, "index.jsonl")
+        self.lock = threading.Lock()
+        # id -> (shard, offset, length, success, triaged)
+        self.index = {}
+        self.shard_counts = {}
+        self.configs = {}
+        os.makedirs(os.path.join(directory, "configs"), exist_ok=True)
+
+        self.load_index()
+        self.repair()
+        self.shard = max(self.shard_counts, default=0)
+        self.shard_file = open(self.shard_path(self.shard), 'ab')
+        self.index_file = open(self.index_path, 'ab')
+        self.import_files()
+
+    def shard_path(self, shard: int) -> str:
+        return os.path.join(self.directory, f"results-{shard:05d}.jsonl")
+
+    def shards(self) -> "list[int]":
+        shards = []
+        for file_name in os.listdir(self.directory):
+            if file_name.startswith("results-") and file_name.endswith(".jsonl"):
+                shards.append(int(file_name[len("results-"):-len(".jsonl")]))
+        return sorted(shards)
+
+    def load_index(self):
+        try:
+            with open(self.index_path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):
+            # A partial last entry from a killed run
+            with open(self.index_path, 'r+b') as file:
+                file.truncate(complete)
+        for line in data[:complete].splitlines():
+            id, shard, offset, length, success, triaged = json.loads(line)
+            self.index[id] = (shard, offset, length, success, triaged)
+            self.shard_counts[shard] = self.shard_counts.get(shard, 0) + 1
+
+    def repair(self):
+        """Index the result lines written after the last index entry and drop a partial last line"""
+        ends = {}
+        for shard, offset, length, _, _ in self.index.values():
+            ends[shard] = max(ends.get(shard, 0), offset + length)
+        entries = []
+        for shard in self.shards():
+            path = self.shard_path(shard)
+            size = os.path.getsize(path)
+            offset = ends.get(shard, 0)
+            if size <= offset:
+                continue
+            with open(path, 'rb') as file:
+                file.seek(offset)
+                tail = file.read()
+            complete = tail.rfind(b'\n') + 1
+            for line in tail[:complete].splitlines(keepends=True):
+                record = json.loads(line)
+                entries.append(self.index_entry(record, shard, offset, len(line)))
+                offset += len(line)
+            if complete < len(tail):
+                with open(path, 'r+b') as file:
+                    file.truncate(offset)
+        if entries:
+            with open(self.index_path, 'ab') as file:
+                for entry in entries:
+                    file.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+            for id, shard, offset, length, success, triaged in entries:
+                self.index[id] = (shard, offset, length, success, triaged)
+                self.shard_counts[shard] = self.shard_counts.get(shard, 0) + 1
+
+    def import_files(self):
+        """Move the results of the former one-file-per-row layout ({id}.json) into an empty store
+
+        The files themselves are left in place.
+        """
+        if self.index:
+            return
+        file_names = [name for name in os.listdir(self.directory)
+                      if name.endswith('.json') and not name.endswith('-config.json')]
+        imported = 0
+        for file_name in sorted(file_names):
+            try:
+                with open(os.path.join(self.directory, file_name), 'r', encoding='utf-8') as file:
+                    save_file = json.load(file)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(save_file, dict) and 'success' in save_file:
+                self.write(file_name[:-len('.json')], save_file)
+                imported += 1
+        if imported:
+            print(f"Imported {imported} results of {self.directory} into the result store")
+
+    @staticmethod
+    def index_entry(record: dict, shard: int, offset: int, length: int) -> list:
+        return [record['id'], shard, offset, length, record.get('success') is True, bool(record.get('triaged'))]
+
+    def put_config(self, config: dict) -> str:
+        """Store a prompt configuration once and return its id"""
+        key = config_id(config)
+        with self.lock:
+            if key not in self.configs:
+                path = os.path.join(self.directory, "configs", f"{key}.json")
+                if not os.path.exists(path):
+                    with open(path, 'w', encoding='utf-8') as file:
+                        json.dump(config, file, ensure_ascii=False, indent=4)
+                self.configs[key] = config
+        return key
+
+    def get_config(self, key: str) -> dict:
+        with self.lock:
+            if key not in self.configs:
+                with open(os.path.join(self.directory, "configs", f"{key}.json"), 'r', encoding='utf-8') as file:
+                    self.configs[key] = json.load(file)
+            return self.configs[key]
+
+    def write(self, id, save_file: dict, config: dict = None):
+        """Append the result of one row
+
+        The prompts of `config` are stored once under configs/ and left out of the
+        result line, which keeps only the fields of the row.
+
+        Args:
+            id (int/str): row id
+            save_file (dict): debate result (Label, Reason, success, players, ...)
+            config (dict, optional): prompt configuration the debate was run with
+        """
+        if config is not None:
+            fields = {key: value for key, value in save_file.items() if key not in config or key in ROW_FIELDS}
+            record = {**fields, 'id': str(id), 'config': self.put_config(config)}
+        else:
+            record = {**save_file, 'id': str(id)}
+        line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+        with self.lock:
+            if self.shard_counts.get(self.shard, 0) >= self.shard_rows:
+                self.shard_file.close()
+                self.shard += 1
+                self.shard_file = open(self.shard_path(self.shard), 'ab')
+            with span("write", file=self.shard_path(self.shard)):
+                offset = self.shard_file.tell()
+                self.shard_file.write(line)
+                self.shard_file.flush()
+                entry = self.index_entry(record, self.shard, offset, len(line))
+                self.index_file.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+                self.index_file.flush()
+            self.index[record['id']] = tuple(entry[1:])
+            self.shard_counts[self.shard] = self.shard_counts.get(self.shard, 0) + 1
+
+    def __contains__(self, id) -> bool:
+        return str(id) in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def ids(self) -> "list[str]":
+        with self.lock:
+            return list(self.index)
+
+    def entries(self) -> "list[tuple]":
+        """(id, success, triaged) of every row, read from the index without opening the shards"""
+        with self.lock:
+            return [(id, entry[3], entry[4]) for id, entry in self.index.items()]
+
+    def finished(self, id) -> bool:
+        """Whether a row already has a successful result"""
+        entry = self.index.get(str(id))
+        return entry is not None and entry[3]
+
+    def get(self, id, with_config: bool = False) -> dict:
+        """Latest result of one row, or None
+
+        Args:
+            id (int/str): row id
+            with_config (bool): add the prompts of the configuration the result was written with
+                (their placeholders are not filled in)
+        """
+        entry = self.index.get(str(id))
+        if entry is None:
+            return None
+        shard, offset, length = entry[:3]
+        with open(self.shard_path(shard), 'rb') as file:
+            file.seek(offset)
+            record = json.loads(file.read(length))
+        if with_config and 'config' in record:
+            record = {**self.get_config(record['config']), **record}
+        return record
+
+    def scan(self):
+        """Yield the latest result of every row, reading the shards in order"""
+        with self.lock:
+            # Lines of the latest versions; the versions replaced by a later write are skipped unparsed
+            latest = {entry[:2] for entry in self.index.values()}
+        for shard in self.shards():
+            offset = 0
+            with open(self.shard_path(shard), 'rb') as file:
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break
+                    if (shard, offset) in latest:
+                        yield json.loads(line)
+                    offset += len(line)
+
+    def to_dataframe(self, columns: "list[str]" = None):
+        """Load the given scalar fields of every result into a DataFrame indexed by id"""
+        columns = columns or DATAFRAME_COLUMNS
+        frame = pd.DataFrame([[record.get(column) for column in columns] for record in self.scan()], columns=columns)
+        return frame.set_index('id') if 'id' in columns else frame
+
+    def close(self):
+        with self.lock:
+            self.shard_file.close()
+            self.index_file.close()
+
+# Result stores by output directory, shared by the threads of a run
+result_stores = {}
+result_stores_lock = threading.Lock()
+
+def get_result_store(directory: str) -> ResultStore:
+    """Return the result store of an output directory, opening it once"""
+    key = os.path.abspath(directory)
+    with result_stores_lock:
+        if key not in result_stores:
+            result_stores[key] = ResultStore(directory)
+        return result_stores[key]
+
+def load_results(directory: str, columns: "list[str]" = None):
+    """Results of a DICT output directory as a DataFrame (see ResultStore.to_dataframe)"""
+    return get_result_store(directory).to_dataframe(columns)
+
+if __name__ == "__main__":
+    # python -m src.utils.result_store output/Dataset_A/DICT [id ...]
+    store = get_result_store(sys.argv[1])
+    if len(sys.argv) > 2:
+        for id in sys.argv[2:]:
+            print(json.dumps(store.get(id), ensure_ascii=False, indent=4))
+    else:
+        frame = store.to_dataframe()
+        print(f"{len(frame)} results in {store.directory}: {int(frame['success'].eq(True).sum())} succeeded, "
+              f"{int(frame['triaged'].eq(True).sum())} triaged")
+        print(frame['Label'].value_counts(dropna=False).to_string())
@@ -1,81 +1,242 @@
 from langchain_community.vectorstores import FAISS
-from langchain import hub
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import JsonOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda
+from langchain_community.adapters.openai import convert_message_to_dict
+from .prompt_registry import get_prompt
+from .llm_cache import get_response_cache, valid_response
+from .openai_utils import num_tokens_from_string, support_models, classify_key_error
+from .rate_limiter import acquire, refund
+from .executor import time_left
+from .key_pool import get_key_pool
+from .embeddings import get_embeddings, embedding_model_id
+from .telemetry import span
+from .tracing import trace_callbacks
+from openai import RateLimitError, APIStatusError
+import faiss
+import os
+import json
+import time
+import pickle
 import threading
 
 # 전역 변수로 FAISS 벡터스토어 인스턴스 초기화
 vectorstore_instance = None
-
-# model_name = 'jhgan/ko-sroberta-multitask'
-
-def init_vectorstore(dataset_name):
+# 데이터베이스 이름별로 한 번만 로드한 벡터스토어
+vectorstore_instances = {}
+
+# 타임아웃 시간 (초)
+TIMEOUT_SECONDS = 30
+
+# 인덱스를 RAM에 읽는 대신 메모리 맵으로 열지 여부 (여러 프로세스가 한 인덱스를 공유)
+MMAP_INDEX = os.getenv("PREDICT_MMAP_INDEX", "").lower() in ("1", "true", "yes")
+
+def index_path(dataset_name):
+    """Directory of the FAISS index of a database (index.faiss + index.pkl)"""
+    return f"./faiss/{dataset_name}_faiss_index_constitution"
+
+def check_embedding_model(folder_path):
+    """Refuse an index built with another embedding model than the configured one"""
+    info_path = os.path.join(folder_path, "embedding.json")
+    if not os.path.exists(info_path):
+        return
+    with open(info_path, "r", encoding="utf-8") as file:
+        built_with = json.load(file)["model"]
+    if built_with != embedding_model_id():
+        raise ValueError(f"{folder_path} was built with {built_with} embeddings, but {embedding_model_id()} is configured. "
+                         "Choose the same embedding backend and model as build_faiss_index.py.")
+
+def configure_vectorstore(mmap=None):
+    """Choose how init_vectorstore opens the indexes of this process"""
+    global MMAP_INDEX
+    if mmap is not None:
+        MMAP_INDEX = mmap
+
+def load_mmap_index(folder_path, embeddings):
+    """Open a saved FAISS store with its index memory-mapped
+
+    The vectors stay in the page cache, so worker processes on one node share
+    them instead of each holding a copy. IO_FLAG_MMAP_IFC maps the arrays of
+    every index type (flat, HNSW, IVF); IO_FLAG_MMAP alone only maps the IVF
+    inverted lists and reads flat and HNSW indexes fully into RAM.
+    """
+    index = faiss.read_index(os.path.join(folder_path, "index.faiss"), faiss.IO_FLAG_MMAP_IFC)
+    with open(os.path.join(folder_path, "index.pkl"), "rb") as file:
+        docstore, index_to_docstore_id = pickle.load(file)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+def init_vectorstore(dataset_name, mmap=None):
     global vectorstore_instance
-    vectorstore_instance = FAISS.load_local(f"./faiss/{dataset_name}_faiss_index_constitution", OpenAIEmbeddings())
+    if dataset_name not in vectorstore_instances:
+        mmap = MMAP_INDEX if mmap is None else mmap
+        check_embedding_model(index_path(dataset_name))
+        load = load_mmap_index if mmap else FAISS.load_local
+        vectorstore_instances[dataset_name] = load(index_path(dataset_name), get_embeddings())
+    vectorstore_instance = vectorstore_instances[dataset_name]
+    return vectorstore_instance
+
+def retrieve_documents(sentence, dataset_name=None):
+    """Run the retrieval step of RAG once so its documents can be shared by several agents"""
+    vectorstore = vectorstore_instances.get(dataset_name) if dataset_name else vectorstore_instance
+    if vectorstore is None:
+        raise Exception("Vectorstore not initialized. Call init_vectorstore() first.")
+    with span("rag.retrieve", database=dataset_name):
+        return vectorstore.as_retriever().invoke(sentence)
 
 def format_docs(docs):
     return "\n\n".join(doc.page_content for doc in docs)
 
 
-def rag_chain_invoke(sentence, retriever, prompt, llm):
-    rag_chain = (
-        {"context": retriever | format_docs, "text": RunnablePassthrough()}
-        | prompt
-        | llm
-        | JsonOutputParser()
-    )
-    response = rag_chain.invoke(sentence)
-    return response
-
-
-
-def rag_chain_invoke_with_timeout(sentence, retriever, prompt, llm, timeout):
-    result = [None]
-    exception = [None]
-
-    def target():
+# 기본 LLM 모델
+DEFAULT_MODEL_NAME = "gpt-3.5-turbo-0125"
+
+# (agent, database, model)별로 한 번만 만드는 LLM과 체인
+llm_instances = {}
+rag_chains = {}
+chain_lock = threading.Lock()
+
+def get_llm(model_name=DEFAULT_MODEL_NAME, api_key=None):
+    with chain_lock:
+        if (model_name, api_key) not in llm_instances:
+            # Retries are owned by the caller's DeadlineExecutor, not the OpenAI client
+            llm_instances[(model_name, api_key)] = ChatOpenAI(model_name=model_name, temperature=0, max_retries=0, openai_api_key=api_key)
+        return llm_instances[(model_name, api_key)]
+
+def invoke_llm(model_name, prompt_value, deadline=None, callbacks=None, validate=None):
+    """Run the LLM step of the RAG chain through the shared response cache
+
+    `deadline` (time.monotonic()) bounds the wait for quota and the OpenAI
+    request itself, so an attempt that runs out of time is aborted rather than
+    left running in the background.
+    `callbacks` (those of the chain run) nest the LLM run in its trace.
+    `validate` is the parser of the next step: a response it rejects is not
+    cached, so the caller's retry sends a new request.
+    """
+    with span("rag.llm", model=model_name) as fields:
+        cache = get_response_cache()
+        if cache is None:
+            return complete(model_name, prompt_value, deadline, fields, callbacks)
+        messages = [convert_message_to_dict(message) for message in prompt_value.to_messages()]
+        cache_key = cache.make_key(model_name, messages, {"temperature": 0})
+        response = cache.get(cache_key)
+        if response is not None and not valid_response(response, validate):
+            # Cached before responses were validated
+            cache.delete(cache_key)
+            response = None
+        if response is None:
+            response = complete(model_name, prompt_value, deadline, fields, callbacks)
+            if valid_response(response, validate):
+                cache.put(cache_key, model_name, response)
+        else:
+            fields["cached"] = True
+        return response
+
+def complete(model_name, prompt_value, deadline=None, fields=None, callbacks=None):
+    """Send the request with a key from the shared pool once the rate limiter admits it
+
+    A key that runs out of quota or is terminated is retired and the request
+    is retried on a healthy key. The time left until `deadline` is checked
+    before each key and after each wait, and only that time is given to the
+    request, so nothing is sent once the attempt has been abandoned. The token
+    usage reported by the API is added to `fields` (the telemetry span of the
+    call) when given.
+
+    Raises:
+        DeadlineExceeded: the deadline passed before the request could be sent
+    """
+    fields = {} if fields is None else fields
+    completion_tokens = support_models.get(model_name, {}).get('completion_tokens', 0)
+    num_tokens = num_tokens_from_string(prompt_value.to_string(), model_name) + completion_tokens
+    key_pool = get_key_pool()
+    while True:
+        time_left(deadline)
+        waited = time.perf_counter()
+        key = key_pool.acquire()
         try:
-            result[0] = rag_chain_invoke(sentence, retriever, prompt, llm)
+            acquire(model_name, num_tokens, key, deadline)
+            timeout = time_left(deadline)
         except Exception as e:
-            exception[0] = e
+            key_pool.release(key)
+            raise e
+        fields["wait"] = fields.get("wait", 0) + time.perf_counter() - waited
+        try:
+            # generate_prompt rather than invoke: llm_output carries the token usage on every langchain version
+            result = get_llm(model_name, key).generate_prompt([prompt_value], callbacks=callbacks, timeout=timeout)
+        except (RateLimitError, APIStatusError) as e:
+            key_error = classify_key_error(e, key)
+            if key_error is None:
+                key_pool.release(key, error=e)
+                raise e
+            key_pool.retire(key, key_error)
+            # Nothing was used: credit the whole reservation back before the next key
+            refund(model_name, num_tokens, key)
+            fields["key_retries"] = fields.get("key_retries", 0) + 1
+            continue
+        except Exception as e:
+            key_pool.release(key, error=e)
+            raise e
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        used = usage.get("total_tokens", num_tokens) if usage else num_tokens
+        key_pool.release(key, tokens=used)
+        # The reservation assumed a full-length completion
+        refund(model_name, num_tokens - used, key)
+        if usage:
+            fields.update(prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0))
+        return result.generations[0][0].text
+
+def get_rag_chain(agent_name, database_name=None, model_name=DEFAULT_MODEL_NAME):
+    """
+    Return the compiled RAG chain for an (agent, database, model) triple, building it once
+
+    The chain takes {"text": sentence, "docs": documents, a formatted context or None}.
+    When no documents are given it searches the database itself. The deadline of
+    the request (time.monotonic()) is read from config["configurable"]["deadline"].
+    """
+    key = (agent_name, database_name, model_name)
+    if key not in rag_chains:
+        prompt = get_prompt(agent_name)
+
+        def context(inputs):
+            docs = inputs.get("docs")
+            if docs is None:
+                docs = retrieve_documents(inputs["text"], database_name)
+            # A precomputed context (see src.utils.neighbors) is already formatted
+            return docs if isinstance(docs, str) else format_docs(docs)
+
+        parser = JsonOutputParser()
+
+        def generate(prompt_value, config):
+            return invoke_llm(model_name, prompt_value, deadline=config.get("configurable", {}).get("deadline"),
+                              callbacks=config.get("callbacks"), validate=parser.parse)
+
+        chain = (
+            {"context": RunnableLambda(context), "text": RunnableLambda(lambda inputs: inputs["text"])}
+            | prompt
+            | RunnableLambda(generate)
+            | parser
+        )
+        with chain_lock:
+            rag_chains.setdefault(key, chain)
+    return rag_chains[key]
+
+def rag_chain_invoke(sentence, chain, docs=None, timeout=TIMEOUT_SECONDS):
+    # The timeout covers the whole chain, retrieval included; sampled rows carry the trace handler
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    response = chain.invoke({"text": sentence, "docs": docs},
+                            config={"configurable": {"deadline": deadline}, "callbacks": trace_callbacks()})
+    return response
 
-    thread = threading.Thread(target=target)
-    thread.start()
-    thread.join(timeout)
-    if thread.is_alive():
-        raise TimeoutError("Operation timed out")
-    if exception[0]:
-        raise exception[0]
-    return result[0]
 
+def RAG(sentence, agent_name, docs=None, database_name=None, model_name=DEFAULT_MODEL_NAME, timeout=TIMEOUT_SECONDS):
+    """
+    Run one RAG attempt for a sentence
 
-def RAG(sentence, agent_name):
-    global vectorstore_instance
-    if vectorstore_instance is None:
+    Errors and timeouts are raised to the caller, which owns the retry budget
+    (see src.utils.executor.DeadlineExecutor).
+    """
+    if docs is None and vectorstore_instances.get(database_name, vectorstore_instance) is None:
         raise Exception("Vectorstore not initialized. Call init_vectorstore() first.")
-    
-    # Step 4: Search
-    retriever = vectorstore_instance.as_retriever()
-    
-    # Step 5: Create Prompt
-    prompt = hub.pull(agent_name)
-    
-    # Create LLM
-    llm = ChatOpenAI(model_name="gpt-3.5-turbo-0125", temperature=0)
-    
-    # 타임아웃 시간 (초)
-    TIMEOUT_SECONDS = 30
-
-    while True:
-        try:
-            response = rag_chain_invoke_with_timeout(sentence, retriever, prompt, llm, TIMEOUT_SECONDS)
-            return response
-        except TimeoutError:
-            print("Operation timed out. Retrying...")
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            break
-
 
+    # Step 4-5: Search, Create Prompt and LLM (built once per agent, database and model)
+    chain = get_rag_chain(agent_name, database_name, model_name)
+    return rag_chain_invoke(sentence, chain, docs, timeout)
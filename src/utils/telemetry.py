@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+from .openai_utils import support_models
+
+# Labels (row id, agent, ...) attached to every event recorded in the current context.
+# DeadlineExecutor copies the context into its worker threads, so a label set by
+# process_row or run_debate reaches the calls made on its behalf.
+current_labels = contextvars.ContextVar("telemetry_labels", default={})
+
+def estimate_cost(model_name: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """USD cost of one call from the prices in support_models (0 for unknown models)"""
+    prices = support_models.get(model_name, {})
+    return (prompt_tokens * prices.get('prompt_price', 0) + completion_tokens * prices.get('completion_price', 0)) / 1e6
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    rank = max(int(-(-q * len(values) // 100)), 1)
+    return values[min(rank, len(values)) - 1]
+
+class TelemetrySummary:
+    def __init__(self) -> None:
+        """Aggregates of telemetry events per stage, per agent and per row"""
+        self.stages = defaultdict(lambda: {"latencies": array('d'), "errors": 0, "cached": 0, "wait": 0.0,
+                                           "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+        self.agents = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+        self.rows = set()
+
+    def add(self, event: dict):
+        stage = self.stages[event["stage"]]
+        stage["latencies"].append(event["latency"])
+        stage["errors"] += event.get("error") is not None
+        stage["cached"] += bool(event.get("cached"))
+        stage["wait"] += event.get("wait", 0.0)
+        prompt_tokens, completion_tokens = event.get("prompt_tokens", 0), event.get("completion_tokens", 0)
+        stage["prompt_tokens"] += prompt_tokens
+        stage["completion_tokens"] += completion_tokens
+        stage["cost"] += event.get("cost", 0.0)
+        if "model" in event and "agent" in event:
+            agent = self.agents[event["agent"]]
+            agent["calls"] += 1
+            agent["prompt_tokens"] += prompt_tokens
+            agent["completion_tokens"] += completion_tokens
+            agent["cost"] += event.get("cost", 0.0)
+        if "row" in event:
+            self.rows.add(event["row"])
+
+    def report(self) -> str:
+        """Latency percentiles, tokens and cost per stage, then tokens and cost per agent
+
+        "wait s" is the time spent waiting for a key and for rate-limit quota,
+        included in the latency of the LLM stages.
+        """
+        lines = [f"{'stage':<14}{'count':>9}{'errors':>8}{'cached':>8}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'total s':>10}{'wait s':>9}"
+                 f"{'prompt tok':>12}{'compl. tok':>12}{'cost $':>10}"]
+        total_cost = 0.0
+        for name, stage in sorted(self.stages.items()):
+            latencies = sorted(stage["latencies"])
+            lines.append(f"{name:<14}{len(latencies):>9}{stage['errors']:>8}{stage['cached']:>8}"
+                         f"{percentile(latencies, 50):>9.3f}{percentile(latencies, 95):>9.3f}{percentile(latencies, 99):>9.3f}"
+                         f"{sum(latencies):>10.1f}{stage['wait']:>9.1f}{stage['prompt_tokens']:>12}{stage['completion_tokens']:>12}{stage['cost']:>10.4f}")
+            total_cost += stage["cost"]
+        for name, agent in sorted(self.agents.items()):
+            lines.append(f"  {name}: {agent['calls']} calls, {agent['prompt_tokens']} prompt + "
+                         f"{agent['completion_tokens']} completion tokens, ${agent['cost']:.4f}")
+        if self.rows:
+            lines.append(f"Total ${total_cost:.4f} for {len(self.rows)} rows (${total_cost / len(self.rows):.6f} per row)")
+        return "\n".join(lines)
+
+class Telemetry:
+    def __init__(self, path: str = None) -> None:
+        """Structured record of the timed stages of a run
+
+        Every event is appended to a JSONL file (when `path` is given) and folded
+        into a TelemetrySummary for the end-of-run report.
+
+        Args:
+            path (str): JSONL file receiving one event per line (None keeps the summary only)
+        """
+        self.path = path
+        self.summary = TelemetrySummary()
+        self.lock = threading.Lock()
+        self.file = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.file = open(path, 'a', encoding='utf-8')
+
+    def record(self, stage: str, latency: float, error: BaseException = None, **fields):
+        event = {"ts": round(time.time(), 3), "stage": stage, "latency": round(latency, 6), **current_labels.get(),
+                 **{name: round(value, 6) if isinstance(value, float) else value for name, value in fields.items()}}
+        if error is not None:
+            event["error"] = type(error).__name__
+        if "model" in event and ("prompt_tokens" in event or "completion_tokens" in event):
+            event["cost"] = estimate_cost(event["model"], event.get("prompt_tokens", 0), event.get("completion_tokens", 0))
+        with self.lock:
+            self.summary.add(event)
+            if self.file is not None:
+                self.file.write(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+                # Flushed per event, so a crashed run keeps everything up to the crash
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class Span:
+    __slots__ = ("stage", "fields", "start")
+
+    def __init__(self, stage: str, fields: dict) -> None:
+        """Times a block and records it as one event; the block may add fields (tokens, cached, an error it handled, ...)"""
+        self.stage = stage
+        self.fields = fields
+
+    def __enter__(self) -> dict:
+        self.start = time.perf_counter()
+        return self.fields
+
+    def __exit__(self, exc_type, exc, tb):
+        if telemetry is not None:
+            fields = dict(self.fields)
+            error = exc if exc is not None else fields.pop("error", None)
+            telemetry.record(self.stage, time.perf_counter() - self.start, error=error, **fields)
+        return False
+
+# Telemetry of this process (None disables it, so spans only cost a clock read)
+telemetry = Telemetry(os.getenv("PREDICT_TELEMETRY")) if os.getenv("PREDICT_TELEMETRY") else None
+
+def configure_telemetry(path: str = None, enabled: bool = True):
+    """Enable telemetry for this process, writing events to `path` if given"""
+    global telemetry
+    if telemetry is not None:
+        telemetry.close()
+    telemetry = Telemetry(path) if (enabled or path) else None
+    return telemetry
+
+def get_telemetry():
+    return telemetry
+
+def span(stage: str, **fields) -> Span:
+    """Time a stage: `with span("rag.llm", model=...) as fields: ...`"""
+    return Span(stage, fields)
+
+@contextmanager
+def labelled(**labels):
+    """Attach labels (row, agent, ...) to the events recorded inside the block"""
+    token = current_labels.set({**current_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        current_labels.reset(token)
+
+def print_telemetry_stats():
+    if telemetry is not None:
+        print(telemetry.summary.report())
+        if telemetry.path:
+            print(f"Telemetry events: {telemetry.path}")
+
+def load_summary(path: str) -> TelemetrySummary:
+    """Summarize a JSONL event file, e.g. one written by several processes"""
+    summary = TelemetrySummary()
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                summary.add(json.loads(line))
+            except json.JSONDecodeError:
+                # A partial last line from a killed run
+                continue
+    return summary
+
+if __name__ == "__main__":
+    # python -m src.utils.telemetry output/telemetry.jsonl
+    for event_path in sys.argv[1:]:
+        print(f"== {event_path}")
+        print(load_summary(event_path).report())
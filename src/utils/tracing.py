@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+from .telemetry import current_labels
+
+# Sink name that sends the sampled RAG chain runs to LangSmith instead of a local file
+LANGSMITH = "langsmith"
+
+def to_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+def message_dicts(messages) -> "list[dict]":
+    """Chat messages (langchain messages or OpenAI dicts) as {"role", "content"} dicts"""
+    return [message if isinstance(message, dict) else {"role": message.type, "content": message.content} for message in messages]
+
+class JsonlTraceSink:
+    def __init__(self, path: str) -> None:
+        """Appends one JSON line per finished run"""
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, run: dict):
+        with self.lock:
+            self.file.write(to_json(run) + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class SqliteTraceSink:
+    def __init__(self, path: str) -> None:
+        """Stores one row per finished run; a whole trace is `SELECT * FROM runs WHERE trace_id = ? ORDER BY start`"""
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "run_id TEXT PRIMARY KEY, trace_id TEXT, parent_run_id TEXT, run_type TEXT, name TEXT, "
+            "start REAL, latency REAL, inputs TEXT, outputs TEXT, error TEXT, labels TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS runs_trace ON runs (trace_id)")
+        self.conn.commit()
+
+    def write(self, run: dict):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, trace_id, parent_run_id, run_type, name, start, latency, inputs, outputs, error, labels) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run["run_id"], run["trace_id"], run["parent_run_id"], run["run_type"], run["name"], run["start"], run["latency"],
+                 to_json(run["inputs"]), to_json(run["outputs"]), run["error"], to_json(run["labels"])),
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def open_sink(path: str):
+    """SQLite sink for .db / .sqlite files, JSONL otherwise"""
+    if path.lower().endswith((".db", ".sqlite", ".sqlite3")):
+        return SqliteTraceSink(path)
+    return JsonlTraceSink(path)
+
+class LocalTraceHandler(BaseCallbackHandler):
+    def __init__(self, tracer: "Tracer") -> None:
+        """Callback handler writing the chain and LLM runs of a RAG call to the local sink"""
+        self.tracer = tracer
+        self.lock = threading.Lock()
+        # Runs started but not finished yet: run_id -> (run_type, name, inputs, parent_run_id, start, perf_counter)
+        self.runs = {}
+
+    def _start(self, run_type, serialized, inputs, run_id, parent_run_id, kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or ((serialized or {}).get("id") or [run_type])[-1]
+        with self.lock:
+            self.runs[run_id] = (run_type, name, inputs, parent_run_id, time.time(), time.perf_counter())
+
+    def _end(self, run_id, outputs=None, error=None):
+        with self.lock:
+            started = self.runs.pop(run_id, None)
+        if started is None:
+            return
+        run_type, name, inputs, parent_run_id, start, clock = started
+        self.tracer.write(run_type, name, inputs, outputs, time.perf_counter() - clock, error=error,
+                          run_id=str(run_id), parent_run_id=str(parent_run_id) if parent_run_id else None, start=start)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._start("chain", serialized, inputs, run_id, parent_run_id, kwargs)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id, outputs)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start("llm", serialized, {"messages": [message_dicts(batch) for batch in messages]}, run_id, parent_run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start("llm", serialized, {"prompts": prompts}, run_id, parent_run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id, {"generations": [[generation.text for generation in batch] for batch in response.generations],
+                           "llm_output": response.llm_output})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+class Tracer:
+    def __init__(self, sink: str, sample_rate: float = 1.0) -> None:
+        """Full traces of a sample of the rows, kept locally
+
+        A row is sampled from a hash of its id (the `row` telemetry label), so its
+        PRE calls and its debate are traced together, in every process of a run.
+        Calls made outside a labelled row are sampled at random.
+
+        Args:
+            sink (str): JSONL file, SQLite file (.db / .sqlite) or "langsmith"
+            sample_rate (float): fraction of the rows traced
+        """
+        self.sink_name = sink
+        self.sample_rate = sample_rate
+        self.sink = None if sink == LANGSMITH else open_sink(sink)
+        self.lock = threading.Lock()
+        self.written = 0
+        self.sampled_rows = set()
+        if self.sink is None:
+            from langchain_core.tracers import LangChainTracer
+            self.handler = LangChainTracer(project_name=os.getenv("LANGCHAIN_PROJECT", "PREDICT"))
+        else:
+            self.handler = LocalTraceHandler(self)
+
+    def sampled(self) -> bool:
+        """Whether the calls of the current row are traced"""
+        if self.sample_rate >= 1:
+            return True
+        if self.sample_rate <= 0:
+            return False
+        row = current_labels.get().get("row")
+        if row is None:
+            return random.random() < self.sample_rate
+        digest = hashlib.sha256(str(row).encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64 < self.sample_rate
+
+    def write(self, run_type: str, name: str, inputs, outputs, latency: float, error: BaseException = None,
+              run_id: str = None, parent_run_id: str = None, start: float = None):
+        if self.sink is None:
+            return
+        labels = current_labels.get()
+        run_id = run_id or str(uuid.uuid4())
+        run = {
+            "trace_id": str(labels["row"]) if "row" in labels else (parent_run_id or run_id),
+            "run_id": run_id,
+            "parent_run_id": parent_run_id,
+            "run_type": run_type,
+            "name": name,
+            "start": round(start if start is not None else time.time() - latency, 6),
+            "latency": round(latency, 6),
+            "inputs": inputs,
+            "outputs": outputs,
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "labels": labels,
+        }
+        self.sink.write(run)
+        with self.lock:
+            self.written += 1
+            if "row" in labels:
+                self.sampled_rows.add(str(labels["row"]))
+
+    def report(self) -> str:
+        if self.sink is None:
+            return f"Traces: sampled RAG runs sent to LangSmith ({self.sample_rate:.0%} of the rows)"
+        return f"Traces: {self.written} runs of {len(self.sampled_rows)} rows ({self.sample_rate:.0%} sampled) in {self.sink_name}"
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+
+# Tracer of this process (None disables tracing: no callbacks, nothing on the hot path)
+tracer = Tracer(os.getenv("PREDICT_TRACE"), float(os.getenv("PREDICT_TRACE_SAMPLE", "0.01"))) if os.getenv("PREDICT_TRACE") else None
+
+def configure_tracing(sink: str = None, sample_rate: float = None):
+    """Trace a sample of the rows to `sink` (JSONL, SQLite or "langsmith"); no sink disables tracing"""
+    global tracer
+    if tracer is not None:
+        tracer.close()
+    if sample_rate is None:
+        sample_rate = float(os.getenv("PREDICT_TRACE_SAMPLE", "0.01"))
+    tracer = Tracer(sink, sample_rate) if sink else None
+    return tracer
+
+def get_tracer():
+    return tracer
+
+def trace_callbacks():
+    """Callbacks for a langchain invoke: the trace handler for a sampled row, None otherwise"""
+    if tracer is None or not tracer.sampled():
+        return None
+    return [tracer.handler]
+
+@contextmanager
+def trace_run(run_type: str, name: str, **inputs):
+    """Trace a call made outside langchain: `with trace_run("llm", name, messages=...) as outputs: ...`"""
+    if tracer is None or tracer.sink is None or not tracer.sampled():
+        yield {}
+        return
+    outputs = {}
+    start, clock = time.time(), time.perf_counter()
+    try:
+        yield outputs
+    except BaseException as e:
+        tracer.write(run_type, name, inputs, outputs, time.perf_counter() - clock, error=e, start=start)
+        raise
+    tracer.write(run_type, name, inputs, outputs, time.perf_counter() - clock, start=start)
+
+def print_trace_stats():
+    if tracer is not None:
+        print(tracer.report())